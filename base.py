@@ -2,37 +2,46 @@ from __future__ import annotations
 from iterators import BIterator
 
 import logging
+import time
 
-from typing import Optional
-from geometry import RowCode
+from dataclasses import dataclass
+from typing import Callable, Container, Optional, Sequence
 
-from rich.logging import RichHandler
+import numpy as np
+
+from columnar import FeatureView, PartView, RaggedGeometry
+from geometry import RowCode, check_tolerance
+from stats import ParseStats, collecting
+from taxi import TAXI_ROUTE_ROWS, TaxiNetwork
 
 from classes import (
     AptMetadata,
+    Beacon,
     Boundary,
+    Frequency,
+    Helipad,
+    LightingObject,
     LinearFeature,
     Pavement,
     Runway,
     Sign,
     StartupLocation,
+    TowerLocation,
+    TrafficFlow,
+    WaterRunway,
     Windsock,
 )
 _DEFAULT_BEZIER_RESOLUTION = 16
 
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(message)s",
-    datefmt="[%X]",
-    handlers=[RichHandler(show_path=False, omit_repeated_times=False)],
-)
 logger = logging.getLogger("xplane_apt_convert")
-logger.setLevel(logging.INFO)
 
 
 _BASE_CRS = "EPSG:4326"
 
+# Bump whenever a change to the parser changes its output, so cached parses are invalidated.
+PARSER_VERSION = 7
+
 
 VALID_FEATURES = [
     "boundary",
@@ -44,6 +53,165 @@ VALID_FEATURES = [
     "linear_features",
 ]
 
+# families of records that are not exported as features, but can be requested with `features`
+RECORD_FAMILIES = [
+    "helipads",
+    "water_runways",
+    "lighting_objects",
+    "tower",
+    "beacons",
+    "frequencies",
+    "traffic_flows",
+    "taxi_network",
+]
+
+
+@dataclass(frozen=True)
+class _RecordFamily:
+    row_codes: tuple[int, ...]  # row codes starting one of its records
+    build: Callable  # (text, starts, parse options) -> value
+    single: bool  # one record per airport, None when missing, rather than a list
+
+
+# family name -> how to build it, in the order families are built
+_RECORD_FAMILIES: dict[str, _RecordFamily] = {}
+# row code -> index of its family in `_FAMILY_NAMES`, -1 for rows starting no record
+_FAMILY_TABLE = np.full(0, -1, dtype=np.int16)
+_FAMILY_NAMES: list[str] = []
+
+
+def register_record_family(name: str, row_codes: Sequence[int], build: Callable, single: bool = False) -> None:
+    """Make `ParsedAirport` parse the records starting with `row_codes` into its attribute `name`.
+
+    Args:
+        name (str): Attribute the records are stored in.
+        row_codes (list[int]): Row codes starting one record of the family. A row code
+            belongs to at most one family.
+        build (Callable): Called as `build(text, starts, parse_options)` with the rows of
+            the airport, the indices of the rows starting its records and the
+            (bezier_resolution, bezier_tolerance, lod_tolerances) of the parse. Returns
+            the attribute's value.
+        single (bool): The family holds at most one record, None when there is none.
+            Default False, a list.
+    """
+    global _FAMILY_TABLE
+
+    row_codes = tuple(int(code) for code in row_codes)
+    for other, family in _RECORD_FAMILIES.items():
+        taken = set(row_codes) & set(family.row_codes) if other != name else set()
+        if taken:
+            raise ValueError(f"Row codes {sorted(taken)} already belong to the record family {other}.")
+
+    _RECORD_FAMILIES[name] = _RecordFamily(row_codes, build, single)
+    _FAMILY_NAMES[:] = list(_RECORD_FAMILIES)
+
+    table = np.full(max(max(f.row_codes) for f in _RECORD_FAMILIES.values()) + 1, -1, dtype=np.int16)
+    for i, family in enumerate(_RECORD_FAMILIES.values()):
+        table[list(family.row_codes)] = i
+    _FAMILY_TABLE = table
+
+
+def _line_records(record_class, single: bool = False) -> Callable:
+    """Builder of a family of one-row records, made by `record_class.from_line`."""
+    def build(text, starts, parse_options):
+        from_line = record_class.from_line
+        records = [record for record in (from_line(text[i]) for i in starts) if record is not None]
+        if single:
+            return records[-1] if records else None
+        return records
+
+    return build
+
+
+def _chain_records(record_class, single: bool = False) -> Callable:
+    """Builder of a family of records made of a header row and its node chains."""
+    def build(text, starts, parse_options):
+        bezier_resolution, bezier_tolerance, lod_tolerances = parse_options
+        value = None if single else []
+
+        for i in starts:
+            row_iterator = BIterator(text, start=i + 1)
+            parsed = record_class.from_row_iterator(
+                text[i], row_iterator, bezier_resolution, bezier_tolerance, lod_tolerances)
+
+            if single:
+                if parsed is not None:
+                    value = parsed
+            elif isinstance(parsed, list):
+                value.extend(feature for feature in parsed if feature is not None)
+            elif parsed is not None:
+                value.append(parsed)
+
+        return value
+
+    return build
+
+
+def _following_rows(text, i: int, row_codes: Container[int]) -> list:
+    """The rows right after row `i` whose row code is one of `row_codes`."""
+    rows = []
+    for j in range(i + 1, len(text)):
+        row = text[j]
+        if row.row_code not in row_codes:
+            break
+        rows.append(row)
+    return rows
+
+
+def _build_startup_locations(text, starts, parse_options) -> list[StartupLocation]:
+    locations = []
+    for i in starts:
+        ext = _following_rows(text, i, (RowCode.START_LOCATION_EXT,))
+        locations.append(StartupLocation.from_line(text[i], ext[0] if ext else None))
+    return locations
+
+
+_FLOW_RULE_ROWS = frozenset((
+    RowCode.FLOW_WIND,
+    RowCode.FLOW_CEILING,
+    RowCode.FLOW_VISIBILITY,
+    RowCode.FLOW_TIME,
+    RowCode.FLOW_RUNWAY_RULE,
+    RowCode.FLOW_PATTERN,
+    RowCode.FLOW_RUNWAY_RULE_CHANNEL,
+))
+
+
+def _build_traffic_flows(text, starts, parse_options) -> list[TrafficFlow]:
+    return [TrafficFlow.from_rows(text[i], _following_rows(text, i, _FLOW_RULE_ROWS)) for i in starts]
+
+
+def _build_taxi_network(text, starts, parse_options) -> Optional[TaxiNetwork]:
+    rows = [text[i] for i in starts]
+    return TaxiNetwork.from_rows(rows) if rows else None
+
+
+register_record_family("boundary", (RowCode.BOUNDARY,), _chain_records(Boundary, single=True), single=True)
+register_record_family("runways", (RowCode.LAND_RUNWAY,), _line_records(Runway))
+register_record_family("startup_locations", (RowCode.START_LOCATION_NEW,), _build_startup_locations)
+register_record_family("windsocks", (RowCode.WINDSOCK,), _line_records(Windsock))
+register_record_family("signs", (RowCode.TAXI_SIGN,), _line_records(Sign))
+register_record_family("pavements", (RowCode.TAXIWAY,), _chain_records(Pavement))
+register_record_family("linear_features", (RowCode.FREE_CHAIN,), _chain_records(LinearFeature))
+register_record_family("helipads", (RowCode.HELIPAD,), _line_records(Helipad))
+register_record_family("water_runways", (RowCode.WATER_RUNWAY,), _line_records(WaterRunway))
+register_record_family("lighting_objects", (RowCode.PAPI_LIGHTS,), _line_records(LightingObject))
+register_record_family("tower", (RowCode.TOWER_LOCATION,), _line_records(TowerLocation, single=True), single=True)
+register_record_family("beacons", (RowCode.BEACON,), _line_records(Beacon))
+register_record_family(
+    "frequencies",
+    tuple(range(RowCode.FREQUENCY_AWOS, RowCode.FREQUENCY_UNICOM + 1))
+    + tuple(range(RowCode.CHANNEL_AWOS, RowCode.CHANNEL_UNICOM + 1)),
+    _line_records(Frequency),
+)
+register_record_family("traffic_flows", (RowCode.FLOW_DEFINITION,), _build_traffic_flows)
+register_record_family("taxi_network", TAXI_ROUTE_ROWS, _build_taxi_network, single=True)
+
+_HEADER_ROWS = (RowCode.AIRPORT_HEADER, RowCode.SEAPORT_HEADER, RowCode.HELIPORT_HEADER)
+
+# feature classes made of polygons, which `triangulate` applies to
+POLYGON_FEATURES = ("pavements", "boundary")
+
 
 class ParsedAirport:
     id: str
@@ -55,11 +223,27 @@ class ParsedAirport:
     windsocks: list[Windsock]
     linear_features: list[LinearFeature]
     pavements: list[Pavement]
+    helipads: list[Helipad]
+    water_runways: list[WaterRunway]
+    lighting_objects: list[LightingObject]
+    tower: Optional[TowerLocation]
+    beacons: list[Beacon]
+    frequencies: list[Frequency]
+    traffic_flows: list[TrafficFlow]
+    geometry: Optional[dict[str, RaggedGeometry]]
+    taxi_network: Optional[TaxiNetwork]
+    stats: ParseStats
 
     def __init__(
         self,
         airport: RowCode.Airport,
         bezier_resolution: int = _DEFAULT_BEZIER_RESOLUTION,
+        columnar: bool = False,
+        bezier_tolerance: Optional[float] = None,
+        lod_tolerances: Sequence[float] = (),
+        lazy: bool = False,
+        features: Optional[Sequence[str]] = None,
+        triangulate: bool = False,
     ) -> None:
         """A parsed X-Plane airport.
 
@@ -69,88 +253,252 @@ class ParsedAirport:
             bezier_resolution (int): Number of points to use to plot Bezier curves.
                 A higher number means more resolution but also larger file sizes on export.
                 Default 16.
+            columnar (bool): Pack the coordinates of pavements, linear features and the
+                boundary into one `columnar.RaggedGeometry` per feature class, exposed in
+                `geometry`. Each feature's `coordinates` then becomes a read-only lazy view
+                into it. Default False.
+            bezier_tolerance (float): If set, Bezier curves are subdivided adaptively until
+                they deviate at most this many metres from their tessellation, and
+                `bezier_resolution` is ignored. Default None.
+            lod_tolerances (list[float]): Additional adaptive tessellations to produce during
+                the same parse, one per tolerance in metres. Retrieve them with `lod_geometry`.
+                Default none.
+            lazy (bool): Only locate the record blocks of each feature class up front.
+                A class (`pavements`, `runways`, `taxi_network`...) is parsed and tessellated
+                on first access and then kept. `columnar` still packs its classes right away.
+                Default False.
+            features (list[str]): Only parse these feature classes of `VALID_FEATURES` and
+                record families of `RECORD_FAMILIES`. The rows of the others are skipped
+                and they stay empty. Default all.
+            triangulate (bool): Triangulate every pavement and the boundary as soon as
+                they are parsed, caching the triangles in their `triangles`. Otherwise
+                `Pavement.triangulate` and `triangulation` do it on demand. Ear clipping
+                runs in plain Python and easily outweighs the rest of the parse, so leave
+                this off for bulk runs. Default False.
+
+        Row counts, stage timings and vertex counts of the parse are collected in
+        `stats`, along with the memory peak when `tracemalloc` is tracing.
         """
+        if bezier_tolerance is not None:
+            check_tolerance(bezier_tolerance, "bezier_tolerance")
+        for tolerance in lod_tolerances:
+            check_tolerance(tolerance, "LOD tolerance")
+
+        if features is not None:
+            for name in features:
+                if name not in _RECORD_FAMILIES:
+                    raise ValueError(
+                        f"Invalid feature {name}. Valid features: {', '.join(VALID_FEATURES + RECORD_FAMILIES)}.")
+
         self._airport = airport
         self.id = None
         self.metadata = AptMetadata()
-        self.boundary = None
-        self.runways = []
-        self.startup_locations = []
-        self.signs = []
-        self.windsocks = []
-        self.linear_features = []
-        self.pavements = []
-
-        self._parse(bezier_resolution=bezier_resolution)
+        self.geometry = None
+        self.lod_tolerances = tuple(lod_tolerances)
+        self._parse_options = (bezier_resolution, bezier_tolerance, self.lod_tolerances)
+        self._triangulate = triangulate
+        self._spatial_index = None
+        self.stats = ParseStats()
 
-    def _parse(self, bezier_resolution: int) -> None:
         logger.info("Parsing airport.")
-        row_iterator = BIterator(self._airport.text)
-
-        for row in row_iterator:
-            row_code = row.row_code
-
-            if row_code == RowCode.AIRPORT_HEADER:
-                self.id = row.tokens[4]
-
-            if row_code == RowCode.METADATA:
-                self.metadata.add_from_row(row)
-
-            elif row_code == RowCode.BOUNDARY:
-                logger.debug("Parsing boundary row.")
+        with self.stats.memory():
+            with self.stats.stage("scan"):
+                self._scan(features)
+            self.stats.ident = self.id
+
+            if not lazy:
+                self._materialize_all()
+
+            if columnar:
+                with self.stats.stage("columnar"):
+                    self._pack_geometry()
+
+    def __getstate__(self) -> dict:
+        # the raw airport is only needed while parsing and may hold an open file mapping
+        self._materialize_all()
+        state = self.__dict__.copy()
+        state["_airport"] = None
+        state["_spatial_index"] = None
+        return state
+
+    def _pack_geometry(self) -> None:
+        self.geometry = {}
+
+        pavements = RaggedGeometry.from_parts(
+            [pavement.coordinates for pavement in self.pavements])
+        for j, pavement in enumerate(self.pavements):
+            pavement.coordinates = FeatureView(pavements, j)
+        self.geometry["pavements"] = pavements
+
+        linear_features = RaggedGeometry.from_parts(
+            [[line.coordinates] for line in self.linear_features])
+        for j, line in enumerate(self.linear_features):
+            line.coordinates = PartView(linear_features, j)
+        self.geometry["linear_features"] = linear_features
+
+        if self.boundary is not None:
+            boundary = RaggedGeometry.from_parts([self.boundary.coordinates])
+            self.boundary.coordinates = FeatureView(boundary, 0)
+            self.geometry["boundary"] = boundary
+
+    def _unpack_geometry(self) -> None:
+        """Undo `_pack_geometry`: give features back plain lists of (lon, lat) tuples."""
+        for pavement in self.pavements:
+            pavement.coordinates = [ring[:] for ring in pavement.coordinates]
+        for line in self.linear_features:
+            line.coordinates = line.coordinates[:]
+        if self.boundary is not None:
+            self.boundary.coordinates = [ring[:] for ring in self.boundary.coordinates]
+        self.geometry = None
+
+    @property
+    def spatial_index(self) -> "SpatialIndex":
+        """Spatial index over this airport's features. Trees are built on first query."""
+        if self._spatial_index is None:
+            from spatial import SpatialIndex
+
+            self._spatial_index = SpatialIndex(self)
+        return self._spatial_index
+
+    def lod_geometry(self, tolerance: float) -> dict[str, RaggedGeometry]:
+        """Coordinates of pavements, linear features and the boundary at one level of detail.
 
-                boundary = Boundary.from_row_iterator(
-                    row, row_iterator, bezier_resolution)
-
-                if boundary is not None:
-                    self.boundary = boundary
-
-            elif row_code == RowCode.LAND_RUNWAY:
-                logger.debug("Parsing runway row.")
-
-                runway = Runway.from_line(line=row)
-
-                if runway is not None:
-                    self.runways.append(runway)
-
-            elif row_code == RowCode.START_LOCATION_NEW:
-                logger.debug("Parsing startup location row.")
-
-                startup_location = StartupLocation.from_line(row)
-
-                if startup_location is not None:
-                    self.startup_locations.append(startup_location)
-
-                # TODO: process RowCode.START_LOCATION_EXT (startup location metadata)
-
-            elif row_code == RowCode.WINDSOCK:
-                logger.debug("Parsing sign row.")
-
-                windsock = Windsock.from_line(row)
-
-                if windsock is not None:
-                    self.windsocks.append(windsock)
-
-            elif row_code == RowCode.TAXI_SIGN:
-                logger.debug("Parsing sign row.")
-
-                sign = Sign.from_line(row)
+        Args:
+            tolerance (float): One of the `lod_tolerances` the airport was parsed with.
+        """
+        geometry = {
+            "pavements": RaggedGeometry.from_parts(
+                [pavement.lods[tolerance] for pavement in self.pavements]),
+            "linear_features": RaggedGeometry.from_parts(
+                [[line.lods[tolerance]] for line in self.linear_features]),
+        }
 
-                if sign is not None:
-                    self.signs.append(sign)
+        geometry["boundary"] = RaggedGeometry.from_parts(
+            [self.boundary.lods[tolerance]] if self.boundary is not None else [])
 
-            elif row_code == RowCode.TAXIWAY:
-                logger.debug("Parsing pavement row.")
+        return geometry
 
-                pavement = Pavement.from_row_iterator(
-                    row, row_iterator, bezier_resolution)
+    def triangulation(self, name: str = "pavements") -> tuple[RaggedGeometry, np.ndarray, np.ndarray]:
+        """Triangles of all the polygons of a feature class, as one index buffer.
 
-                if pavement is not None:
-                    self.pavements.append(pavement)
+        Triangles cached on the features are reused, the missing ones computed and
+        cached, so later calls only gather them.
 
-            elif row_code == RowCode.FREE_CHAIN:
-                logger.debug("Parsing linear feature row.")
+        Args:
+            name (str): One of `POLYGON_FEATURES`. Default "pavements".
 
-                for line in LinearFeature.from_row_iterator(row, row_iterator, bezier_resolution):
-                    if line is not None:
-                        self.linear_features.append(line)
+        Returns:
+            tuple[RaggedGeometry, np.ndarray, np.ndarray]: The polygons, (T, 3) indices into
+                their `coords`, and (F + 1,) offsets: feature `j` owns triangles
+                `offsets[j]:offsets[j + 1]`.
+        """
+        if name not in POLYGON_FEATURES:
+            raise ValueError(f"Invalid feature {name}. Valid features: {', '.join(POLYGON_FEATURES)}.")
+
+        from triangulation import triangulate_geometry
+
+        polygons = _polygons(getattr(self, name))
+        geometry = (self.geometry or {}).get(name)
+        if geometry is None:
+            geometry = RaggedGeometry.from_parts([polygon.coordinates for polygon in polygons])
+
+        with self.stats.stage("triangulation"):
+            triangles = [polygon.triangulate() for polygon in polygons]
+        return (geometry, *triangulate_geometry(geometry, triangles))
+
+    def _scan(self, features: Optional[Sequence[str]] = None) -> None:
+        """One pass over the row codes: parse the header and metadata, and record where
+        every record of the requested families starts. The other families are set empty."""
+        text = self._airport.text
+        if hasattr(text, "row_codes"):
+            row_codes = text.row_codes
+        else:
+            row_codes = [row.row_code if isinstance(row.row_code, int) else -1 for row in text]
+        row_codes = np.asarray(row_codes, dtype=np.int64)
+
+        for i in np.flatnonzero(np.isin(row_codes, _HEADER_ROWS))[:1].tolist():
+            self.id = text[i].tokens[4]
+        for i in np.flatnonzero(row_codes == RowCode.METADATA).tolist():
+            self.metadata.add_from_row(text[i])
+
+        # family of every row, then the rows of each family in file order
+        family = np.full(len(row_codes), -1, dtype=np.int16)
+        known = (row_codes >= 0) & (row_codes < len(_FAMILY_TABLE))
+        family[known] = _FAMILY_TABLE[row_codes[known]]
+        order = np.argsort(family, kind="stable")
+        bounds = np.searchsorted(family[order], np.arange(len(_FAMILY_NAMES) + 1))
+
+        self._pending = {}
+        for j, name in enumerate(_FAMILY_NAMES):
+            if features is None or name in features:
+                self._pending[name] = order[bounds[j]:bounds[j + 1]].tolist()
+            else:
+                setattr(self, name, None if _RECORD_FAMILIES[name].single else [])
+
+        self.stats.count_rows(row_codes)
+
+    def __getattr__(self, name: str):
+        # only reached for attributes not set yet, i.e. feature classes of a lazy airport
+        pending = self.__dict__.get("_pending")
+        if not pending or name not in pending:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+        with self.stats.memory():
+            self._materialize(name)
+        return self.__dict__[name]
+
+    def _materialize_all(self) -> None:
+        for name in list(self.__dict__.get("_pending") or ()):
+            self._materialize(name)
+
+    def _materialize(self, name: str) -> None:
+        """Parse the feature class `name` from the blocks recorded by `_scan`."""
+        starts = self._pending.pop(name)
+        t0 = time.perf_counter()
+
+        with collecting(self.stats), self.stats.stage("feature_build"):
+            value = self._build(name, starts)
+
+        if self._triangulate and name in POLYGON_FEATURES:
+            with self.stats.stage("triangulation"):
+                for polygon in _polygons(value):
+                    polygon.triangulate()
+
+        self.stats.feature_seconds[name] = time.perf_counter() - t0
+        self.stats.vertices[name] = _count_vertices(name, value)
+        setattr(self, name, value)
+
+        # the raw airport, with the node table of a `RowTable`, is of no use once all is parsed
+        if not self._pending:
+            self._airport = None
+
+    def _build(self, name: str, starts: list[int]):
+        logger.debug(f"Parsing {name} rows.")
+        return _RECORD_FAMILIES[name].build(self._airport.text, starts, self._parse_options)
+
+
+def _polygons(value) -> list:
+    # the boundary is a single feature, or None
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _count_vertices(name: str, value) -> int:
+    if value is None:
+        return 0
+    if name == "taxi_network":
+        return len(value.node_ids)
+    if name == "boundary":
+        return sum(len(ring) for ring in value.coordinates)
+    if name == "pavements":
+        return sum(len(ring) for pavement in value for ring in pavement.coordinates)
+    if name == "linear_features":
+        return sum(len(line.coordinates) for line in value)
+    if name in ("runways", "water_runways"):
+        return 2 * len(value)
+    if name == "tower":
+        return 1
+    if name in ("frequencies", "traffic_flows"):
+        return 0
+    return len(value)
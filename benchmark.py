@@ -0,0 +1,1323 @@
+from __future__ import annotations
+
+import argparse
+import gc
+import glob
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+
+from base import PARSER_VERSION, RECORD_FAMILIES, VALID_FEATURES, ParsedAirport
+from cache import AirportCache
+from classes import Runway
+from geometry import (
+    _DEFAULT_BEZIER_RESOLUTION,
+    RowCode,
+    _PendingCurve,
+    _bernstein,
+    _last_point,
+    _remove_consecutive_duplicates,
+    _resolve_curves,
+    adaptive_bezier_parameters,
+    cubic_bezier,
+    get_paths,
+    quadratic_bezier,
+    tessellate_beziers,
+)
+from index import AptIndex
+from iterators import BIterator
+from log import configure_logging
+from runway_geometry import runway_polygons
+from spatial import INDEXED_FEATURES, SpatialIndex
+from tokenizer import MappedAirport, MappedAptFile, RowTable
+from triangulation import triangulate_rings
+from util import latlon_to_xy
+
+
+logger = logging.getLogger("xplane_apt_convert")
+
+RESULTS_VERSION = 1
+_DEFAULT_STORAGE = ".benchmarks"
+_DEFAULT_THRESHOLD = 0.10
+
+SYNTHETIC_SIZES = (1_000, 10_000, 100_000)
+BEZIER_RESOLUTIONS = (4, 8, 16, 32, 64)
+# spatial queries: points spread over each airport, and the side of query boxes in degrees
+_SPATIAL_POINTS = 256
+_SPATIAL_BOX = 0.001
+_RUNWAY_ROWS = 10_000
+
+_ORIGIN = (36.70, 3.20)  # lat, lon
+_PAVEMENT_NODES = 32
+_LINE_NODES = 16
+
+
+def _runway_row(lat: float, lon: float, length: float) -> str:
+    return (
+        f"100 45.00 1 1 0.25 1 3 0 09 {lat:.8f} {lon:.8f} 0 0 3 0 1 0 "
+        f"27 {lat:.8f} {lon + length:.8f} 0 0 3 0 1 0"
+    )
+
+
+def synthetic_airport(n_nodes: int, seed: int = 0, ident: str = "SYNT") -> str:
+    """apt.dat text of a made-up airport with about `n_nodes` node rows (111-116).
+
+    Three fifths of the nodes go to pavement rings, the rest to painted linear
+    features. Every other node is a Bezier node. A runway, and signs and startup
+    locations in proportion to the size, are included. The same arguments always
+    give the same text.
+    """
+    rng = random.Random(seed)
+    lat0, lon0 = _ORIGIN
+    spread = 0.0005 * math.sqrt(n_nodes)  # keeps the node density about constant
+
+    def point():
+        return lat0 + rng.uniform(0, spread), lon0 + rng.uniform(0, spread)
+
+    rows = [
+        f"1 100 0 0 {ident} Synthetic airport {n_nodes}",
+        _runway_row(lat0, lon0, spread),
+    ]
+
+    def node(kind, lat, lon, bezier, suffix=""):
+        # kind is the plain row code, the Bezier variant is kind + 1
+        kind = int(kind)
+        if bezier:
+            dlat, dlon = rng.uniform(-2e-5, 2e-5), rng.uniform(-2e-5, 2e-5)
+            return f"{kind + 1} {lat:.8f} {lon:.8f} {lat + dlat:.8f} {lon + dlon:.8f}{suffix}"
+        return f"{kind} {lat:.8f} {lon:.8f}{suffix}"
+
+    pavement_nodes = n_nodes * 3 // 5
+    for p in range(max(1, pavement_nodes // _PAVEMENT_NODES)):
+        rows.append(f"110 1 0.25 0.0 Pavement {p}")
+        lat, lon = point()
+        radius = rng.uniform(1e-4, 5e-4)
+        for i in range(_PAVEMENT_NODES):
+            angle = 2 * math.pi * i / _PAVEMENT_NODES
+            last = i == _PAVEMENT_NODES - 1
+            kind = RowCode.RING_SEGMENT if last else RowCode.LINE_SEGMENT
+            rows.append(node(kind, lat + radius * math.sin(angle), lon + radius * math.cos(angle), i % 2 == 1))
+
+    for f in range(max(1, (n_nodes - pavement_nodes) // _LINE_NODES)):
+        rows.append(f"120 Line {f}")
+        lat, lon = point()
+        line_type = rng.choice((1, 3, 51))
+        for i in range(_LINE_NODES):
+            last = i == _LINE_NODES - 1
+            kind = RowCode.END_SEGMENT if last else RowCode.LINE_SEGMENT
+            rows.append(node(kind, lat + i * 2e-5, lon + rng.uniform(-1e-5, 1e-5), i % 2 == 1,
+                             "" if last else f" {line_type}"))
+
+    for i in range(max(1, n_nodes // 100)):
+        lat, lon = point()
+        rows.append(f"20 {lat:.8f} {lon:.8f} {rng.uniform(0, 360):.1f} 0 2 {{@Y}}A{i}")
+
+    for i in range(max(1, n_nodes // 200)):
+        lat, lon = point()
+        rows.append(f"1300 {lat:.8f} {lon:.8f} {rng.uniform(0, 360):.1f} gate jets|turboprops G{i}")
+
+    return "\n".join(rows) + "\n"
+
+
+def _mapped(text: str) -> MappedAirport:
+    return MappedAirport(RowTable.from_buffer(text.encode("utf-8")))
+
+
+@dataclass
+class Benchmark:
+    name: str
+    func: Callable[[], object]
+    rounds: int
+    group: str
+    rows: Optional[int] = None  # apt.dat rows handled per call, to report rows per second
+
+
+def _time(func: Callable[[], object], rounds: int, min_time: float = 0.05) -> dict:
+    """Seconds per call over `rounds` rounds, each looping until it lasts `min_time`.
+
+    As with `timeit`, the garbage collector is off while timing.
+    """
+    func()  # warm caches and imports
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _time_rounds(func, rounds, min_time)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def _time_rounds(func: Callable[[], object], rounds: int, min_time: float) -> dict:
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func()
+        if time.perf_counter() - t0 >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+
+    times = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - t0) / number)
+
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "rounds": rounds,
+        "calls_per_round": number,
+    }
+
+
+def _chain_starts(rows: RowTable) -> list[tuple[int, str]]:
+    starts = []
+    for i, row_code in enumerate(rows.row_codes.tolist()):
+        if row_code in (RowCode.TAXIWAY, RowCode.BOUNDARY):
+            starts.append((i, "polygon"))
+        elif row_code == RowCode.FREE_CHAIN:
+            starts.append((i, "line"))
+    return starts
+
+
+def _fresh(rows: RowTable) -> RowTable:
+    """A copy of `rows` sharing its arrays, without the node table a parse leaves behind."""
+    return RowTable(rows._buf, rows.row_codes, rows.starts, rows.ends)
+
+
+def _walk_chains(rows: RowTable, starts: list[tuple[int, str]], bezier_resolution: int) -> None:
+    rows = _fresh(rows)
+    for i, mode in starts:
+        get_paths(BIterator(rows, start=i + 1), bezier_resolution, mode=mode)
+
+
+def _legacy_get_paths_lods(row_iterator, bezier_resolution, lod_tolerances, mode="line", bezier_tolerance=None):
+    """`get_paths_lods` as it was before `_NodeChainParser`: backtracking with
+    `BIterator.unnext()` and closures over the segment being built. Kept to benchmark
+    the chain walk against.
+    """
+    # https://forums.x-plane.org/index.php?/forums/topic/66713-understanding-the-logic-of-bezier-control-points-in-aptdat/
+
+    assert mode == "line" or mode == "polygon"
+
+    coordinates = []
+    properties = {}
+    lod_coordinates = {tolerance: [] for tolerance in lod_tolerances}
+
+    def _start_segment():
+        nonlocal coordinates, properties
+        coordinates = []
+        properties = {}
+
+    def _finish_segment():
+        resolved = _resolve_curves(coordinates, bezier_tolerance)
+        if len(resolved) > 1:
+            # simplify line. remove consecutive duplicates
+            coordinates_list.append(_remove_consecutive_duplicates(resolved))
+            properties_list.append(properties)
+
+            for tolerance, lod_list in lod_coordinates.items():
+                lod_list.append(_remove_consecutive_duplicates(
+                    _resolve_curves(coordinates, tolerance)))
+
+    def _process_row(is_bezier, tokens):
+        nonlocal in_bezier, temp_bezier_nodes, coordinates, properties
+        lat, lon = float(tokens[1]), float(tokens[2])
+
+        if not is_bezier:
+            if in_bezier:
+                temp_bezier_nodes.append((lon, lat))
+                coordinates.append(
+                    _PendingCurve(temp_bezier_nodes,
+                                  _DEFAULT_BEZIER_RESOLUTION)
+                )  # TODO: pass resolution argument
+                temp_bezier_nodes = []
+            else:
+                coordinates.append((lon, lat))
+
+            in_bezier = False
+
+            painted_line_type = int(tokens[3]) if len(tokens) > 3 else None
+            lighting_line_type = int(tokens[4]) if len(tokens) > 4 else None
+
+            if mode == "line" and (
+                (
+                    painted_line_type is not None
+                    and properties.get("painted_line_type") is not None
+                    and painted_line_type != properties["painted_line_type"]
+                )
+                or (
+                    lighting_line_type is not None
+                    and properties.get("lighting_line_type") is not None
+                    and lighting_line_type != properties["lighting_line_type"]
+                )
+            ):
+                if row_iterator.has_next():
+                    _finish_segment()
+                    _start_segment()
+                    row_iterator.unnext()  # reuse row for the new segment
+            else:
+                if painted_line_type is not None:
+                    properties["painted_line_type"] = painted_line_type
+
+                if lighting_line_type is not None:
+                    properties["lighting_line_type"] = lighting_line_type
+
+        else:
+            bzp_lat, bzp_lon = float(tokens[3]), float(tokens[4])
+
+            if in_bezier:
+                diff_lat = bzp_lat - lat
+                diff_lon = bzp_lon - lon
+                mirr_lat = lat - diff_lat
+                mirr_lon = lon - diff_lon
+
+                temp_bezier_nodes.append((mirr_lon, mirr_lat))
+                temp_bezier_nodes.append((lon, lat))
+                coordinates.append(
+                    _PendingCurve(temp_bezier_nodes, bezier_resolution))
+                temp_bezier_nodes = []
+            else:
+                if len(coordinates) != 0:
+                    diff_lat = bzp_lat - lat
+                    diff_lon = bzp_lon - lon
+                    mirr_lat = lat - diff_lat
+                    mirr_lon = lon - diff_lon
+
+                    temp_bezier_nodes.append(_last_point(coordinates))
+                    temp_bezier_nodes.append((mirr_lon, mirr_lat))
+                    temp_bezier_nodes.append((lon, lat))
+                    coordinates.append(
+                        _PendingCurve(temp_bezier_nodes, bezier_resolution))
+                    temp_bezier_nodes = []
+
+            temp_bezier_nodes.append((lon, lat))
+            temp_bezier_nodes.append((bzp_lon, bzp_lat))
+
+            # else:
+            in_bezier = True
+
+            painted_line_type = int(tokens[5]) if len(tokens) > 5 else None
+            lighting_line_type = int(tokens[6]) if len(tokens) > 6 else None
+
+            if mode == "line" and (
+                (
+                    painted_line_type is not None
+                    and properties.get("painted_line_type") is not None
+                    and painted_line_type != properties["painted_line_type"]
+                )
+                or (
+                    lighting_line_type is not None
+                    and properties.get("lighting_line_type") is not None
+                    and lighting_line_type != properties["lighting_line_type"]
+                )
+            ):
+                if row_iterator.has_next():
+                    _finish_segment()
+                    _start_segment()
+                    row_iterator.unnext()  # reuse row for the new segment
+            else:
+                if painted_line_type is not None:
+                    properties["painted_line_type"] = painted_line_type
+
+                if lighting_line_type is not None:
+                    properties["lighting_line_type"] = lighting_line_type
+
+    coordinates_list = []
+    properties_list = []
+    more_segments = True
+
+    while more_segments:
+        temp_bezier_nodes = []
+        in_bezier = False
+        first_row = None
+        first_row_is_bezier = None
+
+        _start_segment()
+
+        for row in row_iterator:
+            if first_row is None:
+                first_row = row
+                first_row_is_bezier = row.row_code in [
+                    RowCode.LINE_CURVE,
+                    RowCode.RING_CURVE,
+                    RowCode.END_CURVE,
+                ]
+
+            row_code = row.row_code
+            tokens = row.tokens
+
+            if row_code == RowCode.LINE_SEGMENT:
+                _process_row(False, tokens)
+            elif row_code == RowCode.LINE_CURVE:
+                _process_row(True, tokens)
+            elif row_code == RowCode.RING_SEGMENT:
+                _process_row(False, tokens)
+                _process_row(first_row_is_bezier, first_row.tokens)
+                break
+            elif row_code == RowCode.RING_CURVE:
+                _process_row(True, tokens)
+                _process_row(first_row_is_bezier, first_row.tokens)
+                break
+            elif row_code == RowCode.END_SEGMENT:
+                _process_row(False, tokens)
+                break
+            elif row_code == RowCode.END_CURVE:
+                _process_row(True, tokens)
+                break
+            else:
+                row_iterator.unnext()
+                more_segments = False
+                break
+        else:
+            # there is no more rows
+            more_segments = False
+
+        _finish_segment()
+
+    assert len(coordinates_list) == len(properties_list)
+    return coordinates_list, properties_list, lod_coordinates
+
+
+
+def _walk_chains_legacy(rows: RowTable, starts: list[tuple[int, str]], bezier_resolution: int) -> None:
+    for i, mode in starts:
+        _legacy_get_paths_lods(BIterator(rows, start=i + 1), bezier_resolution, (), mode=mode)
+
+
+def _scalar_beziers(curves: list, resolution: int) -> list:
+    """Points of every curve, one `quadratic_bezier`/`cubic_bezier` call per coordinate, as
+    get_paths did before batching."""
+    points = []
+    for curve in curves:
+        bezier = quadratic_bezier if len(curve) == 3 else cubic_bezier
+        xs, ys = zip(*curve)
+        points.append([(bezier(t, *xs), bezier(t, *ys)) for t in np.linspace(0.0, 1.0, resolution)])
+    return points
+
+
+def _batched_beziers(curves: list, resolution: int) -> list:
+    """Points of every curve, one `tessellate_beziers` call per degree, as get_paths does."""
+    points = []
+    for degree in (2, 3):
+        group = [curve for curve in curves if len(curve) == degree + 1]
+        if group:
+            flat = tessellate_beziers(group, resolution).tolist()
+            points.extend(flat[i * resolution:(i + 1) * resolution] for i in range(len(group)))
+    return points
+
+
+def collect(apt_path: Optional[str] = "apt.dat", sizes=SYNTHETIC_SIZES, rounds: int = 5) -> list[Benchmark]:
+    """The benchmarks to run: parsing, tessellation, triangulation, runway construction and
+    outlines, and reprojection.
+
+    Bundled-file benchmarks parse the first airport of `apt_path` and are left out
+    if it does not exist. Reprojection is left out if pyproj is not installed.
+    """
+    benchmarks = []
+    airports = {}
+
+    if apt_path is not None and os.path.exists(apt_path):
+        apt_file = MappedAptFile(apt_path)
+        ident = next(iter(apt_file.index))
+        airports[ident] = apt_file.airport(ident)
+        benchmarks.append(Benchmark(
+            f"parse[{ident}]", lambda a=airports[ident]: ParsedAirport(MappedAirport(_fresh(a.text))), rounds, "parse"))
+
+        # cold parse above, against loads from a warm cache in either layout
+        text = AptIndex.open(apt_path).read_bytes(ident)
+        cache_dir = tempfile.TemporaryDirectory()
+        cache = AirportCache(cache_dir.name)
+        cache.parse(text)
+        for columnar in (False, True):
+            benchmarks.append(Benchmark(
+                f"AirportCache.parse[{ident}-warm{'-columnar' if columnar else ''}]",
+                lambda c=cache, t=text, col=columnar, d=cache_dir: c.parse(t, columnar=col),
+                rounds,
+                "parse",
+            ))
+    else:
+        logger.warning(f"{apt_path} not found, skipping the bundled airport benchmarks.")
+
+    for size in sizes:
+        name = f"synthetic-{size}"
+        airports[name] = _mapped(synthetic_airport(size))
+        benchmarks.append(Benchmark(
+            f"parse[{name}]", lambda a=airports[name]: ParsedAirport(MappedAirport(_fresh(a.text))), rounds, "parse"))
+
+    # row splitting and node decoding of every airport text, as rows per second
+    texts = {name: airport.text for name, airport in airports.items()}
+    if apt_path is not None and os.path.exists(apt_path):
+        texts[os.path.basename(apt_path)] = apt_file.rows()
+    for name, rows in texts.items():
+        buf, n_rows = rows._buf, len(rows)
+        start, end = int(rows.starts[0]), int(rows.ends[-1]) if n_rows else 0
+        n_nodes = len(rows.nodes())
+        benchmarks.append(Benchmark(
+            f"RowTable.from_buffer[{name}]",
+            lambda b=buf, s=start, e=end: RowTable.from_buffer(b, s, e),
+            rounds, "tokenize", rows=n_rows))
+        benchmarks.append(Benchmark(
+            f"RowTable.nodes[{name}]", rows.nodes, rounds, "tokenize", rows=n_nodes))
+
+    # the bundled airport, and one synthetic size large enough to dwarf call overhead
+    tessellated = [name for name in airports if not name.startswith("synthetic-") or name == "synthetic-10000"]
+    for name in tessellated:
+        airport = airports[name]
+        starts = _chain_starts(airport.text)
+        for resolution in BEZIER_RESOLUTIONS:
+            benchmarks.append(Benchmark(
+                f"get_paths[{name}-res{resolution}]",
+                lambda rows=airport.text, s=starts, r=resolution: _walk_chains(rows, s, r),
+                rounds,
+                "tessellation",
+            ))
+
+        # the chain walk before and after _NodeChainParser, at the default resolution
+        benchmarks.append(Benchmark(
+            f"chain_walk_legacy[{name}]",
+            lambda rows=airport.text, s=starts: _walk_chains_legacy(rows, s, _DEFAULT_BEZIER_RESOLUTION),
+            rounds,
+            "tessellation",
+        ))
+        benchmarks.append(Benchmark(
+            f"chain_walk[{name}]",
+            lambda rows=airport.text, s=starts: _walk_chains(rows, s, _DEFAULT_BEZIER_RESOLUTION),
+            rounds,
+            "tessellation",
+        ))
+
+        # the curves get_paths tessellates, evaluated per curve and coordinate against batched
+        curves = _airport_curves(airport.text)
+        for resolution in BEZIER_RESOLUTIONS:
+            benchmarks.append(Benchmark(
+                f"bezier_scalar[{name}-res{resolution}]",
+                lambda c=curves, r=resolution: _scalar_beziers(c, r),
+                rounds,
+                "tessellation",
+            ))
+            benchmarks.append(Benchmark(
+                f"bezier_batched[{name}-res{resolution}]",
+                lambda c=curves, r=resolution: _batched_beziers(c, r),
+                rounds,
+                "tessellation",
+            ))
+
+    # synthetic pavements are random, tangled rings: only the bundled airport is representative
+    for name in [name for name in airports if not name.startswith("synthetic-")]:
+        parsed = ParsedAirport(airports[name], features=["pavements", "boundary"])
+        rings = [pavement.coordinates for pavement in parsed.pavements]
+        if parsed.boundary is not None:
+            rings.append(parsed.boundary.coordinates)
+        benchmarks.append(Benchmark(
+            f"triangulate_rings[{name}]",
+            lambda r=rings: [triangulate_rings(polygon) for polygon in r],
+            rounds,
+            "triangulation",
+        ))
+
+    # one query or nearest search per call, cycling through points spread over the airport
+    for name in tessellated:
+        parsed = ParsedAirport(airports[name])
+        min_lon, min_lat, max_lon, max_lat = _list_bounds(parsed)
+        rng = random.Random(0)
+        points = [(rng.uniform(min_lon, max_lon), rng.uniform(min_lat, max_lat)) for _ in range(_SPATIAL_POINTS)]
+        boxes = [(lon, lat, lon + _SPATIAL_BOX, lat + _SPATIAL_BOX) for lon, lat in points]
+        index = SpatialIndex(parsed)
+        benchmarks.append(Benchmark(
+            f"SpatialIndex.build[{name}]",
+            lambda p=parsed: [SpatialIndex(p)._tree(feature) for feature in INDEXED_FEATURES],
+            rounds,
+            "spatial",
+        ))
+        benchmarks.append(Benchmark(
+            f"SpatialIndex.query[{name}]",
+            lambda i=index, b=itertools.cycle(boxes): i.query(next(b)),
+            rounds,
+            "spatial",
+        ))
+        for k in (1, 10):
+            benchmarks.append(Benchmark(
+                f"SpatialIndex.nearest[{name}-k{k}]",
+                lambda i=index, p=itertools.cycle(points), k=k: i.nearest(*next(p), k=k),
+                rounds,
+                "spatial",
+            ))
+
+    rng = random.Random(0)
+    runway_text = "\n".join(
+        _runway_row(rng.uniform(-60, 60), rng.uniform(-180, 179), rng.uniform(0.01, 0.05))
+        for _ in range(_RUNWAY_ROWS))
+    runway_rows = RowTable.from_buffer(runway_text.encode("utf-8"))
+    runway_lines = [runway_rows[i] for i in range(len(runway_rows))]
+    benchmarks.append(Benchmark(
+        f"Runway.from_line[{_RUNWAY_ROWS}]",
+        lambda: [Runway.from_line(line) for line in runway_lines],
+        rounds,
+        "construction",
+    ))
+    runways = [Runway.from_line(line) for line in runway_lines]
+    benchmarks.append(Benchmark(
+        f"runway_polygons[{_RUNWAY_ROWS}]", lambda: runway_polygons(runways), rounds, "construction"))
+
+    try:
+        from projection import project_airport
+    except ImportError as e:
+        logger.warning(f"Skipping the reprojection benchmarks: {e}")
+    else:
+        for name, airport in airports.items():
+            parsed = ParsedAirport(airport)
+            benchmarks.append(Benchmark(
+                f"project_airport[{name}]",
+                lambda p=parsed: project_airport(p, "EPSG:3857"),
+                rounds,
+                "reprojection",
+            ))
+
+    return benchmarks
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, timeout=10,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if out.returncode != 0:
+        return None
+    return out.stdout.strip() or None
+
+
+def run(benchmarks: list[Benchmark], name_filter: Optional[str] = None) -> dict:
+    """Run the benchmarks and return a results document, as saved by `save`."""
+    results = {}
+    for benchmark in benchmarks:
+        if name_filter is not None and name_filter not in benchmark.name:
+            continue
+
+        timing = _time(benchmark.func, benchmark.rounds)
+        results[benchmark.name] = {"group": benchmark.group, **timing}
+        if benchmark.rows is not None:
+            results[benchmark.name]["rows_per_second"] = benchmark.rows / timing["min"]
+        logger.info(f"{benchmark.name}: {timing['median'] * 1e3:.3f} ms (min {timing['min'] * 1e3:.3f} ms)")
+
+    return {
+        "version": RESULTS_VERSION,
+        "commit": _git_commit(),
+        "parser_version": PARSER_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+        },
+        "benchmarks": results,
+    }
+
+
+def save(results: dict, storage: str = _DEFAULT_STORAGE) -> str:
+    """Write results into `storage` as `<timestamp>_<commit>.json`. Returns the path."""
+    os.makedirs(storage, exist_ok=True)
+    stamp = results["timestamp"].replace(":", "")
+    path = os.path.join(storage, f"{stamp}_{results['commit'] or 'nocommit'}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+    return path
+
+
+def latest(storage: str = _DEFAULT_STORAGE) -> Optional[str]:
+    """Path of the most recent results saved into `storage`, if any."""
+    paths = sorted(glob.glob(os.path.join(storage, "*.json")))
+    return paths[-1] if paths else None
+
+
+def compare(baseline: dict, results: dict, threshold: float = _DEFAULT_THRESHOLD) -> list[str]:
+    """Benchmarks whose fastest round got slower than `baseline` by more than `threshold`.
+
+    The minimum is compared rather than the median as it is the least affected by
+    other load on the machine. Also prints one line per benchmark present in both.
+    """
+    if baseline.get("machine") != results.get("machine"):
+        logger.warning("The baseline was recorded on a different machine or Python, timings may not compare.")
+
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            continue
+
+        ratio = result["min"] / before["min"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"{name:<48} {before['min'] * 1e3:10.3f} ms -> {result['min'] * 1e3:10.3f} ms  x{ratio:.2f}{flag}")
+
+    return regressions
+
+
+def triangulation_throughput(apt_path: str, idents: Optional[list[str]] = None, top: int = 10) -> dict:
+    """Triangulate every pavement and boundary of an apt.dat file, once, and time it.
+
+    Only the triangulation is timed, not the parse. Throughput is counted in input
+    vertices, closing points included.
+
+    Returns:
+        dict: Totals, `vertices_per_second`, and the `top` slowest polygons.
+    """
+    totals = {"airports": 0, "polygons": 0, "vertices": 0, "triangles": 0, "seconds": 0.0}
+    slowest = []
+
+    with MappedAptFile(apt_path) as apt_file:
+        for ident in idents or list(apt_file.index):
+            try:
+                parsed = apt_file.parse(ident, features=["pavements", "boundary"])
+            except Exception as e:
+                logger.error(f"Skipping {ident}, failed to parse: {e}")
+                continue
+
+            totals["airports"] += 1
+            polygons = [(f"pavement {j}", p.coordinates) for j, p in enumerate(parsed.pavements)]
+            if parsed.boundary is not None:
+                polygons.append(("boundary", parsed.boundary.coordinates))
+
+            for label, rings in polygons:
+                t0 = time.perf_counter()
+                triangles = triangulate_rings(rings)
+                seconds = time.perf_counter() - t0
+
+                n_vertices = sum(len(ring) for ring in rings)
+                totals["polygons"] += 1
+                totals["vertices"] += n_vertices
+                totals["triangles"] += len(triangles)
+                totals["seconds"] += seconds
+                slowest.append((seconds, ident, label, n_vertices))
+
+    slowest.sort(reverse=True)
+    return {
+        **totals,
+        "vertices_per_second": totals["vertices"] / totals["seconds"] if totals["seconds"] else None,
+        "slowest": [
+            {"airport": ident, "polygon": label, "vertices": n_vertices, "seconds": seconds}
+            for seconds, ident, label, n_vertices in slowest[:top]
+        ],
+    }
+
+
+def tokenizer_memory(apt_path: str) -> dict:
+    """Peak traced memory and rows per second of splitting a whole apt.dat file into rows.
+
+    `RowTable.from_buffer` over the mapped file is compared with `xplane_airports`,
+    which keeps an `AptDatLine` per row, when it is installed. Rows per second are
+    from a single untraced run.
+    """
+    import mmap
+    import tracemalloc
+
+    def measure(func):
+        gc.collect()
+        t0 = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - t0
+        del result
+        gc.collect()
+
+        tracemalloc.start()
+        result = func()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return len(result), seconds, peak, retained
+
+    report = {}
+    with open(apt_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        n_rows, seconds, peak, retained = measure(lambda: RowTable.from_buffer(m))
+        report["RowTable.from_buffer"] = {
+            "rows": n_rows, "rows_per_second": n_rows / seconds, "peak_bytes": peak, "retained_bytes": retained}
+
+    try:
+        from xplane_airports.AptDat import Airport
+    except ImportError:
+        logger.warning("xplane_airports is not installed, skipping the AptDatLine comparison.")
+        return report
+
+    with open(apt_path, "r", encoding="utf-8") as f:
+        text = f.read()
+    n_rows, seconds, peak, retained = measure(lambda: Airport.from_str(text, apt_path).text)
+    report["xplane_airports"] = {
+        "rows": n_rows, "rows_per_second": n_rows / seconds, "peak_bytes": peak, "retained_bytes": retained}
+    report["peak_ratio"] = report["xplane_airports"]["peak_bytes"] / report["RowTable.from_buffer"]["peak_bytes"]
+    return report
+
+
+# tolerances in metres at which adaptive and fixed tessellation are compared
+VERTEX_TOLERANCES = (0.05, 0.1, 0.25, 0.5, 1.0)
+_DENSE_SAMPLES = 1025
+_MAX_FIXED_RESOLUTION = 1 << 12
+
+
+def _bezier_points(control_points: np.ndarray, t: np.ndarray) -> np.ndarray:
+    return _bernstein(len(control_points) - 1, t) @ control_points
+
+
+def _max_deviation(control_points: np.ndarray, t: np.ndarray) -> float:
+    """Largest distance between a Bezier curve and the polyline through its points at `t`.
+
+    The curve is sampled at `_DENSE_SAMPLES` parameters, each measured against the
+    polyline segment spanning its parameter.
+    """
+    samples = _bezier_points(control_points, t)
+    dense_t = np.linspace(0.0, 1.0, _DENSE_SAMPLES)
+    dense = _bezier_points(control_points, dense_t)
+
+    k = np.clip(np.searchsorted(t, dense_t, side="right") - 1, 0, len(t) - 2)
+    a, chord = samples[k], samples[k + 1] - samples[k]
+    length2 = np.einsum("ij,ij->i", chord, chord)
+    along = np.einsum("ij,ij->i", dense - a, chord) / np.where(length2 > 0, length2, 1.0)
+    nearest = a + np.clip(along, 0.0, 1.0)[:, None] * chord
+    return float(np.max(np.hypot(*(dense - nearest).T)))
+
+
+def _fixed_resolution(control_points: np.ndarray, tolerance: float) -> int:
+    """Fewest evenly spaced samples keeping a Bezier curve within `tolerance` metres."""
+    def fits(resolution):
+        return _max_deviation(control_points, np.linspace(0.0, 1.0, resolution)) <= tolerance
+
+    low, high = 2, 2
+    while not fits(high) and high < _MAX_FIXED_RESOLUTION:
+        low, high = high + 1, high * 2
+    while low < high:
+        middle = (low + high) // 2
+        low, high = (low, middle) if fits(middle) else (middle + 1, high)
+    return high
+
+
+def _airport_curves(rows: RowTable) -> list[list[tuple[float, float]]]:
+    """Control points, as (lon, lat), of the Bezier curves between consecutive nodes.
+
+    Curves closing a ring back to its first node are left out.
+    """
+    table = rows.nodes()
+    columns = [table[name].tolist() for name in ("row", "row_code", "lat", "lon", "bezier_lat", "bezier_lon")]
+    curve_codes = (RowCode.LINE_CURVE, RowCode.RING_CURVE, RowCode.END_CURVE)
+    last_codes = (RowCode.RING_SEGMENT, RowCode.RING_CURVE, RowCode.END_SEGMENT, RowCode.END_CURVE)
+
+    curves = []
+    nodes = list(zip(*columns))
+    for node, next_node in zip(nodes, nodes[1:]):
+        row, code, lat, lon, b_lat, b_lon = node
+        next_row, next_code, next_lat, next_lon, next_b_lat, next_b_lon = next_node
+        if next_row != row + 1 or code in last_codes:
+            continue
+        if code not in curve_codes and next_code not in curve_codes:
+            continue
+
+        # as get_paths: a curve node's own control point, the next one's mirrored
+        curve = [(lon, lat)]
+        if code in curve_codes:
+            curve.append((b_lon, b_lat))
+        if next_code in curve_codes:
+            curve.append((2 * next_lon - next_b_lon, 2 * next_lat - next_b_lat))
+        curve.append((next_lon, next_lat))
+        curves.append(curve)
+
+    return curves
+
+
+def tessellation_vertices(
+    apt_path: str, tolerances: tuple[float, ...] = VERTEX_TOLERANCES, ident: Optional[str] = None
+) -> dict:
+    """Vertices of adaptive against fixed resolution tessellation at the same maximum deviation.
+
+    For every tolerance, the curves of one airport of `apt_path` are tessellated with
+    `adaptive_bezier_parameters`, and at the fewest evenly spaced samples, as
+    `tessellate_beziers` takes them, keeping every curve within the tolerance.
+    `per_curve_vertices` is the fixed count if each curve had its own resolution.
+    Deviations are measured in metres against densely sampled curves. Default the
+    first airport.
+    """
+    with MappedAptFile(apt_path) as apt_file:
+        ident = ident if ident is not None else next(iter(apt_file.index))
+        curves = _airport_curves(apt_file.airport(ident).text)
+
+    # x, y in metres around each curve's first point: affine in lon, lat, so the curves are unchanged
+    projected = []
+    for curve in curves:
+        ref_lon, ref_lat = curve[0]
+        projected.append(np.array([latlon_to_xy(lat, lon, ref_lat, ref_lon) for lon, lat in curve]))
+
+    report = {"airport": ident, "curves": len(curves), "tolerances": []}
+    for tolerance in tolerances:
+        parameters = [adaptive_bezier_parameters(curve, tolerance) for curve in curves]
+        resolutions = [_fixed_resolution(points, tolerance) for points in projected]
+        resolution = max(resolutions, default=2)
+        fixed_t = np.linspace(0.0, 1.0, resolution)
+
+        adaptive_vertices = sum(len(t) for t in parameters)
+        report["tolerances"].append({
+            "tolerance": tolerance,
+            "adaptive_vertices": adaptive_vertices,
+            "adaptive_max_deviation": max(
+                (_max_deviation(points, t) for points, t in zip(projected, parameters)), default=0.0),
+            "fixed_resolution": resolution,
+            "fixed_vertices": resolution * len(curves),
+            "fixed_max_deviation": max((_max_deviation(points, fixed_t) for points in projected), default=0.0),
+            "per_curve_vertices": sum(resolutions),
+            "ratio": resolution * len(curves) / adaptive_vertices if adaptive_vertices else None,
+        })
+
+    return report
+
+
+def _list_bounds(parsed: ParsedAirport) -> tuple[float, float, float, float]:
+    points = [point for pavement in parsed.pavements for ring in pavement.coordinates for point in ring]
+    points.extend(point for line in parsed.linear_features for point in line.coordinates)
+    if parsed.boundary is not None:
+        points.extend(point for ring in parsed.boundary.coordinates for point in ring)
+    lons, lats = zip(*points)
+    return min(lons), min(lats), max(lons), max(lats)
+
+
+def _columnar_bounds(parsed: ParsedAirport) -> tuple[float, float, float, float]:
+    coords = np.concatenate([geometry.coords for geometry in parsed.geometry.values()])
+    lons, lats = coords[:, 0], coords[:, 1]  # reducing columns beats .min(axis=0) on (N, 2)
+    return float(lons.min()), float(lats.min()), float(lons.max()), float(lats.max())
+
+
+def columnar_storage(apt_path: str, ident: Optional[str] = None, rounds: int = 5) -> dict:
+    """Memory and speed of nested lists of (lon, lat) tuples against columnar storage.
+
+    One airport of `apt_path` is parsed with `columnar` off and on. Memory is what the
+    parsed airport retains under tracemalloc. Timings are the fastest of `rounds` for
+    the parse, the bounds of every vertex and a pickle round trip, read through the
+    feature coordinates for lists and through `ParsedAirport.geometry` when columnar.
+    Default the first airport.
+    """
+    import pickle
+    import tracemalloc
+
+    with MappedAptFile(apt_path) as apt_file:
+        ident = ident if ident is not None else next(iter(apt_file.index))
+        text = apt_file.airport(ident).text
+
+        report = {"airport": ident}
+        for columnar in (False, True):
+            def parse(c=columnar):
+                return ParsedAirport(MappedAirport(_fresh(text)), columnar=c)
+
+            gc.collect()
+            tracemalloc.start()
+            parsed = parse()
+            retained, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            bounds = _columnar_bounds if columnar else _list_bounds
+            pickled = pickle.dumps(parsed)
+            report["columnar" if columnar else "lists"] = {
+                "retained_bytes": retained,
+                "peak_bytes": peak,
+                "parse_seconds": _time(parse, rounds)["min"],
+                "bounds_seconds": _time(lambda p=parsed, b=bounds: b(p), rounds)["min"],
+                "pickle_seconds": _time(lambda p=parsed: pickle.loads(pickle.dumps(p)), rounds)["min"],
+                "pickle_bytes": len(pickled),
+            }
+
+    report["vertices"] = sum(len(geometry.coords) for geometry in parsed.geometry.values())
+    report["buffer_bytes"] = sum(geometry.nbytes for geometry in parsed.geometry.values())
+    report["retained_ratio"] = report["lists"]["retained_bytes"] / report["columnar"]["retained_bytes"]
+    return report
+
+
+def feature_memory(apt_path: str, ident: Optional[str] = None) -> dict:
+    """Bytes per feature of the parsed records as slotted dataclasses, against plain ones.
+
+    Every feature of one airport of `apt_path` is copied, under tracemalloc, into a new
+    instance of its class and of a plain dataclass with the same fields. Field values
+    are shared with the parsed feature, so only the instances are counted: the object,
+    plus its `__dict__` for plain dataclasses. Default the first airport.
+    """
+    import dataclasses
+    import tracemalloc
+
+    with MappedAptFile(apt_path) as apt_file:
+        ident = ident if ident is not None else next(iter(apt_file.index))
+        parsed = apt_file.parse(ident)
+
+    by_class = {}
+    for name in VALID_FEATURES + RECORD_FAMILIES:
+        value = getattr(parsed, name)
+        for feature in value if isinstance(value, list) else [value]:
+            if dataclasses.is_dataclass(feature):
+                by_class.setdefault(type(feature), []).append(feature)
+
+    def bytes_per_copy(copy, features):
+        gc.collect()
+        tracemalloc.start()
+        copies = [copy(feature) for feature in features]
+        traced, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return (traced - sys.getsizeof(copies)) / len(copies)
+
+    report = {"airport": ident, "classes": {}}
+    totals = {"features": 0, "slotted_bytes": 0.0, "plain_bytes": 0.0}
+    for cls, features in by_class.items():
+        names = [n for klass in cls.__mro__ for n in getattr(klass, "__slots__", ()) if n != "__weakref__"]
+        plain_cls = dataclasses.make_dataclass(cls.__name__, names)
+
+        def slotted_copy(feature, cls=cls, names=names):
+            copy = object.__new__(cls)
+            for n in names:
+                if hasattr(feature, n):
+                    object.__setattr__(copy, n, getattr(feature, n))
+            return copy
+
+        slotted = bytes_per_copy(slotted_copy, features)
+        plain = bytes_per_copy(lambda f, p=plain_cls, n=names: p(**{k: getattr(f, k, None) for k in n}), features)
+        report["classes"][cls.__name__] = {
+            "features": len(features), "slotted_bytes": slotted, "plain_bytes": plain, "ratio": plain / slotted}
+        totals["features"] += len(features)
+        totals["slotted_bytes"] += slotted * len(features)
+        totals["plain_bytes"] += plain * len(features)
+
+    if totals["features"]:
+        report["slotted_bytes_per_feature"] = totals["slotted_bytes"] / totals["features"]
+        report["plain_bytes_per_feature"] = totals["plain_bytes"] / totals["features"]
+    report.update(totals)
+    return report
+
+
+def replicated_apt(apt_path: str, copies: int, output_path: str, ident: Optional[str] = None) -> str:
+    """Write an apt.dat file holding `copies` copies of one airport of `apt_path`.
+
+    Copies are renamed X0000, X0001... in their header row, so every one is a distinct
+    airport to the index and the bulk converter. Returns `output_path`.
+    """
+    index = AptIndex.open(apt_path)
+    ident = ident if ident is not None else next(iter(index))
+    block = index.read_bytes(ident)
+    header, rest = block.split(b"\n", 1)
+    tokens = header.split(None, 5)
+
+    with open(apt_path, "rb") as f:
+        preamble = f.readline() + f.readline()
+
+    with open(output_path, "wb") as f:
+        f.write(preamble + b"\n")
+        for i in range(copies):
+            copy = tokens[:4] + [f"X{i:04d}".encode()] + tokens[5:]
+            f.write(b" ".join(copy) + b"\n" + rest.rstrip(b"\n") + b"\n\n")
+        f.write(b"99\n")
+    return output_path
+
+
+def bulk_scaling(
+    apt_path: str,
+    copies: int = 64,
+    worker_counts: Optional[list[int]] = None,
+    output_format: str = "pickle",
+) -> dict:
+    """Convert `copies` copies of the first airport of `apt_path` with `bulk.convert_all`,
+    once per number of workers, and report airports per second for each.
+
+    `speedup` is relative to the first worker count. Default worker counts are 1, 2, 4...
+    up to `os.cpu_count()`.
+    """
+    from bulk import convert_all
+
+    if worker_counts is None:
+        n_cpus = os.cpu_count() or 1
+        worker_counts = sorted({min(2 ** k, n_cpus) for k in range(n_cpus.bit_length() + 1)})
+
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = replicated_apt(apt_path, copies, os.path.join(tmp, "apt.dat"))
+        AptIndex.open(path)  # index once, outside the timings
+
+        for workers in worker_counts:
+            t0 = time.perf_counter()
+            results = convert_all(path, os.path.join(tmp, f"out-{workers}"), output_format, workers=workers)
+            seconds = time.perf_counter() - t0
+            n_ok = sum(r.ok for r in results)
+            runs.append({
+                "workers": workers,
+                "airports": n_ok,
+                "failed": len(results) - n_ok,
+                "seconds": seconds,
+                "airports_per_second": n_ok / seconds,
+            })
+
+    for run_ in runs:
+        run_["speedup"] = run_["airports_per_second"] / runs[0]["airports_per_second"]
+    return {"copies": copies, "cpu_count": os.cpu_count(), "output_format": output_format, "runs": runs}
+
+
+def _output_bytes(paths: Iterable[str]) -> int:
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+
+def export_throughput(apt_path: str, copies: int = 32) -> dict:
+    """Output MB/s of exporting `copies` copies of the first airport of `apt_path`.
+
+    Every format of `export.EXPORT_FORMATS`, and GeoParquet when pyarrow is installed,
+    is timed end to end with its `export_file`, parse included, and writing alone, with
+    the airport parsed once and handed to the writer `copies` times.
+    """
+    import export
+
+    try:
+        import geoparquet
+    except ImportError as e:
+        logger.warning(f"Skipping the GeoParquet export: {e}")
+        geoparquet = None
+
+    # format -> (writer of an output directory, export_file of an apt.dat path and output directory)
+    formats = {
+        output_format: (
+            lambda d, f=output_format: export.FeatureStreamWriter(d, f),
+            lambda p, d, f=output_format: export.export_file(p, d, f),
+        )
+        for output_format in export.EXPORT_FORMATS
+    }
+    if geoparquet is not None:
+        formats["geoparquet"] = (geoparquet.GeoParquetWriter, geoparquet.export_file)
+
+    report = {"copies": copies, "formats": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = replicated_apt(apt_path, copies, os.path.join(tmp, "apt.dat"))
+        AptIndex.open(path)  # index once, outside the timings
+        report["input_bytes"] = os.path.getsize(path)
+
+        with MappedAptFile(path) as apt_file:
+            parsed = apt_file.parse(next(iter(apt_file.index)))
+
+        for output_format, (open_writer, export_file) in formats.items():
+            t0 = time.perf_counter()
+            with open_writer(os.path.join(tmp, f"{output_format}-write")) as writer:
+                for _ in range(copies):
+                    writer.write(parsed)
+            write_seconds = time.perf_counter() - t0
+            write_bytes = _output_bytes(writer.path(name) for name in writer.features)
+
+            t0 = time.perf_counter()
+            writer = export_file(path, os.path.join(tmp, output_format))
+            seconds = time.perf_counter() - t0
+            nbytes = _output_bytes(writer.path(name) for name in writer.features)
+
+            report["formats"][output_format] = {
+                "features": writer.n_features,
+                "output_bytes": nbytes,
+                "seconds": seconds,
+                "mb_per_second": nbytes / 1e6 / seconds,
+                "input_mb_per_second": report["input_bytes"] / 1e6 / seconds,
+                "write_seconds": write_seconds,
+                "write_mb_per_second": write_bytes / 1e6 / write_seconds,
+            }
+
+    return report
+
+
+# heavy packages only the functions needing them may import
+_HEAVY_IMPORTS = ("numpy", "rich", "xplane_airports", "pyproj", "tkinter", "pyarrow")
+
+# module -> (cumulative `-X importtime` budget in ms, heavy packages importing it may load).
+# The lookup modules stay within the standard library; the parser needs NumPy.
+IMPORT_BUDGETS = {
+    "log": (20, ()),
+    "index": (30, ()),
+    "manifest": (60, ()),
+    "search": (60, ()),
+    "base": (300, ("numpy",)),
+    "tokenizer": (300, ("numpy",)),
+    "export": (300, ("numpy",)),
+}
+
+
+def import_time(module: str) -> tuple[float, set[str]]:
+    """Cold import of `module` in a fresh interpreter, timed with `-X importtime`.
+
+    Returns:
+        tuple[float, set[str]]: The cumulative import time of `module` in seconds, and
+            the top-level packages imported along with it.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    seconds, imported = None, set()
+    for line in proc.stderr.splitlines():
+        # "import time: <self us> | <cumulative us> | <indented name>"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # the column header
+        imported.add(name.strip().split(".")[0])
+        if name.strip() == module and not name[1:].startswith(" "):
+            seconds = int(cumulative) / 1e6
+
+    return seconds, imported
+
+
+def check_import_budgets(budgets: Optional[dict] = None, rounds: int = 3) -> list[str]:
+    """Modules over their import time budget, or importing heavy packages they should not.
+
+    The fastest of `rounds` cold imports is compared. Also prints one line per module.
+    """
+    failures = []
+    for module, (budget_ms, allowed) in (IMPORT_BUDGETS if budgets is None else budgets).items():
+        times = [import_time(module) for _ in range(rounds)]
+        best = min(seconds for seconds, _ in times) * 1e3
+        heavy = sorted(set(_HEAVY_IMPORTS).intersection(*(imported for _, imported in times)) - set(allowed))
+
+        problems = []
+        if best > budget_ms:
+            problems.append(f"over its {budget_ms} ms budget")
+        if heavy:
+            problems.append(f"imports {', '.join(heavy)}")
+        if problems:
+            failures.append(module)
+
+        print(f"{'import ' + module:<48} {best:10.3f} ms  (budget {budget_ms} ms){'  ' + ', '.join(problems) if problems else ''}")
+
+    return failures
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark parsing, tessellation, triangulation, runway construction and reprojection.")
+    parser.add_argument("--apt", default="apt.dat", help="apt.dat file whose first airport is benchmarked")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--quick", action="store_true", help="leave out the 100k node airport and use 3 rounds")
+    parser.add_argument("-k", "--filter", default=None, dest="name_filter",
+                        help="only run benchmarks whose name contains this")
+    parser.add_argument("--storage", default=_DEFAULT_STORAGE, help="directory results are saved to")
+    parser.add_argument("--save", action="store_true", help="save the results into the storage directory")
+    parser.add_argument("--compare", default=None,
+                        help='results file to compare against, or "latest" for the last saved one')
+    parser.add_argument("--threshold", type=float, default=_DEFAULT_THRESHOLD,
+                        help="slowdown of the fastest round counted as a regression. Default 0.10")
+    parser.add_argument("--imports", action="store_true",
+                        help="only check the cold import times against IMPORT_BUDGETS")
+    parser.add_argument("--bulk", type=int, default=None, metavar="COPIES",
+                        help="only convert COPIES copies of the first airport of --apt with 1, 2, 4... "
+                             "workers and print airports/s for each")
+    parser.add_argument("--export", type=int, default=None, metavar="COPIES",
+                        help="only export COPIES copies of the first airport of --apt in every format and "
+                             "print MB/s for each")
+    parser.add_argument("--tokenizer-memory", action="store_true",
+                        help="only split the whole --apt file into rows and print rows/s and memory peaks")
+    parser.add_argument("--columnar", action="store_true",
+                        help="only print the memory and speed of list against columnar coordinate storage "
+                             "for the first airport of --apt")
+    parser.add_argument("--tessellation-vertices", action="store_true",
+                        help="only print the vertices of adaptive against fixed resolution tessellation of "
+                             "the first airport of --apt at the same maximum deviations")
+    parser.add_argument("--feature-memory", action="store_true",
+                        help="only print bytes per parsed feature of the first airport of --apt, as "
+                             "slotted against plain dataclasses")
+    parser.add_argument("--triangulation", action="store_true",
+                        help="only triangulate every pavement and boundary of --apt and print the throughput")
+    parser.add_argument("--checks", action="store_true",
+                        help="only run the correctness checks of checks.py on the first airport of --apt")
+    args = parser.parse_args(argv)
+
+    if args.imports:
+        failures = check_import_budgets()
+        if failures:
+            print(f"{len(failures)} modules over budget: {', '.join(failures)}")
+            return 1
+        return 0
+
+    # the parser logs every airport at INFO
+    configure_logging(logging.WARNING)
+
+    if args.tokenizer_memory:
+        print(json.dumps(tokenizer_memory(args.apt), indent=1))
+        return 0
+
+    if args.bulk is not None:
+        print(json.dumps(bulk_scaling(args.apt, args.bulk), indent=1))
+        return 0
+
+    if args.columnar:
+        print(json.dumps(columnar_storage(args.apt), indent=1))
+        return 0
+
+    if args.tessellation_vertices:
+        print(json.dumps(tessellation_vertices(args.apt), indent=1))
+        return 0
+
+    if args.feature_memory:
+        print(json.dumps(feature_memory(args.apt), indent=1))
+        return 0
+
+    if args.export is not None:
+        print(json.dumps(export_throughput(args.apt, args.export), indent=1))
+        return 0
+
+    if args.triangulation:
+        print(json.dumps(triangulation_throughput(args.apt), indent=1))
+        return 0
+
+    if args.checks:
+        from checks import main as run_checks
+
+        return run_checks(["--apt", args.apt] + (["-k", args.name_filter] if args.name_filter else []))
+
+    baseline = None
+    if args.compare is not None:
+        path = latest(args.storage) if args.compare == "latest" else args.compare
+        if path is None:
+            print(f"No saved results in {args.storage} to compare against.", file=sys.stderr)
+            return 2
+        with open(path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    sizes = tuple(s for s in SYNTHETIC_SIZES if s < 100_000) if args.quick else SYNTHETIC_SIZES
+    rounds = 3 if args.quick else args.rounds
+    results = run(collect(args.apt, sizes, rounds), args.name_filter)
+
+    for name, result in results["benchmarks"].items():
+        throughput = f", {result['rows_per_second'] / 1e6:.2f}M rows/s" if "rows_per_second" in result else ""
+        print(f"{name:<48} {result['median'] * 1e3:10.3f} ms  (min {result['min'] * 1e3:.3f}, "
+              f"stdev {result['stdev'] * 1e3:.3f}, {result['rounds']}x{result['calls_per_round']}{throughput})")
+
+    if args.save:
+        print(f"Saved {save(results, args.storage)}")
+
+    if baseline is not None:
+        print()
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions above {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import pickle
+import time
+import traceback
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+
+from base import PARSER_VERSION, ParsedAirport, _DEFAULT_BEZIER_RESOLUTION
+from export import write_airport
+from index import AptIndex, xplane_airport_class
+from log import configure_logging
+from manifest import Manifest
+from stats import ParseStats, StatsAggregate
+
+
+logger = logging.getLogger("xplane_apt_convert")
+
+_DEFAULT_CHUNK_SIZE = 16
+
+
+def _write_pickle(airport: ParsedAirport, output_dir: str) -> str:
+    path = os.path.join(output_dir, f"{airport.id}.pkl")
+    with open(path, "wb") as f:
+        pickle.dump(airport, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _write_geojson(airport: ParsedAirport, output_dir: str) -> str:
+    path = os.path.join(output_dir, f"{airport.id}.geojson")
+    write_airport(airport, path, "geojson")
+    return path
+
+
+def _write_ndjson(airport: ParsedAirport, output_dir: str) -> str:
+    path = os.path.join(output_dir, f"{airport.id}.ndjson")
+    write_airport(airport, path, "ndjson")
+    return path
+
+
+# output format name -> function writing one parsed airport into a directory, returning the path written
+WRITERS: dict[str, Callable[[ParsedAirport, str], str]] = {
+    "pickle": _write_pickle,
+    "geojson": _write_geojson,
+    "ndjson": _write_ndjson,
+}
+
+
+@dataclass
+class ConversionResult:
+    ident: str
+    ok: bool
+    seconds: float
+    output: Optional[str] = None
+    error: Optional[str] = None
+    stats: Optional[ParseStats] = None
+
+
+def _convert_chunk(
+    path: str,
+    chunk: list[tuple[str, int, int]],
+    output_dir: str,
+    output_format: str,
+    bezier_resolution: int,
+    xplane_version: int,
+) -> list[ConversionResult]:
+    """Worker entry point: parse and write every airport of `chunk`.
+
+    Failures are caught per airport so one bad record block does not take the
+    rest of the chunk down with it.
+    """
+    Airport = xplane_airport_class()
+    writer = WRITERS[output_format]
+    results = []
+
+    with open(path, "rb") as f:
+        for ident, start, length in chunk:
+            t0 = time.perf_counter()
+            try:
+                f.seek(start)
+                text = f.read(length).decode("utf-8")
+                tokenized = Airport.from_str(text, path, xplane_version)
+                tokenize_seconds = time.perf_counter() - t0
+
+                airport = ParsedAirport(tokenized, bezier_resolution=bezier_resolution)
+                airport.stats.add_time("tokenize", tokenize_seconds)
+                with airport.stats.stage("export"):
+                    output = writer(airport, output_dir)
+            except Exception:
+                results.append(ConversionResult(
+                    ident, False, time.perf_counter() - t0, error=traceback.format_exc()))
+            else:
+                results.append(ConversionResult(
+                    ident, True, time.perf_counter() - t0, output=output, stats=airport.stats))
+
+    return results
+
+
+def _remove_output(output: Optional[str]) -> None:
+    if output is None:
+        return
+    try:
+        os.remove(output)
+    except OSError:
+        pass
+
+
+def _init_worker(log_level: int, track_memory: bool) -> None:
+    logger.setLevel(log_level)
+    if track_memory:
+        tracemalloc.start()
+
+
+def _chunks(index: AptIndex, idents: list[str], chunk_size: int) -> Iterator[list[tuple[str, int, int]]]:
+    for i in range(0, len(idents), chunk_size):
+        yield [(ident, *index.entries[ident]) for ident in idents[i:i + chunk_size]]
+
+
+def convert_all(
+    path: str,
+    output_dir: str,
+    output_format: str = "pickle",
+    bezier_resolution: int = _DEFAULT_BEZIER_RESOLUTION,
+    workers: Optional[int] = None,
+    chunk_size: int = _DEFAULT_CHUNK_SIZE,
+    idents: Optional[list[str]] = None,
+    progress: Optional[Callable[[ConversionResult], None]] = None,
+    worker_log_level: int = logging.WARNING,
+    manifest_path: Optional[str] = None,
+    stats_path: Optional[str] = None,
+    track_memory: bool = False,
+) -> list[ConversionResult]:
+    """Parse every airport of an apt.dat file in parallel and write each one to disk.
+
+    The file is split into per-airport byte ranges using its `AptIndex`. Ranges
+    are grouped into chunks of `chunk_size` airports and handed to a process pool.
+    Each worker reads only its own slices and writes its outputs as it finishes.
+
+    Args:
+        path (str): Path to the apt.dat file.
+        output_dir (str): Directory to write outputs to. Created if needed.
+        output_format (str): One of `WRITERS`. Default "pickle".
+        bezier_resolution (int): Number of points to use to plot Bezier curves.
+        workers (int): Number of worker processes. Default `os.cpu_count()`.
+        chunk_size (int): Number of airports per task sent to a worker. Default 16.
+        idents (list[str]): Only convert these airports. Default all. Idents missing from
+            the file come back as failed results.
+        progress (callable): Called with each `ConversionResult` as it comes in.
+        worker_log_level (int): Log level of the parser inside workers. Default WARNING.
+        manifest_path (str): Incremental mode. Only airports whose record block was added
+            or changed since the manifest at this path are converted, the outputs of removed
+            airports are deleted, and the manifest is updated. Failed airports are left out
+            of it so they are retried on the next run. Default None, convert everything.
+        stats_path (str): Write the `StatsAggregate` of the parse stats of every converted
+            airport to this JSON file, slowest airports included. Default None.
+        track_memory (bool): Trace allocations in the workers to record the memory peak
+            of each parse. Slows conversion down several times. Default False.
+
+    Returns:
+        list[ConversionResult]: One result per airport, failed ones included. When a
+            worker process dies, every airport of the chunk it held fails.
+    """
+    if output_format not in WRITERS:
+        raise ValueError(f"Unknown output format {output_format}. Valid formats: {', '.join(WRITERS)}.")
+
+    index = AptIndex.open(path)
+    idents = list(index) if idents is None else idents
+    unknown = [ident for ident in idents if ident not in index.entries]
+    idents = [ident for ident in idents if ident in index.entries]
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest = previous = None
+    if manifest_path is not None:
+        settings = {
+            "parser_version": PARSER_VERSION,
+            "bezier_resolution": bezier_resolution,
+            "output_format": output_format,
+            "output_dir": os.path.abspath(output_dir),
+        }
+        manifest = Manifest.from_apt(path, settings, index)
+        previous = Manifest.load(manifest_path)
+        diff = manifest.diff(previous)
+        logger.info(f"Changes since {manifest_path}: {diff}.")
+
+        if previous is not None:
+            for ident in diff.removed:
+                _remove_output(previous.outputs.get(ident))
+            # changed airports are rewritten in place, so only unchanged outputs carry over as is
+            manifest.outputs = {i: previous.outputs[i] for i in diff.unchanged if i in previous.outputs}
+
+        wanted = set(idents)
+        idents = [ident for ident in diff.to_process if ident in wanted]
+
+    logger.info(f"Converting {len(idents)} airports from {path}.")
+
+    results = [ConversionResult(ident, False, 0.0, error=f"No airport {ident} in {path}.") for ident in unknown]
+    for result in results:
+        logger.error(f"Failed to convert {result.ident}:\n{result.error}")
+        if progress is not None:
+            progress(result)
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(worker_log_level, track_memory)
+    ) as executor:
+        futures = {
+            executor.submit(
+                _convert_chunk,
+                path,
+                chunk,
+                output_dir,
+                output_format,
+                bezier_resolution,
+                index.xplane_version,
+            ): chunk
+            for chunk in _chunks(index, idents, chunk_size)
+        }
+
+        for future in as_completed(futures):
+            try:
+                chunk_results = future.result()
+            except Exception as e:
+                # the worker died (BrokenProcessPool after a crash or an OOM kill): fail its
+                # whole chunk, and keep what the other chunks converted
+                error = f"Worker failed on this chunk: {type(e).__name__}: {e}"
+                chunk_results = [ConversionResult(ident, False, 0.0, error=error) for ident, _, _ in futures[future]]
+
+            for result in chunk_results:
+                if not result.ok:
+                    logger.error(f"Failed to convert {result.ident}:\n{result.error}")
+
+                if progress is not None:
+                    progress(result)
+
+                results.append(result)
+
+    if manifest is not None:
+        done = {r.ident: r.output for r in results if r.ok}
+        manifest.outputs.update(done)
+        manifest.hashes = {i: h for i, h in manifest.hashes.items() if i in manifest.outputs}
+        manifest.save(manifest_path)
+
+    if stats_path is not None:
+        aggregate = StatsAggregate()
+        for result in results:
+            if result.stats is not None:
+                aggregate.add(result.stats)
+        aggregate.write_json(stats_path)
+
+    n_failed = sum(not r.ok for r in results)
+    logger.info(f"Converted {len(results) - n_failed} airports, {n_failed} failed.")
+
+    return results
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    from rich.progress import Progress
+
+    parser = argparse.ArgumentParser(description="Convert every airport of an apt.dat file.")
+    parser.add_argument("path", help="apt.dat file")
+    parser.add_argument("output_dir", help="directory to write the converted airports to")
+    parser.add_argument("--format", default="pickle", choices=sorted(WRITERS), dest="output_format")
+    parser.add_argument("--bezier-resolution", type=int, default=_DEFAULT_BEZIER_RESOLUTION)
+    parser.add_argument("--workers", type=int, default=None, help="default: number of CPUs")
+    parser.add_argument("--chunk-size", type=int, default=_DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--ident", action="append", dest="idents", help="only convert this airport (repeatable)")
+    parser.add_argument("--manifest", default=None, dest="manifest_path",
+                        help="only convert airports changed since the run that wrote this manifest, then update it")
+    parser.add_argument("--stats", default=None, dest="stats_path",
+                        help="write aggregate parse stats, slowest airports included, to this JSON file")
+    parser.add_argument("--track-memory", action="store_true", help="record the memory peak of each parse (slow)")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    n_airports = len(args.idents) if args.idents else len(AptIndex.open(args.path))
+    if args.manifest_path is not None:
+        n_airports = None  # only known once the file is compared against the manifest
+
+    with Progress() as progress_bar:
+        task = progress_bar.add_task("Converting", total=n_airports)
+        results = convert_all(
+            args.path,
+            args.output_dir,
+            output_format=args.output_format,
+            bezier_resolution=args.bezier_resolution,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            idents=args.idents,
+            progress=lambda _: progress_bar.advance(task),
+            manifest_path=args.manifest_path,
+            stats_path=args.stats_path,
+            track_memory=args.track_memory,
+        )
+
+    return 0 if all(r.ok for r in results) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
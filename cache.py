@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+from typing import Optional, Sequence
+
+from base import PARSER_VERSION, ParsedAirport, _DEFAULT_BEZIER_RESOLUTION
+from index import xplane_airport_class
+
+
+logger = logging.getLogger("xplane_apt_convert")
+
+_CACHE_FORMAT_VERSION = 2
+_CACHE_SUFFIX = ".pkl"
+_DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def default_cache_dir() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "xplane_apt_convert")
+
+
+class AirportCache:
+    """On-disk cache of fully parsed airports.
+
+    Entries are keyed by the SHA-256 of the airport's apt.dat record block together
+    with `PARSER_VERSION` and every `ParsedAirport` option that changes what is parsed,
+    so any change to the source text, the parser or the options misses the cache.
+    Airports are stored as versioned pickles of their columnar form, whose coordinates
+    are a few numpy arrays per feature class, and unpacked to plain lists on load when
+    `columnar=False` is asked for.
+
+    The cache is bounded to `max_bytes`. Every hit refreshes the entry's mtime and
+    the least recently used entries are evicted first.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = _DEFAULT_MAX_BYTES) -> None:
+        self.directory = directory if directory is not None else default_cache_dir()
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(
+        text: bytes,
+        bezier_resolution: int = _DEFAULT_BEZIER_RESOLUTION,
+        bezier_tolerance: Optional[float] = None,
+        lod_tolerances: Sequence[float] = (),
+        features: Optional[Sequence[str]] = None,
+        triangulate: bool = False,
+    ) -> str:
+        # the layout is not part of the key: entries are always columnar
+        options = {
+            "parser_version": PARSER_VERSION,
+            "bezier_resolution": bezier_resolution,
+            "bezier_tolerance": bezier_tolerance,
+            "lod_tolerances": [float(t) for t in lod_tolerances],
+            # the order features are asked in does not change the parse
+            "features": None if features is None else sorted(set(features)),
+            "triangulate": bool(triangulate),
+        }
+        digest = hashlib.sha256(text)
+        digest.update(b"\0" + json.dumps(options, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + _CACHE_SUFFIX)
+
+    def get(self, key: str) -> Optional[ParsedAirport]:
+        path = self._path(key)
+
+        try:
+            with open(path, "rb") as f:
+                format_version, parser_version, airport = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache entry {path}: {e}")
+            self._remove(path)
+            return None
+
+        if format_version != _CACHE_FORMAT_VERSION or parser_version != PARSER_VERSION:
+            self._remove(path)
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return airport
+
+    def put(self, key: str, airport: ParsedAirport) -> None:
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+
+        with open(tmp, "wb") as f:
+            pickle.dump(
+                (_CACHE_FORMAT_VERSION, PARSER_VERSION, airport), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+        self.evict()
+
+    def parse(
+        self,
+        text: bytes,
+        bezier_resolution: int = _DEFAULT_BEZIER_RESOLUTION,
+        columnar: bool = False,
+        bezier_tolerance: Optional[float] = None,
+        lod_tolerances: Sequence[float] = (),
+        features: Optional[Sequence[str]] = None,
+        triangulate: bool = False,
+    ) -> ParsedAirport:
+        """Parse the apt.dat text of a single airport, going through the cache.
+
+        Args:
+            text (bytes): The airport's apt.dat record block.
+            bezier_resolution, bezier_tolerance, lod_tolerances, features, triangulate:
+                As in `ParsedAirport`, and all part of the cache key.
+            columnar (bool): As in `ParsedAirport`. Default False, so that a cached airport
+                has the same plain list coordinates as one parsed without a cache.
+        """
+        options = dict(
+            bezier_resolution=bezier_resolution,
+            bezier_tolerance=bezier_tolerance,
+            lod_tolerances=tuple(lod_tolerances),
+            features=features,
+            triangulate=triangulate,
+        )
+        key = self.key(text, **options)
+
+        airport = self.get(key)
+        if airport is None:
+            airport = ParsedAirport(xplane_airport_class().from_str(text.decode("utf-8")), columnar=True, **options)
+            self.put(key, airport)
+
+        if not columnar:
+            airport._unpack_geometry()
+        return airport
+
+    def _entries(self) -> list[os.DirEntry]:
+        with os.scandir(self.directory) as it:
+            return [e for e in it if e.name.endswith(_CACHE_SUFFIX) and e.is_file()]
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache fits in `max_bytes`."""
+        entries = [(e.stat().st_mtime_ns, e.stat().st_size, e.path) for e in self._entries()]
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+
+            self._remove(path)
+            total -= size
+
+    def clear(self) -> None:
+        for entry in self._entries():
+            self._remove(entry.path)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
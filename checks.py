@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import math
+import os
+import pickle
+import random
+import shutil
+import sys
+import tempfile
+from typing import Callable, Optional
+
+import numpy as np
+
+from base import RECORD_FAMILIES, VALID_FEATURES, ParsedAirport
+from export import iter_features
+from geometry import signed_area
+from index import AptIndex, xplane_airport_class
+from log import configure_logging
+from triangulation import triangle_areas
+
+
+logger = logging.getLogger("xplane_apt_convert")
+
+# relative differences allowed between two computations of the same quantity
+_AREA_TOLERANCE = 1e-6
+_DISTANCE_TOLERANCE = 1e-9
+
+_TAXI_GRID = 12  # nodes per side of the synthetic taxi network
+_TAXI_PAIRS = 200
+
+GEOJSON_TYPES = {"boundary": "Polygon", "pavements": "Polygon", "runways": "LineString", "linear_features": "LineString"}
+
+
+class CheckError(AssertionError):
+    """A check found the parser's output to disagree with itself or its format."""
+
+
+def _expect(condition: bool, message: str) -> None:
+    if not condition:
+        raise CheckError(message)
+
+
+def _first_ident(apt_path: str) -> str:
+    return next(iter(AptIndex.open(apt_path)))
+
+
+def _taxi_network_key(network) -> Optional[tuple]:
+    if network is None:
+        return None
+    return (network.node_ids.tolist(), network.coords.tolist(), network.edge_nodes.tolist(), network.edge_names)
+
+
+def _families_equal(a: ParsedAirport, b: ParsedAirport, names) -> list[str]:
+    """Names of the feature classes and record families that differ between two parses."""
+    different = []
+    for name in names:
+        if name == "taxi_network":
+            same = _taxi_network_key(a.taxi_network) == _taxi_network_key(b.taxi_network)
+        else:
+            same = getattr(a, name) == getattr(b, name)
+        if not same:
+            different.append(name)
+    return different
+
+
+def check_pickle_round_trip(apt_path: str, ident: str) -> None:
+    """Eager and lazy parses come back from pickle with the same features and metadata."""
+    index = AptIndex.open(apt_path)
+    reference = ParsedAirport(index.airport(ident))
+
+    for lazy in (False, True):
+        airport = ParsedAirport(index.airport(ident), lazy=lazy)
+        copy = pickle.loads(pickle.dumps(airport))
+        _expect(copy.id == reference.id, f"pickled id {copy.id} is not {reference.id} (lazy={lazy})")
+        _expect(copy.metadata == reference.metadata, f"pickled metadata differs (lazy={lazy})")
+        different = _families_equal(copy, reference, VALID_FEATURES + RECORD_FAMILIES)
+        _expect(not different, f"pickled {', '.join(different)} differ (lazy={lazy})")
+
+
+def check_feature_subsets(apt_path: str, ident: str) -> None:
+    """Parsing one feature class at a time gives it as in a full parse, and leaves the rest empty."""
+    index = AptIndex.open(apt_path)
+    full = index.parse(ident)
+
+    for name in VALID_FEATURES + RECORD_FAMILIES:
+        subset = index.parse(ident, features=[name])
+        _expect(not _families_equal(subset, full, [name]), f"{name} differs when parsed alone")
+
+        for other in VALID_FEATURES + RECORD_FAMILIES:
+            value = getattr(subset, other)
+            _expect(other == name or not value, f"{other} is not empty when only {name} is parsed")
+
+
+def check_triangle_areas(apt_path: str, ident: str) -> None:
+    """The triangles of every pavement and boundary cover the shoelace area of its rings."""
+    airport = AptIndex.open(apt_path).parse(ident)
+    polygons = list(airport.pavements) + ([airport.boundary] if airport.boundary is not None else [])
+
+    for polygon in polygons:
+        rings = [np.asarray(ring, dtype=np.float64).reshape(-1, 2) for ring in polygon.coordinates]
+        expected = abs(signed_area(rings[0])) - sum(abs(signed_area(ring)) for ring in rings[1:])
+        area = triangle_areas(np.concatenate(rings), polygon.triangulate()).sum()
+        _expect(
+            math.isclose(area, expected, rel_tol=_AREA_TOLERANCE),
+            f"triangles of {polygon.name!r} cover {area:.6g} deg², its rings {expected:.6g} deg²",
+        )
+
+
+def synthetic_taxi_rows(lat: float, lon: float, size: int = _TAXI_GRID, seed: int = 0) -> str:
+    """1201/1202/1204 rows of a jittered `size` x `size` grid of taxi routes around (lat, lon).
+
+    About a fifth of the edges are one way, the first row of the grid is a runway with
+    an active zone, and edges are restricted to a random aircraft size class. The same
+    arguments always give the same rows.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for i in range(size):
+        for j in range(size):
+            node_lat = lat + 4e-4 * i + rng.uniform(-1e-4, 1e-4)
+            node_lon = lon + 4e-4 * j + rng.uniform(-1e-4, 1e-4)
+            rows.append(f"1201 {node_lat:.8f} {node_lon:.8f} both {i * size + j} N{i}_{j}")
+
+    for i in range(size):
+        for j in range(size):
+            node = i * size + j
+            for neighbour in ((node + 1) if j + 1 < size else None, (node + size) if i + 1 < size else None):
+                if neighbour is None or rng.random() < 0.1:
+                    continue
+                direction = "oneway" if rng.random() < 0.2 else "twoway"
+                if i == 0 and neighbour == node + 1:
+                    rows.append(f"1202 {node} {neighbour} {direction} runway 09/27")
+                    rows.append("1204 departure 09,27")
+                else:
+                    kind = f"taxiway_{rng.choice('ABCDEF')}"
+                    rows.append(f"1202 {node} {neighbour} {direction} {kind} T{i}{j}")
+
+    return "\n".join(rows) + "\n"
+
+
+def check_taxi_routes(apt_path: str, ident: str) -> None:
+    """A* routes are as long as the Dijkstra shortest path trees say, under every restriction.
+
+    The network is a synthetic grid added to the airport's record block, so that airports
+    without taxi routes are covered too.
+    """
+    index = AptIndex.open(apt_path)
+    lat, lon = index.airport(ident).latitude, index.airport(ident).longitude
+    text = index.read_text(ident).rstrip("\n") + "\n" + synthetic_taxi_rows(lat, lon)
+    network = ParsedAirport(xplane_airport_class().from_str(text), features=["taxi_network"]).taxi_network
+    _expect(network is not None and network.n_edges > 0, "no taxi network parsed from the synthetic rows")
+
+    rng = random.Random(0)
+    node_ids = network.node_ids.tolist()
+    pairs = [(rng.choice(node_ids), rng.choice(node_ids)) for _ in range(_TAXI_PAIRS)]
+    for restrictions in ({}, {"allow_runways": False}, {"size": "C"}):
+        # A* first: once a target has its tree, `route` answers from it
+        searched = [network.route(source, target, **restrictions) for source, target in pairs]
+        for (source, target), route in zip(pairs, searched):
+            tree_route = network.routes_to(target, **restrictions).route(source)
+            _expect((route is None) == (tree_route is None),
+                    f"A* and Dijkstra disagree on whether {target} can be reached from {source} {restrictions}")
+            if route is not None:
+                _expect(
+                    math.isclose(route.distance, tree_route.distance, rel_tol=_DISTANCE_TOLERANCE, abs_tol=1e-6),
+                    f"A* route {source} -> {target} {restrictions} is {route.distance:.3f} m, "
+                    f"Dijkstra {tree_route.distance:.3f} m",
+                )
+
+
+def _check_position(position, where: str) -> None:
+    _expect(len(position) == 2 and all(isinstance(v, float) and math.isfinite(v) for v in position),
+            f"{where}: position {position} is not two finite numbers")
+    lon, lat = position
+    _expect(-180 <= lon <= 180 and -90 <= lat <= 90, f"{where}: position {position} is out of range")
+
+
+def check_geojson(apt_path: str, ident: str) -> None:
+    """Exported features are valid RFC 7946 GeoJSON: closed, oriented rings of finite positions."""
+    airport = AptIndex.open(apt_path).parse(ident)
+
+    for n, (name, feature) in enumerate(iter_features(airport)):
+        where = f"{name} feature {n}"
+        json.dumps(feature, allow_nan=False)
+        geometry = feature["geometry"]
+        _expect(feature["type"] == "Feature" and isinstance(feature["properties"], dict), f"{where}: not a Feature")
+        _expect(geometry["type"] == GEOJSON_TYPES.get(name, "Point"), f"{where}: unexpected {geometry['type']}")
+
+        if geometry["type"] == "Point":
+            _check_position(geometry["coordinates"], where)
+        elif geometry["type"] == "LineString":
+            _expect(len(geometry["coordinates"]) >= 2, f"{where}: fewer than two positions")
+            for position in geometry["coordinates"]:
+                _check_position(position, where)
+        else:
+            _expect(len(geometry["coordinates"]) >= 1, f"{where}: no rings")
+            for k, ring in enumerate(geometry["coordinates"]):
+                _expect(len(ring) >= 4 and ring[0] == ring[-1], f"{where}: ring {k} is not a closed ring")
+                for position in ring:
+                    _check_position(position, where)
+                # exterior counterclockwise, holes clockwise
+                _expect((signed_area(ring) > 0) == (k == 0), f"{where}: ring {k} is wound the wrong way")
+
+
+def check_search_refresh(apt_path: str, ident: str) -> None:
+    """The search index picks up added, changed, renamed and removed airports on refresh."""
+    from search import AirportSearch
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, os.path.basename(apt_path))
+        shutil.copyfile(apt_path, path)
+
+        def refreshed():
+            search = AirportSearch(path)
+            try:
+                return search.refresh(), search.get(ident), search.get(renamed)
+            finally:
+                search.close()
+
+        def rewrite(old: bytes, new: bytes) -> None:
+            with open(path, "rb") as f:
+                data = f.read()
+            _expect(old in data, f"{old!r} not found in {path}")
+            with open(path, "wb") as f:
+                f.write(data.replace(old, new, 1))
+
+        # a new ident of the same length, so that only this airport's block changes
+        renamed = ident[:-1] + ("X" if ident[-1] != "X" else "Y")
+        header = AptIndex.open(path).read_bytes(ident).split(b"\n", 1)[0].rstrip(b"\r")
+
+        diff, record, _ = refreshed()
+        _expect(ident in diff.added and record is not None, f"{ident} not added by the first refresh")
+
+        diff, _, _ = refreshed()
+        _expect(not diff.to_process and not diff.removed and ident in diff.unchanged,
+                f"second refresh of an unchanged file gives {diff}")
+
+        rewrite(header, header + b" Renamed")
+        header += b" Renamed"
+        diff, record, _ = refreshed()
+        _expect(diff.changed == [ident] and record.name.endswith("Renamed"),
+                f"changing the name of {ident} gives {diff}")
+
+        rewrite(header, header.replace(ident.encode(), renamed.encode(), 1))
+        diff, record, renamed_record = refreshed()
+        _expect(diff.added == [renamed] and diff.removed == [ident], f"renaming {ident} to {renamed} gives {diff}")
+        _expect(record is None and renamed_record is not None, f"{ident} not replaced by {renamed} in the index")
+
+
+CHECKS: dict[str, Callable[[str, str], None]] = {
+    "pickle_round_trip": check_pickle_round_trip,
+    "feature_subsets": check_feature_subsets,
+    "triangle_areas": check_triangle_areas,
+    "taxi_routes": check_taxi_routes,
+    "geojson": check_geojson,
+    "search_refresh": check_search_refresh,
+}
+
+
+def run_checks(apt_path: str = "apt.dat", ident: Optional[str] = None, name_filter: Optional[str] = None) -> dict:
+    """Run every check of `CHECKS` on one airport of an apt.dat file.
+
+    Args:
+        apt_path (str): apt.dat file. Default the bundled one.
+        ident (str): Airport to check. Default the first one of the file.
+        name_filter (str): Only run the checks whose name contains this.
+
+    Returns:
+        dict: Check name -> None when it passed, or the reason it failed.
+    """
+    ident = _first_ident(apt_path) if ident is None else ident
+    results = {}
+    for name, check in CHECKS.items():
+        if name_filter is not None and name_filter not in name:
+            continue
+        try:
+            check(apt_path, ident)
+        except CheckError as e:
+            results[name] = str(e)
+        else:
+            results[name] = None
+    return results
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Check pickling, feature subsets, triangulation, taxi routing, GeoJSON export and the "
+                    "search index against each other on an apt.dat airport.")
+    parser.add_argument("--apt", default="apt.dat", help="apt.dat file")
+    parser.add_argument("--ident", default=None, help="airport to check. Default the first one of --apt")
+    parser.add_argument("-k", "--filter", default=None, dest="name_filter",
+                        help="only run checks whose name contains this")
+    args = parser.parse_args(argv)
+
+    # the parser logs every airport at INFO
+    configure_logging(logging.WARNING)
+
+    results = run_checks(args.apt, args.ident, args.name_filter)
+    for name, error in results.items():
+        print(f"{name:<24} {'ok' if error is None else 'FAILED: ' + error}")
+
+    failures = [name for name, error in results.items() if error is not None]
+    if failures:
+        print(f"{len(failures)} checks failed: {', '.join(failures)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
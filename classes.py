@@ -1,28 +1,48 @@
+from __future__ import annotations
+
 import math
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum, EnumMeta
 import logging
-from geometry import get_paths
+from geometry import RowCode, get_paths_lods, orient_rings
 from iterators import BIterator
-from math import radians, sin, cos
+from typing import TYPE_CHECKING, Optional, Sequence
+
 
+if TYPE_CHECKING:
+    import numpy as np
 
-try:
+    # rows are either `xplane_airports` lines or `tokenizer.Row`s, which mimic them
     from xplane_airports import AptDat
-except ImportError as e:
-    raise ImportError(
-        "Could not import xplane_airports. Install https://github.com/X-Plane/xplane_airports.") from e
 
 
 logger = logging.getLogger("xplane_apt_convert")
 logged_unknowns = set()  # TODO: this should be reset with each different airport parsing
+_fallbacks = {}  # name -> the shared Fallback instance
+
+
+def _fallback(name):
+    """The one `Fallback` instance standing for unknown values named `name`."""
+    fallback = _fallbacks.get(name)
+    if fallback is None:
+        fallback = _fallbacks[name] = FallbackEnumMeta.Fallback(name)
+    return fallback
 
 
 class FallbackEnumMeta(EnumMeta):
     class Fallback:
+        __slots__ = ("name",)
+
         def __init__(self, name):
             self.name = name
 
+        def __reduce__(self):
+            # unpickle to the shared instance too
+            return _fallback, (self.name,)
+
+        def __repr__(self):
+            return f"<Fallback {self.name}>"
+
     def __call__(cls, value, names=None, *args, **kwargs):
         try:
             return EnumMeta.__call__(cls, value, names=None, *args, **kwargs)
@@ -32,7 +52,7 @@ class FallbackEnumMeta(EnumMeta):
                 raise
 
             if value is None:
-                return FallbackEnumMeta.Fallback(None)
+                return _fallback(None)
             else:
                 if (cls, value) not in logged_unknowns:
                     logger.warning(
@@ -40,7 +60,7 @@ class FallbackEnumMeta(EnumMeta):
                     # do not log same warning many times
                     logged_unknowns.add((cls, value))
 
-                return FallbackEnumMeta.Fallback(f"UNKNOWN_{value}")
+                return _fallback(f"UNKNOWN_{value}")
 
 
 class FallbackEnum(Enum, metaclass=FallbackEnumMeta):
@@ -177,6 +197,35 @@ class SignSize(FallbackEnum):
     SMALL_DISTANCE_REMAINING = 5  # Small distance-remaining sign on runway edg
 
 
+class BeaconType(FallbackEnum):
+    NONE = 0  # No beacon
+    CIVILIAN_AIRPORT = 1  # White-green flashing
+    SEAPLANE_BASE = 2  # White-yellow flashing
+    HELIPORT = 3  # Green-yellow-white flashing
+    MILITARY_AIRPORT = 4  # White-white-green flashing
+
+
+class LightingObjectType(FallbackEnum):
+    VASI = 1  # VASI
+    PAPI_4L = 2  # PAPI-4L on left of runway
+    PAPI_4R = 3  # PAPI-4R on right of runway
+    SPACE_SHUTTLE_PAPI = 4  # Space Shuttle PAPI, 20 degree glidepath
+    TRI_COLOR_VASI = 5  # Tri-colour VASI
+    RUNWAY_GUARD = 6  # Runway guard ("wig-wag") lights, pulsating double amber
+
+
+class FrequencyType(FallbackEnum):
+    # row code modulo 50 of both the legacy 50..57 and the 8.33 kHz 1050..1057 records
+    AWOS = 0  # Recorded weather (AWOS, ASOS or ATIS)
+    CTAF = 1  # Unicom or CTAF (USA), radio (UK)
+    DELIVERY = 2  # Clearance delivery
+    GROUND = 3  # Ground
+    TOWER = 4  # Tower
+    APPROACH = 5  # Approach
+    CENTER = 6  # Departure or center
+    UNICOM = 7  # Unicom (USA) where there is also a CTAF
+
+
 class AptMetadata(dict):
     def add_from_row(self, row: AptDat.AptDatLine):
         tokens = row.tokens
@@ -187,80 +236,152 @@ class AptMetadata(dict):
         self[key] = value
 
 
-@dataclass
-class Boundary():
+def _polygon_rings(coordinates_list, properties_list, lods):
+    """Drop the rings of fewer than three points and orient the others with `orient_rings`.
+
+    Returns:
+        tuple[list, list, dict]: The rings, the (painted, lighting) line types of
+            each ring, and the LOD rings aligned with them.
+    """
+    keep = [len(c) > 2 for c in coordinates_list]
+    rings = orient_rings([c for c, k in zip(coordinates_list, keep) if k])
+    line_types = [
+        (LineType(p.get("painted_line_type")), LineLightingType(p.get("lighting_line_type")))
+        for p, k in zip(properties_list, keep) if k
+    ]
+    lods = {t: orient_rings([c for c, k in zip(lod, keep) if k]) for t, lod in lods.items()}
+    return rings, line_types, lods
+
+
+class _Polygon:
+    """Rings access and triangulation shared by `Boundary` and `Pavement`.
+
+    `coordinates` holds the outer ring first, counterclockwise, then the holes,
+    clockwise. Every ring ends on its first point.
+    """
+
+    __slots__ = ()
+
+    @property
+    def exterior(self):
+        return self.coordinates[0] if len(self.coordinates) else []
+
+    @property
+    def interiors(self) -> list:
+        return list(self.coordinates[1:])
+
+    def triangulate(self) -> np.ndarray:
+        """Ear-clipping triangulation of the polygon, computed on first call and kept in `triangles`.
+
+        Returns:
+            np.ndarray: (T, 3) int32 indices of the vertices of each triangle, counting
+                the points of all rings one after the other, closing points included.
+                See `triangulation.triangulate_rings`.
+        """
+        if self.triangles is None:
+            from triangulation import triangulate_rings
+
+            self.triangles = triangulate_rings(self.coordinates)
+        return self.triangles
+
+
+@dataclass(slots=True)
+class Boundary(_Polygon):
     name: str
     coordinates: list[tuple[float, float]]
+    lods: dict[float, list] = field(default_factory=dict)  # LOD tolerance in metres -> coordinates
+    ring_line_types: list[tuple[LineType, LineLightingType]] = field(default_factory=list)
+    triangles: Optional[np.ndarray] = field(default=None, repr=False, compare=False)
 
     @staticmethod
-    def from_row_iterator(header_row: AptDat.AptDatLine, line_iterator: BIterator, bezier_resolution: int) -> "Boundary":
+    def from_row_iterator(
+        header_row: AptDat.AptDatLine,
+        line_iterator: BIterator,
+        bezier_resolution: int,
+        bezier_tolerance: Optional[float] = None,
+        lod_tolerances: Sequence[float] = (),
+    ) -> "Boundary":
         tokens = header_row.tokens
-        coordinates_list, properties_list = get_paths(
+        coordinates_list, properties_list, lods = get_paths_lods(
             line_iterator,
             bezier_resolution=bezier_resolution,
+            lod_tolerances=lod_tolerances,
             mode="polygon",
+            bezier_tolerance=bezier_tolerance,
         )
-
-        coordinates_list = [c for c in coordinates_list if len(c) > 2]
-        properties_list = [p for c, p in zip(
-            coordinates_list, properties_list) if len(c) > 2]
+        rings, line_types, lods = _polygon_rings(coordinates_list, properties_list, lods)
 
         return Boundary(
             name=" ".join(tokens[1:]),
-            coordinates=coordinates_list,
+            coordinates=rings,
+            lods=lods,
+            ring_line_types=line_types,
         )
 
 
-@dataclass
-class Pavement():
+@dataclass(slots=True)
+class Pavement(_Polygon):
     surface_type: SurfaceType
     smoothness: float
     texture_orientation: float
     name: str
     coordinates: list[tuple[float, float]]
+    lods: dict[float, list] = field(default_factory=dict)  # LOD tolerance in metres -> coordinates
+    ring_line_types: list[tuple[LineType, LineLightingType]] = field(default_factory=list)
+    triangles: Optional[np.ndarray] = field(default=None, repr=False, compare=False)
 
     @staticmethod
     def from_row_iterator(
-        header_row: AptDat.AptDatLine, line_iterator: BIterator, bezier_resolution: int
+        header_row: AptDat.AptDatLine,
+        line_iterator: BIterator,
+        bezier_resolution: int,
+        bezier_tolerance: Optional[float] = None,
+        lod_tolerances: Sequence[float] = (),
     ) -> "Pavement":
         tokens = header_row.tokens
-        coordinates_list, properties_list = get_paths(
+        coordinates_list, properties_list, lods = get_paths_lods(
             line_iterator,
             bezier_resolution=bezier_resolution,
+            lod_tolerances=lod_tolerances,
             mode="polygon",
+            bezier_tolerance=bezier_tolerance,
         )
-
-        coordinates_list = [c for c in coordinates_list if len(c) > 2]
-        properties_list = [p for c, p in zip(
-            coordinates_list, properties_list) if len(c) > 2]
+        rings, line_types, lods = _polygon_rings(coordinates_list, properties_list, lods)
 
         return Pavement(
             surface_type=SurfaceType(int(tokens[1])),
             smoothness=float(tokens[2]),
             texture_orientation=float(tokens[3]),
             name=" ".join(tokens[4:]),
-            coordinates=coordinates_list,
+            coordinates=rings,
+            lods=lods,
+            ring_line_types=line_types,
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class LinearFeature():
     name: str
-    painted_line_type: int
-    lighting_line_type: int
+    painted_line_type: LineType
+    lighting_line_type: LineLightingType
     coordinates: list[tuple[float, float]]
+    lods: dict[float, list] = field(default_factory=dict)  # LOD tolerance in metres -> coordinates
 
     @staticmethod
     def from_row_iterator(
         header_row: AptDat.AptDatLine,
         line_iterator: BIterator,
         bezier_resolution: int,
+        bezier_tolerance: Optional[float] = None,
+        lod_tolerances: Sequence[float] = (),
     ) -> list["LinearFeature"]:
         tokens = header_row.tokens
-        coordinates_list, properties_list = get_paths(
+        coordinates_list, properties_list, lods = get_paths_lods(
             line_iterator,
             bezier_resolution=bezier_resolution,
+            lod_tolerances=lod_tolerances,
             mode="line",
+            bezier_tolerance=bezier_tolerance,
         )
 
         return [
@@ -271,13 +392,14 @@ class LinearFeature():
                 lighting_line_type=LineLightingType(
                     properties.get("lighting_line_type")),
                 coordinates=coordinates,
+                lods={t: lod[i] for t, lod in lods.items()},
             )
-            for coordinates, properties in zip(coordinates_list, properties_list)
+            for i, (coordinates, properties) in enumerate(zip(coordinates_list, properties_list))
             if len(coordinates) > 1
         ]
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class RunwayEnd:
     name: str
     latitude: float
@@ -287,7 +409,7 @@ class RunwayEnd:
     marking: RunwayMarking
     lighting: ApproachLighting
     tdz_lighting: bool  # Touchdown Zone lighting
-    reil: int  # Runway End Identifier Lights
+    reil: RunwayEndIdentifierLights
 
     @staticmethod
     def from_line_tokens(tokens: list[str]) -> "RunwayEnd":
@@ -304,7 +426,7 @@ class RunwayEnd:
         )
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Runway():
     width: float  # in meters
     surface_type: SurfaceType
@@ -340,28 +462,18 @@ class Runway():
         return math.degrees(lat_new_rad), math.degrees(lon_new_rad)
 
     @staticmethod
-    def get_vertices(runway_end, width):
-        end1 = runway_end.ends[0]
-        end2 = runway_end.ends[1]
-
-        lat1, lon1 = end1.latitude, end1.longitude
-        lat2, lon2 = end2.latitude, end2.longitude
-
-        heading1 = Runway.calculate_heading_from_number(end1.name)
-        heading2 = Runway.calculate_heading_from_number(end2.name)
-
-        half_width = width / 2
-        bearing1_1 = (heading1 + 90) % 360
-        bearing1_2 = (heading1 - 90) % 360
-        bearing2_1 = (heading2 + 90) % 360
-        bearing2_2 = (heading2 - 90) % 360
+    def get_vertices(runway, width):
+        """(lat, lon) corners of `runway` if it were `width` metres wide: right then left of
+        end 1, then left then right of end 2, each seen from its end along the runway.
 
-        corner1_1 = self.calculate_vertex(lat1, lon1, half_width, bearing1_1)
-        corner1_2 = self.calculate_vertex(lat1, lon1, half_width, bearing1_2)
-        corner2_1 = self.calculate_vertex(lat2, lon2, half_width, bearing2_1)
-        corner2_2 = self.calculate_vertex(lat2, lon2, half_width, bearing2_2)
+        The sides follow the true bearing between the ends. Use
+        `runway_geometry.runway_polygons` to outline many runways at once.
+        """
+        from runway_geometry import strip_rings
 
-        return corner1_1, corner1_2, corner2_2, corner2_1
+        end1, end2 = runway.ends
+        ring = strip_rings(end1.latitude, end1.longitude, end2.latitude, end2.longitude, -width / 2, width / 2)
+        return tuple((float(lat), float(lon)) for lon, lat in ring[[1, 0, 2, 3]])
 
     def from_line(line: AptDat.AptDatLine) -> "Runway":
         tokens = line.tokens
@@ -381,7 +493,7 @@ class Runway():
         )
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class StartupLocation():
     latitude: float
     longitude: float
@@ -389,10 +501,15 @@ class StartupLocation():
     location_type: str
     airplane_types: str
     name: str
+    # from the 1301 row following the location, if any
+    icao_category: Optional[str] = None  # ICAO aircraft size category, A to F
+    operation_type: Optional[str] = None  # none, general_aviation, airline, cargo or military
+    airlines: Optional[str] = None  # space separated three-letter airline codes
 
     @staticmethod
-    def from_line(line: AptDat.AptDatLine) -> "StartupLocation":
+    def from_line(line: AptDat.AptDatLine, ext_line: Optional[AptDat.AptDatLine] = None) -> "StartupLocation":
         tokens = line.tokens
+        ext_tokens = ext_line.tokens if ext_line is not None else ()
         return StartupLocation(
             latitude=float(tokens[1]),
             longitude=float(tokens[2]),
@@ -400,10 +517,13 @@ class StartupLocation():
             location_type=tokens[4],
             airplane_types=tokens[5],
             name=" ".join(tokens[6:]),
+            icao_category=ext_tokens[1] if len(ext_tokens) > 1 else None,
+            operation_type=ext_tokens[2] if len(ext_tokens) > 2 else None,
+            airlines=" ".join(ext_tokens[3:]) if ext_line is not None else None,
         )
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Windsock():
     latitude: float
     longitude: float
@@ -421,7 +541,7 @@ class Windsock():
         )
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Sign():
     latitude: float
     longitude: float
@@ -439,3 +559,243 @@ class Sign():
             size=SignSize(int(tokens[5])),
             text=tokens[6],
         )
+
+
+@dataclass(slots=True, frozen=True)
+class Helipad():
+    name: str
+    latitude: float
+    longitude: float
+    heading: float
+    length: float  # in meters
+    width: float  # in meters
+    surface_type: SurfaceType
+    marking: int
+    shoulder_surface_type: ShoulderSurfaceType
+    smoothness: float
+    edge_lights: int
+
+    @staticmethod
+    def from_line(line: AptDat.AptDatLine) -> "Helipad":
+        tokens = line.tokens
+        return Helipad(
+            name=tokens[1],
+            latitude=float(tokens[2]),
+            longitude=float(tokens[3]),
+            heading=float(tokens[4]),
+            length=float(tokens[5]),
+            width=float(tokens[6]),
+            surface_type=SurfaceType(int(tokens[7])),
+            marking=int(tokens[8]),
+            shoulder_surface_type=ShoulderSurfaceType(int(tokens[9])),
+            smoothness=float(tokens[10]),
+            edge_lights=int(tokens[11]),
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class WaterRunwayEnd:
+    name: str
+    latitude: float
+    longitude: float
+
+
+@dataclass(slots=True, frozen=True)
+class WaterRunway():
+    width: float  # in meters
+    buoys: bool
+    ends: tuple[WaterRunwayEnd, WaterRunwayEnd]
+
+    @staticmethod
+    def from_line(line: AptDat.AptDatLine) -> "WaterRunway":
+        tokens = line.tokens
+        return WaterRunway(
+            width=float(tokens[1]),
+            buoys=bool(int(tokens[2])),
+            ends=(
+                WaterRunwayEnd(tokens[3], float(tokens[4]), float(tokens[5])),
+                WaterRunwayEnd(tokens[6], float(tokens[7]), float(tokens[8])),
+            ),
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class LightingObject():
+    latitude: float
+    longitude: float
+    lighting_type: LightingObjectType
+    heading: float
+    glideslope: float  # in degrees
+    runway: str
+    description: str
+
+    @staticmethod
+    def from_line(line: AptDat.AptDatLine) -> "LightingObject":
+        tokens = line.tokens
+        return LightingObject(
+            latitude=float(tokens[1]),
+            longitude=float(tokens[2]),
+            lighting_type=LightingObjectType(int(tokens[3])),
+            heading=float(tokens[4]),
+            glideslope=float(tokens[5]),
+            runway=tokens[6],
+            description=" ".join(tokens[7:]),
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class TowerLocation():
+    latitude: float
+    longitude: float
+    height: float  # of the viewpoint above ground, in feet
+    name: str
+
+    @staticmethod
+    def from_line(line: AptDat.AptDatLine) -> "TowerLocation":
+        tokens = line.tokens
+        return TowerLocation(
+            latitude=float(tokens[1]),
+            longitude=float(tokens[2]),
+            height=float(tokens[3]),
+            # tokens[4] is an obsolete placeholder
+            name=" ".join(tokens[5:]),
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class Beacon():
+    latitude: float
+    longitude: float
+    beacon_type: BeaconType
+    name: str
+
+    @staticmethod
+    def from_line(line: AptDat.AptDatLine) -> "Beacon":
+        tokens = line.tokens
+        return Beacon(
+            latitude=float(tokens[1]),
+            longitude=float(tokens[2]),
+            beacon_type=BeaconType(int(tokens[3])),
+            name=" ".join(tokens[4:]),
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class Frequency():
+    frequency_type: FrequencyType
+    frequency: float  # in MHz
+    name: str
+
+    @staticmethod
+    def from_line(line: AptDat.AptDatLine) -> "Frequency":
+        tokens = line.tokens
+        row_code = int(tokens[0])
+        # 50..57 records are in units of 10 kHz, the 8.33 kHz 1050..1057 ones in kHz
+        unit = 1000 if row_code >= 1000 else 100
+        return Frequency(
+            frequency_type=FrequencyType(row_code % 50),
+            frequency=int(tokens[1]) / unit,
+            name=" ".join(tokens[2:]),
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class WindRule:
+    metar_icao: str
+    direction_min: float  # in degrees
+    direction_max: float  # in degrees
+    max_speed: float  # in knots
+
+
+@dataclass(slots=True, frozen=True)
+class CeilingRule:
+    metar_icao: str
+    minimum: float  # in feet above ground
+
+
+@dataclass(slots=True, frozen=True)
+class VisibilityRule:
+    metar_icao: str
+    minimum: float  # in statute miles
+
+
+@dataclass(slots=True, frozen=True)
+class TimeRule:
+    start: str  # zulu time, HHMM
+    end: str  # zulu time, HHMM
+
+
+@dataclass(slots=True, frozen=True)
+class RunwayUseRule:
+    runway: str
+    frequency: float  # in MHz, of the arrival or departure controller
+    operations: tuple[str, ...]  # of arrivals and departures
+    aircraft_types: tuple[str, ...]  # of heavy, jets, turboprops, props and helos
+    on_course_heading: tuple[float, float]  # range of departure on course headings, in degrees
+    assigned_heading: tuple[float, float]  # range of initial ATC assigned departure headings, in degrees
+    name: str
+
+    @staticmethod
+    def from_line(line: AptDat.AptDatLine) -> "RunwayUseRule":
+        tokens = line.tokens
+        unit = 1000 if int(tokens[0]) == RowCode.FLOW_RUNWAY_RULE_CHANNEL else 100
+        return RunwayUseRule(
+            runway=tokens[1],
+            frequency=int(tokens[2]) / unit,
+            operations=tuple(tokens[3].split("|")),
+            aircraft_types=tuple(tokens[4].split("|")),
+            on_course_heading=(float(tokens[5]), float(tokens[6])),
+            assigned_heading=(float(tokens[7]), float(tokens[8])),
+            name=" ".join(tokens[9:]),
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class TrafficFlow():
+    """A traffic flow and its rules. The flow is in use when all of its rules are met."""
+
+    name: str
+    wind_rules: tuple[WindRule, ...] = ()
+    ceiling_rules: tuple[CeilingRule, ...] = ()
+    visibility_rules: tuple[VisibilityRule, ...] = ()
+    time_rules: tuple[TimeRule, ...] = ()
+    runway_rules: tuple[RunwayUseRule, ...] = ()
+    patterns: tuple[tuple[str, str], ...] = ()  # (runway, "left" or "right") of the VFR traffic patterns
+
+    @staticmethod
+    def from_rows(header_row: AptDat.AptDatLine, rule_rows: Sequence[AptDat.AptDatLine]) -> "TrafficFlow":
+        """Build a flow from its 1000 row and the 1001..1110 rows following it."""
+        rules = {
+            RowCode.FLOW_WIND: [],
+            RowCode.FLOW_CEILING: [],
+            RowCode.FLOW_VISIBILITY: [],
+            RowCode.FLOW_TIME: [],
+            RowCode.FLOW_RUNWAY_RULE: [],
+            RowCode.FLOW_PATTERN: [],
+        }
+
+        for row in rule_rows:
+            tokens = row.tokens
+            row_code = int(tokens[0])
+            if row_code == RowCode.FLOW_WIND:
+                rules[row_code].append(WindRule(tokens[1], float(tokens[2]), float(tokens[3]), float(tokens[4])))
+            elif row_code == RowCode.FLOW_CEILING:
+                rules[row_code].append(CeilingRule(tokens[1], float(tokens[2])))
+            elif row_code == RowCode.FLOW_VISIBILITY:
+                rules[row_code].append(VisibilityRule(tokens[1], float(tokens[2])))
+            elif row_code == RowCode.FLOW_TIME:
+                rules[row_code].append(TimeRule(tokens[1], tokens[2]))
+            elif row_code in (RowCode.FLOW_RUNWAY_RULE, RowCode.FLOW_RUNWAY_RULE_CHANNEL):
+                rules[RowCode.FLOW_RUNWAY_RULE].append(RunwayUseRule.from_line(row))
+            elif row_code == RowCode.FLOW_PATTERN:
+                rules[row_code].append((tokens[1], tokens[2]))
+
+        return TrafficFlow(
+            name=" ".join(header_row.tokens[1:]),
+            wind_rules=tuple(rules[RowCode.FLOW_WIND]),
+            ceiling_rules=tuple(rules[RowCode.FLOW_CEILING]),
+            visibility_rules=tuple(rules[RowCode.FLOW_VISIBILITY]),
+            time_rules=tuple(rules[RowCode.FLOW_TIME]),
+            runway_rules=tuple(rules[RowCode.FLOW_RUNWAY_RULE]),
+            patterns=tuple(rules[RowCode.FLOW_PATTERN]),
+        )
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+import numpy as np
+
+
+class RaggedGeometry:
+    """Struct-of-arrays storage for the coordinates of one feature class.
+
+    Every vertex of every feature lives in one contiguous (N, 2) float64 `coords`
+    buffer of (lon, lat) pairs. Two offset arrays, as in GeoArrow or shapely's
+    ragged arrays, describe the nesting:
+
+    - `part_offsets`: (P + 1,) part (ring or line) `i` is `coords[part_offsets[i]:part_offsets[i + 1]]`.
+    - `feature_offsets`: (F + 1,) feature `j` owns parts `feature_offsets[j]:feature_offsets[j + 1]`.
+    """
+
+    def __init__(self, coords: np.ndarray, part_offsets: np.ndarray, feature_offsets: np.ndarray) -> None:
+        self.coords = coords
+        self.part_offsets = part_offsets
+        self.feature_offsets = feature_offsets
+
+    @classmethod
+    def from_parts(cls, features: list[list[list[tuple[float, float]]]]) -> "RaggedGeometry":
+        """Pack a list of features, each a list of parts, each a list of (lon, lat) points."""
+        part_lengths = [len(part) for parts in features for part in parts]
+        n_parts = [len(parts) for parts in features]
+
+        coords = np.array(
+            [c for parts in features for part in parts for c in part], dtype=np.float64
+        ).reshape(-1, 2)
+
+        return cls(
+            coords,
+            np.concatenate(([0], np.cumsum(part_lengths, dtype=np.int64))),
+            np.concatenate(([0], np.cumsum(n_parts, dtype=np.int64))),
+        )
+
+    @classmethod
+    def concatenate(cls, geometries: Sequence["RaggedGeometry"]) -> "RaggedGeometry":
+        """The features of several geometries one after the other, in a single geometry."""
+        if not geometries:
+            return cls(np.empty((0, 2), dtype=np.float64), np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64))
+
+        part_offsets, feature_offsets = [np.zeros(1, dtype=np.int64)], [np.zeros(1, dtype=np.int64)]
+        n_coords = n_parts = 0
+        for g in geometries:
+            part_offsets.append(g.part_offsets[1:] + n_coords)
+            feature_offsets.append(g.feature_offsets[1:] + n_parts)
+            n_coords += len(g.coords)
+            n_parts += g.n_parts
+
+        return cls(
+            np.concatenate([g.coords for g in geometries]).reshape(-1, 2),
+            np.concatenate(part_offsets),
+            np.concatenate(feature_offsets),
+        )
+
+    def __len__(self) -> int:
+        return len(self.feature_offsets) - 1
+
+    @property
+    def n_parts(self) -> int:
+        return len(self.part_offsets) - 1
+
+    @property
+    def nbytes(self) -> int:
+        return self.coords.nbytes + self.part_offsets.nbytes + self.feature_offsets.nbytes
+
+    def part(self, i: int) -> np.ndarray:
+        """(M, 2) view of the coordinates of part `i`."""
+        return self.coords[self.part_offsets[i]:self.part_offsets[i + 1]]
+
+    def feature_parts(self, j: int) -> range:
+        """Indices of the parts of feature `j`."""
+        return range(int(self.feature_offsets[j]), int(self.feature_offsets[j + 1]))
+
+    def feature(self, j: int) -> list[np.ndarray]:
+        return [self.part(i) for i in self.feature_parts(j)]
+
+
+class PartView(Sequence):
+    """Read-only list-of-tuples view of a single part of a `RaggedGeometry`."""
+
+    __slots__ = ("_geometry", "_index")
+
+    def __init__(self, geometry: RaggedGeometry, index: int) -> None:
+        self._geometry = geometry
+        self._index = index
+
+    def __len__(self) -> int:
+        offsets = self._geometry.part_offsets
+        return int(offsets[self._index + 1] - offsets[self._index])
+
+    def __getitem__(self, i):
+        points = self._geometry.part(self._index)[i]
+        if isinstance(i, slice):
+            return list(map(tuple, points.tolist()))
+        return tuple(points.tolist())
+
+    def __iter__(self):
+        return iter(map(tuple, self._geometry.part(self._index).tolist()))
+
+    def __eq__(self, other) -> bool:
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+class FeatureView(Sequence):
+    """Read-only list-of-parts view of a single feature of a `RaggedGeometry`."""
+
+    __slots__ = ("_geometry", "_index")
+
+    def __init__(self, geometry: RaggedGeometry, index: int) -> None:
+        self._geometry = geometry
+        self._index = index
+
+    def __len__(self) -> int:
+        return len(self._geometry.feature_parts(self._index))
+
+    def __getitem__(self, i):
+        parts = self._geometry.feature_parts(self._index)[i]
+        if isinstance(i, slice):
+            return [PartView(self._geometry, p) for p in parts]
+        return PartView(self._geometry, parts)
+
+    def __eq__(self, other) -> bool:
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+def airport_geometry(airport) -> dict[str, RaggedGeometry]:
+    """`RaggedGeometry` of every feature class of a `ParsedAirport`.
+
+    Classes already packed in `airport.geometry` are reused as is. Point features
+    (startup locations, windsocks, signs) become one single-point part each and
+    runways a two-point centerline between their ends.
+    """
+    geometry = dict(airport.geometry or {})
+
+    if "pavements" not in geometry:
+        geometry["pavements"] = RaggedGeometry.from_parts(
+            [pavement.coordinates for pavement in airport.pavements])
+
+    if "linear_features" not in geometry:
+        geometry["linear_features"] = RaggedGeometry.from_parts(
+            [[line.coordinates] for line in airport.linear_features])
+
+    if "boundary" not in geometry:
+        geometry["boundary"] = RaggedGeometry.from_parts(
+            [airport.boundary.coordinates] if airport.boundary is not None else [])
+
+    geometry["runways"] = RaggedGeometry.from_parts(
+        [[[(end.longitude, end.latitude) for end in runway.ends]] for runway in airport.runways])
+
+    for name in ("startup_locations", "windsocks", "signs"):
+        geometry[name] = RaggedGeometry.from_parts(
+            [[[(feature.longitude, feature.latitude)]] for feature in getattr(airport, name)])
+
+    return geometry
@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import json
+import logging
+import os
+import time
+from enum import Enum
+from typing import IO, Iterable, Iterator, Optional
+
+import numpy as np
+
+from base import ParsedAirport, VALID_FEATURES, _DEFAULT_BEZIER_RESOLUTION
+from log import configure_logging
+
+
+logger = logging.getLogger("xplane_apt_convert")
+
+EXPORT_FORMATS = {
+    # format name: file extension
+    "geojson": ".geojson",
+    "ndjson": ".ndjson",
+}
+
+# fields left out of the properties: geometry, and data tied to each ring or vertex
+_GEOMETRY_FIELDS = ("coordinates", "lods", "latitude", "longitude", "ring_line_types", "triangles")
+_JSON_SEPARATORS = (",", ":")
+
+
+def _json_value(value):
+    if isinstance(value, Enum) or type(value).__name__ == "Fallback":
+        return value.name
+    if dataclasses.is_dataclass(value):
+        return {f.name: _json_value(getattr(value, f.name)) for f in dataclasses.fields(value)}
+    if isinstance(value, (list, tuple)):
+        return [_json_value(v) for v in value]
+    return value
+
+
+def feature_properties(feature) -> dict:
+    """JSON-ready properties of a feature record: every field but its geometry, enums by name."""
+    return {
+        f.name: _json_value(getattr(feature, f.name))
+        for f in dataclasses.fields(feature)
+        if f.name not in _GEOMETRY_FIELDS
+    }
+
+
+def _rounded(points, precision: Optional[int]) -> list:
+    coords = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if precision is not None:
+        coords = coords.round(precision)
+    return coords.tolist()
+
+
+def feature_geometry(name: str, feature, precision: Optional[int] = None) -> dict:
+    """GeoJSON geometry of a feature of class `name`, in (lon, lat).
+
+    Args:
+        name (str): Feature class, one of `VALID_FEATURES`.
+        feature: The feature record.
+        precision (int): Round coordinates to this many decimals. Default no rounding.
+    """
+    if name in ("boundary", "pavements"):
+        return {"type": "Polygon", "coordinates": [_rounded(ring, precision) for ring in feature.coordinates]}
+
+    if name == "linear_features":
+        return {"type": "LineString", "coordinates": _rounded(feature.coordinates, precision)}
+
+    if name == "runways":
+        return {
+            "type": "LineString",
+            "coordinates": _rounded([(end.longitude, end.latitude) for end in feature.ends], precision),
+        }
+
+    return {"type": "Point", "coordinates": _rounded([(feature.longitude, feature.latitude)], precision)[0]}
+
+
+def iter_features(
+    airport: ParsedAirport,
+    features: Optional[Iterable[str]] = None,
+    precision: Optional[int] = None,
+) -> Iterator[tuple[str, dict]]:
+    """Yield `(feature class, GeoJSON Feature)` for the features of an airport, one at a time.
+
+    Every feature carries the airport ident in its `airport` property.
+    """
+    for name in VALID_FEATURES if features is None else features:
+        if name not in VALID_FEATURES:
+            raise ValueError(f"Invalid feature {name}. Valid features: {', '.join(VALID_FEATURES)}.")
+
+        objects = getattr(airport, name)
+        if name == "boundary":
+            objects = [] if objects is None else [objects]
+
+        for feature in objects:
+            yield name, {
+                "type": "Feature",
+                "geometry": feature_geometry(name, feature, precision),
+                "properties": {"airport": airport.id, **feature_properties(feature)},
+            }
+
+
+class FeatureStreamWriter:
+    """Streams the features of many airports into one file per feature class.
+
+    With `output_format="geojson"` every file holds a single FeatureCollection whose
+    opening and closing are written once, with features appended in between. With
+    "ndjson" every line is one Feature. Each feature is serialized and written as
+    soon as it is produced, so memory use does not grow with the number of airports.
+
+    Args:
+        output_dir (str): Directory to write `<feature class>.geojson|.ndjson` to. Created if needed.
+        output_format (str): One of `EXPORT_FORMATS`. Default "geojson".
+        features (list[str]): Feature classes to export. Default all of `VALID_FEATURES`.
+        precision (int): Round coordinates to this many decimals. Default no rounding.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        output_format: str = "geojson",
+        features: Optional[Iterable[str]] = None,
+        precision: Optional[int] = None,
+    ) -> None:
+        if output_format not in EXPORT_FORMATS:
+            raise ValueError(
+                f"Unknown output format {output_format}. Valid formats: {', '.join(EXPORT_FORMATS)}.")
+
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.features = list(VALID_FEATURES if features is None else features)
+        self.precision = precision
+        self.n_features = 0
+
+        os.makedirs(output_dir, exist_ok=True)
+        self._files: dict[str, IO[str]] = {}
+        self._empty: dict[str, bool] = {}
+
+        for name in self.features:
+            f = open(self.path(name), "w", encoding="utf-8")
+            if output_format == "geojson":
+                f.write('{"type":"FeatureCollection","features":[\n')
+            self._files[name] = f
+            self._empty[name] = True
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.output_dir, name + EXPORT_FORMATS[self.output_format])
+
+    def write(self, airport: ParsedAirport) -> int:
+        """Append the features of one airport. Returns the number of features written."""
+        n = 0
+        for name, feature in iter_features(airport, self.features, self.precision):
+            f = self._files[name]
+            text = json.dumps(feature, separators=_JSON_SEPARATORS, ensure_ascii=False)
+
+            if self.output_format == "geojson" and not self._empty[name]:
+                f.write(",\n")
+            f.write(text)
+            if self.output_format == "ndjson":
+                f.write("\n")
+
+            self._empty[name] = False
+            n += 1
+
+        self.n_features += n
+        return n
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes written so far, over all files."""
+        return sum(f.tell() for f in self._files.values() if not f.closed)
+
+    def close(self) -> None:
+        for f in self._files.values():
+            if f.closed:
+                continue
+            if self.output_format == "geojson":
+                f.write("\n]}\n")
+            f.close()
+
+    def __enter__(self) -> "FeatureStreamWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def write_airport(
+    airport: ParsedAirport,
+    path: str,
+    output_format: str = "geojson",
+    features: Optional[Iterable[str]] = None,
+    precision: Optional[int] = None,
+) -> None:
+    """Write every feature of a single airport to one file.
+
+    A GeoJSON file is one FeatureCollection, an NDJSON file one Feature per line. The
+    feature class is stored in each feature's `feature_class` property.
+    """
+    if output_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown output format {output_format}. Valid formats: {', '.join(EXPORT_FORMATS)}.")
+
+    with open(path, "w", encoding="utf-8") as f:
+        if output_format == "geojson":
+            f.write('{"type":"FeatureCollection","features":[\n')
+
+        for i, (name, feature) in enumerate(iter_features(airport, features, precision)):
+            feature["properties"]["feature_class"] = name
+            if output_format == "geojson" and i:
+                f.write(",\n")
+            f.write(json.dumps(feature, separators=_JSON_SEPARATORS, ensure_ascii=False))
+            if output_format == "ndjson":
+                f.write("\n")
+
+        if output_format == "geojson":
+            f.write("\n]}\n")
+
+
+def export_file(
+    path: str,
+    output_dir: str,
+    output_format: str = "geojson",
+    features: Optional[Iterable[str]] = None,
+    precision: Optional[int] = None,
+    bezier_resolution: int = _DEFAULT_BEZIER_RESOLUTION,
+    idents: Optional[list[str]] = None,
+) -> FeatureStreamWriter:
+    """Export the airports of an apt.dat file into one file per feature class.
+
+    Airports are parsed one at a time from a memory map of the file and written out
+    before the next one is parsed, skipping the rows of the other feature classes.
+    Airports that fail to parse are logged and skipped.
+
+    Args:
+        path (str): Path to the apt.dat file.
+        output_dir (str): Directory to write the exported files to.
+        output_format (str): One of `EXPORT_FORMATS`. Default "geojson".
+        features (list[str]): Feature classes to export. Default all.
+        precision (int): Round coordinates to this many decimals. Default no rounding.
+        bezier_resolution (int): Number of points to use to plot Bezier curves.
+        idents (list[str]): Only export these airports. Default all.
+
+    Returns:
+        FeatureStreamWriter: The closed writer, with its `n_features` and the `path` of each file.
+    """
+    from tokenizer import MappedAptFile
+
+    t0 = time.perf_counter()
+    n_airports = 0
+
+    with MappedAptFile(path) as apt_file, \
+            FeatureStreamWriter(output_dir, output_format, features, precision) as writer:
+        for ident in list(apt_file.index) if idents is None else idents:
+            try:
+                airport = apt_file.parse(ident, bezier_resolution=bezier_resolution, features=writer.features)
+            except Exception as e:
+                logger.error(f"Skipping {ident}, failed to parse: {e}")
+                continue
+
+            writer.write(airport)
+            n_airports += 1
+
+        nbytes = writer.nbytes
+
+    elapsed = time.perf_counter() - t0
+    logger.info(
+        f"Exported {writer.n_features} features of {n_airports} airports, "
+        f"{nbytes / 1e6:.1f} MB in {elapsed:.1f} s ({nbytes / 1e6 / max(elapsed, 1e-9):.1f} MB/s).")
+
+    return writer
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export the airports of an apt.dat file as GeoJSON.")
+    parser.add_argument("path", help="apt.dat file")
+    parser.add_argument("output_dir", help="directory to write one file per feature class to")
+    parser.add_argument("--format", default="geojson", choices=sorted(EXPORT_FORMATS), dest="output_format")
+    parser.add_argument("--feature", action="append", dest="features", choices=VALID_FEATURES,
+                        help="only export this feature class (repeatable)")
+    parser.add_argument("--precision", type=int, default=None, help="decimals to round coordinates to")
+    parser.add_argument("--bezier-resolution", type=int, default=_DEFAULT_BEZIER_RESOLUTION)
+    parser.add_argument("--ident", action="append", dest="idents", help="only export this airport (repeatable)")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    export_file(
+        args.path,
+        args.output_dir,
+        output_format=args.output_format,
+        features=args.features,
+        precision=args.precision,
+        bezier_resolution=args.bezier_resolution,
+        idents=args.idents,
+    )
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,5 +1,11 @@
+import math
+import time
 import numpy as np
 from enum import IntEnum
+from functools import lru_cache
+
+from stats import current_stats
+from util import latlon_to_xy
 
 
 class RowCode(IntEnum):
@@ -80,6 +86,7 @@ class RowCode(IntEnum):
 
 
 _DEFAULT_BEZIER_RESOLUTION = 16
+_MAX_SUBDIVISION_DEPTH = 16
 
 
 def quadratic_bezier(t, p0, p1, p2):
@@ -95,209 +102,515 @@ def cubic_bezier(t, p0, p1, p2, p3):
     )
 
 
+def _bernstein(degree, t):
+    """Bernstein basis of shape (len(t), degree + 1) evaluated at parameters `t`."""
+    u = 1 - t
+
+    if degree == 2:
+        columns = (u * u, 2 * u * t, t * t)
+    elif degree == 3:
+        columns = (u * u * u, 3 * u * u * t, 3 * u * t * t, t * t * t)
+    else:
+        raise ValueError(f"Unsupported Bezier degree {degree}.")
+
+    return np.stack(columns, axis=1)
+
+
+@lru_cache(maxsize=None)
+def _bernstein_basis(degree, resolution):
+    """Bernstein basis matrix of shape (resolution, degree + 1) sampled on [0, 1]."""
+    basis = _bernstein(degree, np.linspace(0.0, 1.0, resolution))
+    basis.setflags(write=False)
+    return basis
+
+
+def tessellate_beziers(control_points, resolution=_DEFAULT_BEZIER_RESOLUTION):
+    """Evaluate a batch of Bezier curves of the same degree in one go.
+
+    Args:
+        control_points (array-like): Control points of shape (M, degree + 1, 2),
+            where degree is 2 (quadratic) or 3 (cubic).
+        resolution (int): Number of points to sample on each curve.
+
+    Returns:
+        np.ndarray: A (M * resolution, 2) float64 array. Rows
+            `i * resolution:(i + 1) * resolution` hold the points of curve `i`.
+    """
+    control_points = np.asarray(control_points, dtype=np.float64)
+    n_curves, n_nodes, _ = control_points.shape
+    basis = _bernstein_basis(n_nodes - 1, resolution)
+
+    # accumulate term by term (rather than a matmul) so results are bit-identical
+    # to evaluating quadratic_bezier/cubic_bezier point by point
+    points = basis[None, :, 0, None] * control_points[:, None, 0, :]
+    for j in range(1, n_nodes):
+        points += basis[None, :, j, None] * control_points[:, None, j, :]
+
+    return points.reshape(n_curves * resolution, 2)
+
+
 def _calculate_bezier(p0, p1, p2, p3=None, resolution=_DEFAULT_BEZIER_RESOLUTION):
-    if p3 is None:
-        return [
-            (quadratic_bezier(t, p0[0], p1[0], p2[0]),
-             quadratic_bezier(t, p0[1], p1[1], p2[1]))
-            for t in np.linspace(0.0, 1.0, resolution)
-        ]
+    nodes = (p0, p1, p2) if p3 is None else (p0, p1, p2, p3)
+    return list(map(tuple, tessellate_beziers([nodes], resolution).tolist()))
+
+
+def _flatness(control_points):
+    """Upper bound on the distance between a Bezier curve and its chord.
+
+    By the convex hull property no point of the curve is further from the chord
+    segment than the furthest control point.
+    """
+    (x0, y0), (xn, yn) = control_points[0], control_points[-1]
+    cx, cy = xn - x0, yn - y0
+    length2 = cx * cx + cy * cy
+
+    flatness = 0.0
+    for x, y in control_points[1:-1]:
+        dx, dy = x - x0, y - y0
+        if length2 > 0.0:
+            t = min(max((dx * cx + dy * cy) / length2, 0.0), 1.0)
+            dx, dy = dx - t * cx, dy - t * cy
+        flatness = max(flatness, math.hypot(dx, dy))
+
+    return flatness
+
+
+def _split_bezier(control_points):
+    """Split a Bezier curve at t = 0.5 with de Casteljau's algorithm."""
+    left, right = [control_points[0]], [control_points[-1]]
+    points = control_points
+    while len(points) > 1:
+        points = [((x0 + x1) / 2, (y0 + y1) / 2) for (x0, y0), (x1, y1) in zip(points, points[1:])]
+        left.append(points[0])
+        right.append(points[-1])
+
+    return left, right[::-1]
+
+
+def check_tolerance(tolerance, name="tolerance"):
+    """Raise ValueError unless `tolerance` is a positive, finite number of metres.
+
+    A zero, negative or NaN tolerance would subdivide every curve down to
+    `_MAX_SUBDIVISION_DEPTH`, tens of thousands of points each.
+    """
+    if not (isinstance(tolerance, (int, float, np.number)) and math.isfinite(tolerance) and tolerance > 0):
+        raise ValueError(f"Invalid {name} {tolerance}. Tolerances must be positive, finite numbers of metres.")
+
+
+def adaptive_bezier_parameters(control_points, tolerance):
+    """Curve parameters at which to sample a Bezier curve for a given chord error.
+
+    The curve is recursively halved until the control polygon of every piece lies
+    within `tolerance` metres of that piece's chord.
+
+    Args:
+        control_points (array-like): (degree + 1, 2) control points as (lon, lat).
+        tolerance (float): Maximum distance in metres between the curve and the
+            polyline through the returned samples.
+
+    Returns:
+        np.ndarray: Increasing parameters in [0, 1], starting at 0 and ending at 1.
+
+    Raises:
+        ValueError: If `tolerance` is not a positive, finite number.
+    """
+    check_tolerance(tolerance)
+    ref_lon, ref_lat = control_points[0]
+    piece = [latlon_to_xy(lat, lon, ref_lat, ref_lon) for lon, lat in control_points]
+
+    parameters = [0.0]
+    stack = [(0.0, 1.0, piece, 0)]
+    while stack:
+        t0, t1, piece, depth = stack.pop()
+
+        if depth >= _MAX_SUBDIVISION_DEPTH or _flatness(piece) <= tolerance:
+            parameters.append(t1)
+        else:
+            left, right = _split_bezier(piece)
+            t_mid = (t0 + t1) / 2
+            stack.append((t_mid, t1, right, depth + 1))
+            stack.append((t0, t_mid, left, depth + 1))
+
+    return np.array(parameters)
+
+
+def tessellate_bezier_adaptive(control_points, tolerance):
+    """Tessellate one Bezier curve so it deviates at most `tolerance` metres from the result.
+
+    Returns:
+        np.ndarray: A (M, 2) float64 array of (lon, lat) points, M >= 2.
+    """
+    control_points = np.asarray(control_points, dtype=np.float64)
+    t = adaptive_bezier_parameters(control_points, tolerance)
+    basis = _bernstein(len(control_points) - 1, t)
+
+    points = basis[:, 0, None] * control_points[0]
+    for j in range(1, len(control_points)):
+        points += basis[:, j, None] * control_points[j]
+
+    return points
+
+
+class _PendingCurve:
+    """Placeholder for a Bezier curve whose points are evaluated in a batch."""
+
+    __slots__ = ("nodes", "resolution")
+
+    def __init__(self, nodes, resolution):
+        self.nodes = tuple(nodes)
+        self.resolution = resolution
+
+
+def _resolve_curves(coordinates, tolerance=None):
+    """Replace every `_PendingCurve` in `coordinates` with its tessellated points.
+
+    With no `tolerance`, curves are sampled at their fixed resolution, grouped by
+    degree and resolution so each group is evaluated with a single call to
+    `tessellate_beziers`. Otherwise every curve is subdivided adaptively until it
+    is within `tolerance` metres of its tessellation.
+    """
+    groups = {}
+    for c in coordinates:
+        if type(c) is _PendingCurve:
+            groups.setdefault((len(c.nodes), c.resolution), []).append(c)
+
+    if not groups:
+        return coordinates
+
+    points = {}
+    if tolerance is None:
+        for (_, resolution), curves in groups.items():
+            flat = tessellate_beziers([c.nodes for c in curves], resolution).tolist()
+            for i, curve in enumerate(curves):
+                points[id(curve)] = flat[i * resolution:(i + 1) * resolution]
     else:
-        return [
-            (cubic_bezier(t, p0[0], p1[0], p2[0], p3[0]),
-             cubic_bezier(t, p0[1], p1[1], p2[1], p3[1]))
-            for t in np.linspace(0.0, 1.0, resolution)
-        ]
+        for curves in groups.values():
+            for curve in curves:
+                points[id(curve)] = tessellate_bezier_adaptive(curve.nodes, tolerance).tolist()
+
+    resolved = []
+    for c in coordinates:
+        if type(c) is _PendingCurve:
+            resolved.extend(map(tuple, points[id(c)]))
+        else:
+            resolved.append(c)
 
+    return resolved
 
-def get_paths(row_iterator, bezier_resolution, mode="line"):
-    # https://forums.x-plane.org/index.php?/forums/topic/66713-understanding-the-logic-of-bezier-control-points-in-aptdat/
 
-    assert mode == "line" or mode == "polygon"
+def _remove_consecutive_duplicates(coordinates):
+    # points are (lon, lat) tuples, so they compare directly
+    prev_c = None
+    fixed_coordinates = []
+    for c in coordinates:
+        if c != prev_c:
+            fixed_coordinates.append(c)
+            prev_c = c
+
+    return fixed_coordinates
+
+
+def _last_point(coordinates):
+    last = coordinates[-1]
+    # a curve always ends exactly on its last control point (t == 1)
+    return last.nodes[-1] if type(last) is _PendingCurve else last
+
+
+def get_paths(row_iterator, bezier_resolution, mode="line", bezier_tolerance=None):
+    """Walk a node chain (111-116 rows) and return its tessellated paths.
+
+    Args:
+        row_iterator (BIterator): Iterator positioned right after the chain's header row.
+        bezier_resolution (int): Number of points to sample on each curve.
+        mode (str): "line" splits paths where the line type changes, "polygon" does not.
+        bezier_tolerance (float): If set, curves are subdivided adaptively until they
+            are within this many metres of their tessellation, instead of being
+            sampled at `bezier_resolution`.
+
+    Returns:
+        tuple[list, list]: The coordinates of each path and their properties.
+    """
+    coordinates_list, properties_list, _ = get_paths_lods(
+        row_iterator, bezier_resolution, (), mode=mode, bezier_tolerance=bezier_tolerance)
+    return coordinates_list, properties_list
 
-    coordinates = []
-    properties = {}
 
-    def _start_segment():
-        nonlocal coordinates, properties
-        coordinates = []
-        properties = {}
+_NODE_ROW_CODES = frozenset((
+    RowCode.LINE_SEGMENT,
+    RowCode.LINE_CURVE,
+    RowCode.RING_SEGMENT,
+    RowCode.RING_CURVE,
+    RowCode.END_SEGMENT,
+    RowCode.END_CURVE,
+))
+_CURVE_ROW_CODES = frozenset((RowCode.LINE_CURVE, RowCode.RING_CURVE, RowCode.END_CURVE))
+_RING_ROW_CODES = frozenset((RowCode.RING_SEGMENT, RowCode.RING_CURVE))
+_END_ROW_CODES = frozenset((RowCode.END_SEGMENT, RowCode.END_CURVE))
+
+
+def _parse_node(row_code, tokens):
+    """(is_bezier, lat, lon, bezier_lat, bezier_lon, painted_line_type, lighting_line_type) of a node row."""
+    n = len(tokens)
+    if row_code in _CURVE_ROW_CODES:
+        return (
+            True, float(tokens[1]), float(tokens[2]), float(tokens[3]), float(tokens[4]),
+            int(tokens[5]) if n > 5 else None,
+            int(tokens[6]) if n > 6 else None,
+        )
 
-    def _finish_segment():
-        nonlocal coordinates, properties
-        if len(coordinates) > 1:
+    return (
+        False, float(tokens[1]), float(tokens[2]), None, None,
+        int(tokens[3]) if n > 3 else None,
+        int(tokens[4]) if n > 4 else None,
+    )
+
+
+def _node_rows(rows, start):
+    """(row code, `_parse_node` tuple) of the node rows from `start` up to the first other row.
+
+    A `RowTable` hands them over from its parsed node table, other row sequences are
+    tokenized one row at a time. So are the runs with a row that the node table could not
+    parse, which then fail like they do without a node table.
+    """
+    node_run = getattr(rows, "node_run", None)
+    if node_run is not None:
+        run = node_run(start)
+        if run is not None:
+            return run
+
+    return _tokenized_node_rows(rows, start)
+
+
+def _node_tuples(table):
+    """The (row code, `_parse_node` tuple) pairs of a `tokenizer.NODE_DTYPE` node table."""
+    row_codes = table["row_code"].tolist()
+    nodes = zip(
+        [row_code in _CURVE_ROW_CODES for row_code in row_codes],
+        table["lat"].tolist(),
+        table["lon"].tolist(),
+        table["bezier_lat"].tolist(),
+        table["bezier_lon"].tolist(),
+        [None if line_type < 0 else line_type for line_type in table["painted_line_type"].tolist()],
+        [None if line_type < 0 else line_type for line_type in table["lighting_line_type"].tolist()],
+    )
+    return list(zip(row_codes, nodes))
+
+
+def _tokenized_node_rows(rows, start):
+    for i in range(start, len(rows)):
+        row = rows[i]
+        if row.row_code not in _NODE_ROW_CODES:
+            return
+        yield row.row_code, _parse_node(row.row_code, row.tokens)
+
+
+class _NodeChainParser:
+    """Explicit state machine turning a node chain into tessellated paths.
+
+    State is the segment being built (`coordinates` and its line `properties`) and
+    the Bezier control points waiting for the next node (`bezier_nodes`). Rows are
+    fed one at a time by `get_paths_lods`, which never backtracks.
+    """
+
+    __slots__ = (
+        "mode", "bezier_resolution", "bezier_tolerance", "coordinates", "properties",
+        "bezier_nodes", "in_bezier", "coordinates_list", "properties_list", "lod_coordinates",
+        "tessellation_seconds",
+    )
+
+    def __init__(self, mode, bezier_resolution, bezier_tolerance, lod_tolerances):
+        self.mode = mode
+        self.bezier_resolution = bezier_resolution
+        self.bezier_tolerance = bezier_tolerance
+        self.coordinates_list = []
+        self.properties_list = []
+        self.lod_coordinates = {tolerance: [] for tolerance in lod_tolerances}
+        self.tessellation_seconds = 0.0
+        self.start_path()
+
+    def start_path(self):
+        self.bezier_nodes = []
+        self.in_bezier = False
+        self.start_segment()
+
+    def start_segment(self):
+        self.coordinates = []
+        self.properties = {}
+
+    def finish_segment(self):
+        t0 = time.perf_counter()
+        coordinates = self.coordinates
+        resolved = _resolve_curves(coordinates, self.bezier_tolerance)
+        if len(resolved) > 1:
             # simplify line. remove consecutive duplicates
-            prev_c = None
-            fixed_coordinates = []
-            for c in coordinates:
-                if prev_c is not None and tuple(c) == tuple(prev_c):
-                    continue
+            self.coordinates_list.append(_remove_consecutive_duplicates(resolved))
+            self.properties_list.append(self.properties)
 
-                fixed_coordinates.append(c)
+            for tolerance, lod_list in self.lod_coordinates.items():
+                lod_list.append(_remove_consecutive_duplicates(_resolve_curves(coordinates, tolerance)))
 
-                prev_c = c
+        self.tessellation_seconds += time.perf_counter() - t0
 
-            coordinates_list.append(fixed_coordinates)
-            properties_list.append(properties)
+    def node(self, node, has_next):
+        """Add a node to the current segment.
 
-    def _process_row(is_bezier, tokens):
-        nonlocal in_bezier, temp_bezier_nodes, coordinates, properties
-        lat, lon = float(tokens[1]), float(tokens[2])
+        Returns:
+            bool: True if the node changes the line type, in "line" mode. The current
+                segment is then finished, including this node, and a new empty one is
+                started for the caller to continue.
+        """
+        is_bezier, lat, lon, bzp_lat, bzp_lon, painted_line_type, lighting_line_type = node
+        coordinates = self.coordinates
 
         if not is_bezier:
-            if in_bezier:
-                temp_bezier_nodes.append((lon, lat))
-                coordinates.extend(
-                    _calculate_bezier(*temp_bezier_nodes)
+            if self.in_bezier:
+                self.bezier_nodes.append((lon, lat))
+                coordinates.append(
+                    _PendingCurve(self.bezier_nodes, _DEFAULT_BEZIER_RESOLUTION)
                 )  # TODO: pass resolution argument
-                temp_bezier_nodes = []
+                self.bezier_nodes = []
             else:
                 coordinates.append((lon, lat))
 
-            in_bezier = False
-
-            painted_line_type = int(tokens[3]) if len(tokens) > 3 else None
-            lighting_line_type = int(tokens[4]) if len(tokens) > 4 else None
-
-            if mode == "line" and (
-                (
-                    painted_line_type is not None
-                    and properties.get("painted_line_type") is not None
-                    and painted_line_type != properties["painted_line_type"]
-                )
-                or (
-                    lighting_line_type is not None
-                    and properties.get("lighting_line_type") is not None
-                    and lighting_line_type != properties["lighting_line_type"]
-                )
-            ):
-                if row_iterator.has_next():
-                    _finish_segment()
-                    _start_segment()
-                    row_iterator.unnext()  # reuse row for the new segment
-            else:
-                if painted_line_type is not None:
-                    properties["painted_line_type"] = painted_line_type
-
-                if lighting_line_type is not None:
-                    properties["lighting_line_type"] = lighting_line_type
+            self.in_bezier = False
 
         else:
-            bzp_lat, bzp_lon = float(tokens[3]), float(tokens[4])
-
-            if in_bezier:
-                diff_lat = bzp_lat - lat
-                diff_lon = bzp_lon - lon
-                mirr_lat = lat - diff_lat
-                mirr_lon = lon - diff_lon
-
-                temp_bezier_nodes.append((mirr_lon, mirr_lat))
-                temp_bezier_nodes.append((lon, lat))
-                coordinates.extend(
-                    _calculate_bezier(*temp_bezier_nodes,
-                                      resolution=bezier_resolution)
-                )
-                temp_bezier_nodes = []
-            else:
-                if len(coordinates) != 0:
-                    diff_lat = bzp_lat - lat
-                    diff_lon = bzp_lon - lon
-                    mirr_lat = lat - diff_lat
-                    mirr_lon = lon - diff_lon
-
-                    temp_bezier_nodes.append(coordinates[-1])
-                    temp_bezier_nodes.append((mirr_lon, mirr_lat))
-                    temp_bezier_nodes.append((lon, lat))
-                    coordinates.extend(
-                        _calculate_bezier(
-                            *temp_bezier_nodes, resolution=bezier_resolution
-                        )
-                    )
-                    temp_bezier_nodes = []
-
-            temp_bezier_nodes.append((lon, lat))
-            temp_bezier_nodes.append((bzp_lon, bzp_lat))
-
-            # else:
-            in_bezier = True
-
-            painted_line_type = int(tokens[5]) if len(tokens) > 5 else None
-            lighting_line_type = int(tokens[6]) if len(tokens) > 6 else None
-
-            if mode == "line" and (
-                (
-                    painted_line_type is not None
-                    and properties.get("painted_line_type") is not None
-                    and painted_line_type != properties["painted_line_type"]
-                )
-                or (
-                    lighting_line_type is not None
-                    and properties.get("lighting_line_type") is not None
-                    and lighting_line_type != properties["lighting_line_type"]
-                )
-            ):
-                if row_iterator.has_next():
-                    _finish_segment()
-                    _start_segment()
-                    row_iterator.unnext()  # reuse row for the new segment
-            else:
-                if painted_line_type is not None:
-                    properties["painted_line_type"] = painted_line_type
-
-                if lighting_line_type is not None:
-                    properties["lighting_line_type"] = lighting_line_type
-
-    coordinates_list = []
-    properties_list = []
-    more_segments = True
-
-    while more_segments:
-        temp_bezier_nodes = []
-        in_bezier = False
-        first_row = None
-        first_row_is_bezier = None
-
-        _start_segment()
-
-        for row in row_iterator:
-            if first_row is None:
-                first_row = row
-                first_row_is_bezier = row.row_code in [
-                    RowCode.LINE_CURVE,
-                    RowCode.RING_CURVE,
-                    RowCode.END_CURVE,
-                ]
-
-            row_code = row.row_code
-            tokens = row.tokens
-
-            if row_code == RowCode.LINE_SEGMENT:
-                _process_row(False, tokens)
-            elif row_code == RowCode.LINE_CURVE:
-                _process_row(True, tokens)
-            elif row_code == RowCode.RING_SEGMENT:
-                _process_row(False, tokens)
-                _process_row(first_row_is_bezier, first_row.tokens)
-                break
-            elif row_code == RowCode.RING_CURVE:
-                _process_row(True, tokens)
-                _process_row(first_row_is_bezier, first_row.tokens)
-                break
-            elif row_code == RowCode.END_SEGMENT:
-                _process_row(False, tokens)
-                break
-            elif row_code == RowCode.END_CURVE:
-                _process_row(True, tokens)
-                break
-            else:
-                row_iterator.unnext()
-                more_segments = False
-                break
+            mirrored = (lon - (bzp_lon - lon), lat - (bzp_lat - lat))
+
+            if self.in_bezier:
+                self.bezier_nodes.append(mirrored)
+                self.bezier_nodes.append((lon, lat))
+                coordinates.append(_PendingCurve(self.bezier_nodes, self.bezier_resolution))
+                self.bezier_nodes = []
+            elif len(coordinates) != 0:
+                coordinates.append(_PendingCurve(
+                    [_last_point(coordinates), mirrored, (lon, lat)], self.bezier_resolution))
+                self.bezier_nodes = []
+
+            self.bezier_nodes.append((lon, lat))
+            self.bezier_nodes.append((bzp_lon, bzp_lat))
+            self.in_bezier = True
+
+        properties = self.properties
+        current_painted = properties.get("painted_line_type")
+        current_lighting = properties.get("lighting_line_type")
+
+        if self.mode == "line" and (
+            (painted_line_type is not None and current_painted is not None and painted_line_type != current_painted)
+            or (lighting_line_type is not None and current_lighting is not None
+                and lighting_line_type != current_lighting)
+        ):
+            # the last node of a file never starts a new segment
+            if has_next:
+                self.finish_segment()
+                self.start_segment()
+                return True
         else:
-            # there is no more rows
-            more_segments = False
+            if painted_line_type is not None:
+                properties["painted_line_type"] = painted_line_type
 
-        _finish_segment()
+            if lighting_line_type is not None:
+                properties["lighting_line_type"] = lighting_line_type
 
-    assert len(coordinates_list) == len(properties_list)
-    return coordinates_list, properties_list
+        return False
+
+    def ring_path(self, node, has_next):
+        """A path made of a single ring closing node, as left over by a line type change on it."""
+        self.start_path()
+        self.node(node, has_next)
+        self.node(node, has_next)
+        self.finish_segment()
+
+
+def get_paths_lods(row_iterator, bezier_resolution, lod_tolerances, mode="line", bezier_tolerance=None):
+    """Like `get_paths`, also tessellating every path once per level of detail.
+
+    The node chain is walked once. Each curve is then tessellated adaptively for
+    every tolerance in `lod_tolerances`.
+
+    Returns:
+        tuple[list, list, dict]: As `get_paths`, plus a dict mapping each LOD
+            tolerance to a list of coordinates aligned with the first list.
+    """
+    # https://forums.x-plane.org/index.php?/forums/topic/66713-understanding-the-logic-of-bezier-control-points-in-aptdat/
+
+    assert mode == "line" or mode == "polygon"
+
+    t0 = time.perf_counter()
+    parser = _NodeChainParser(mode, bezier_resolution, bezier_tolerance, lod_tolerances)
+    first_node = None
+
+    rows = row_iterator.sequence
+    n_rows = len(rows)
+    i = row_iterator.position
+
+    # Each path (a line, or one ring of a polygon) runs until a 113/114 ring closing
+    # row or a 115/116 end row. Paths follow each other until a row that is not a node.
+    for row_code, node in _node_rows(rows, i):
+        i += 1
+        has_next = i < n_rows
+        if first_node is None:
+            first_node = node
+
+        if row_code in _RING_ROW_CODES:
+            # close the ring by going back through its first node
+            split = parser.node(node, has_next)
+            split = parser.node(first_node, has_next) or split
+            parser.finish_segment()
+
+            if split:
+                parser.ring_path(node, has_next)
+
+        elif row_code in _END_ROW_CODES:
+            # a line type change on the end node leaves a single point path, which is dropped
+            parser.node(node, has_next)
+            parser.finish_segment()
+
+        else:
+            if parser.node(node, has_next):
+                # the node ending the previous segment also starts the new one
+                parser.node(node, has_next)
+            continue
+
+        parser.start_path()
+        first_node = None
+
+    # the chain ends at the first row that is not a node, or with the rows
+    parser.finish_segment()
+    row_iterator.seek(i)
+
+    stats = current_stats()
+    if stats is not None:
+        stats.add_time("chain_walk", time.perf_counter() - t0 - parser.tessellation_seconds)
+        stats.add_time("tessellation", parser.tessellation_seconds)
+
+    return parser.coordinates_list, parser.properties_list, parser.lod_coordinates
+
+
+def signed_area(ring):
+    """Shoelace area of a closed (lon, lat) ring, positive when counterclockwise."""
+    if len(ring) < 3:
+        return 0.0
+
+    # relative to the first point, as coordinates are large next to the ring's extent
+    x0, y0 = ring[0]
+    area = 0.0
+    px, py = 0.0, 0.0
+    for x, y in ring[1:]:
+        x, y = x - x0, y - y0
+        area += px * y - x * py
+        px, py = x, y
+    return area / 2
+
+
+def orient_rings(rings):
+    """Rings of a polygon with the outer one counterclockwise and the holes clockwise.
+
+    The first ring is the outer one. Rings already oriented are returned as they
+    are, the others reversed, so they still end on their first point.
+    """
+    oriented = []
+    for i, ring in enumerate(rings):
+        area = signed_area(ring)
+        oriented.append(ring[::-1] if (area < 0 if i == 0 else area > 0) else ring)
+    return oriented
@@ -0,0 +1,350 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import struct
+import time
+import typing
+from dataclasses import fields, is_dataclass
+from enum import Enum
+from typing import Iterable, Optional, Union
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError as e:
+    raise ImportError("Could not import pyarrow. Install it to export GeoParquet: pip install pyarrow.") from e
+
+from base import ParsedAirport, VALID_FEATURES, _DEFAULT_BEZIER_RESOLUTION
+from classes import Boundary, LinearFeature, Pavement, Runway, Sign, StartupLocation, Windsock
+from export import _GEOMETRY_FIELDS, feature_properties
+from log import configure_logging
+
+
+logger = logging.getLogger("xplane_apt_convert")
+
+GEOPARQUET_VERSION = "1.1.0"
+_DEFAULT_ROW_GROUP_SIZE = 65536
+
+# feature class -> WKB / GeoParquet geometry type
+GEOMETRY_TYPES = {
+    "boundary": "Polygon",
+    "pavements": "Polygon",
+    "runways": "LineString",
+    "linear_features": "LineString",
+    "startup_locations": "Point",
+    "windsocks": "Point",
+    "signs": "Point",
+}
+
+# feature class -> record type, whose fields give the column types
+FEATURE_CLASSES = {
+    "boundary": Boundary,
+    "pavements": Pavement,
+    "runways": Runway,
+    "linear_features": LinearFeature,
+    "startup_locations": StartupLocation,
+    "windsocks": Windsock,
+    "signs": Sign,
+}
+
+_ARROW_TYPES = {float: pa.float64(), int: pa.int64(), bool: pa.bool_(), str: pa.string()}
+
+_WKB_HEADER = struct.Struct("<BII")  # little endian marker, geometry type, point / ring count
+_WKB_POINT = struct.Struct("<BIdd")
+_WKB_COUNT = struct.Struct("<I")
+
+
+def _coords(points) -> np.ndarray:
+    return np.ascontiguousarray(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+
+
+def feature_wkb(name: str, feature) -> tuple[bytes, tuple[float, float, float, float]]:
+    """ISO WKB of a feature's (lon, lat) geometry, and its (xmin, ymin, xmax, ymax) bounding box."""
+    kind = GEOMETRY_TYPES[name]
+
+    if kind == "Point":
+        x, y = feature.longitude, feature.latitude
+        return _WKB_POINT.pack(1, 1, x, y), (x, y, x, y)
+
+    if kind == "LineString":
+        if name == "runways":
+            coords = _coords([(end.longitude, end.latitude) for end in feature.ends])
+        else:
+            coords = _coords(feature.coordinates)
+        wkb = _WKB_HEADER.pack(1, 2, len(coords)) + coords.tobytes()
+        rings = [coords]
+    else:
+        rings = [_coords(ring) for ring in feature.coordinates]
+        wkb = b"".join(
+            [_WKB_HEADER.pack(1, 3, len(rings))]
+            + [_WKB_COUNT.pack(len(ring)) + ring.tobytes() for ring in rings]
+        )
+
+    coords = np.concatenate(rings) if rings else np.zeros((0, 2))
+    if len(coords) == 0:
+        return wkb, (np.nan, np.nan, np.nan, np.nan)
+    (xmin, ymin), (xmax, ymax) = coords.min(axis=0).tolist(), coords.max(axis=0).tolist()
+    return wkb, (xmin, ymin, xmax, ymax)
+
+
+def _flatten(properties: dict) -> dict:
+    # runway ends become end1_* / end2_* columns
+    row = {}
+    for key, value in properties.items():
+        if key == "ends":
+            for i, end in enumerate(value, start=1):
+                row.update({f"end{i}_{k}": v for k, v in end.items()})
+        else:
+            row[key] = value
+    return row
+
+
+def _arrow_type(hint) -> pa.DataType:
+    # Optional[X] -> X, enums are stored by name
+    if typing.get_origin(hint) is Union:
+        (hint,) = [arg for arg in typing.get_args(hint) if arg is not type(None)]
+    if isinstance(hint, type) and issubclass(hint, Enum):
+        return pa.string()
+    return _ARROW_TYPES[hint]
+
+
+def _property_fields(record_type: type, prefix: str = "") -> list:
+    """Arrow fields of the columns `_flatten(feature_properties(...))` gives for a record type."""
+    hints = typing.get_type_hints(record_type, localns={"np": np})
+    columns = []
+    for f in fields(record_type):
+        if f.name in _GEOMETRY_FIELDS and not prefix:
+            continue
+
+        hint = hints[f.name]
+        if f.name == "ends":
+            for i, end_type in enumerate(typing.get_args(hint), start=1):
+                columns += _property_fields(end_type, prefix=f"end{i}_")
+        elif is_dataclass(hint):
+            raise TypeError(f"Cannot store nested record {f.name} of {record_type.__name__} as a column.")
+        else:
+            columns.append(pa.field(prefix + f.name, _arrow_type(hint)))
+    return columns
+
+
+def _bbox_type() -> pa.DataType:
+    return pa.struct([(k, pa.float64()) for k in ("xmin", "ymin", "xmax", "ymax")])
+
+
+class _ClassWriter:
+    """Buffers the rows of one feature class and flushes them as Parquet row groups."""
+
+    def __init__(self, name: str, path: str, row_group_size: int, compression: str) -> None:
+        self.name = name
+        self.path = path
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.n_rows = 0
+        self._rows = []
+        self._schema = None
+        self._writer = None
+
+    def append(self, airport_id: str, feature) -> None:
+        wkb, (xmin, ymin, xmax, ymax) = feature_wkb(self.name, feature)
+        self._rows.append({
+            "airport": airport_id,
+            **_flatten(feature_properties(feature)),
+            "geometry": wkb,
+            "bbox": {"xmin": xmin, "ymin": ymin, "xmax": xmax, "ymax": ymax},
+        })
+
+        if len(self._rows) >= self.row_group_size:
+            self.flush()
+
+    def _schema_of_class(self) -> pa.Schema:
+        # from the record type rather than the first rows, where a column may be all None
+        columns = [
+            pa.field("airport", pa.string()),
+            *_property_fields(FEATURE_CLASSES[self.name]),
+            pa.field("geometry", pa.binary()),
+            pa.field("bbox", _bbox_type()),
+        ]
+
+        geo = {
+            "version": GEOPARQUET_VERSION,
+            "primary_column": "geometry",
+            "columns": {
+                "geometry": {
+                    "encoding": "WKB",
+                    "geometry_types": [GEOMETRY_TYPES[self.name]],
+                    "covering": {"bbox": {k: ["bbox", k] for k in ("xmin", "ymin", "xmax", "ymax")}},
+                },
+            },
+        }
+        return pa.schema(columns, metadata={b"geo": json.dumps(geo).encode()})
+
+    def flush(self) -> None:
+        if not self._rows:
+            return
+
+        if self._writer is None:
+            self._schema = self._schema_of_class()
+            self._writer = pq.ParquetWriter(self.path, self._schema, compression=self.compression)
+
+        table = pa.Table.from_pylist(self._rows, schema=self._schema)
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self.n_rows += len(self._rows)
+        self._rows = []
+
+    def close(self) -> None:
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+
+
+class GeoParquetWriter:
+    """Writes the features of many airports into one GeoParquet file per feature class.
+
+    Geometries are stored as WKB in (lon, lat), with a GeoParquet 1.1 `bbox` covering
+    column so readers can skip row groups by extent. Rows are buffered and written
+    one row group of `row_group_size` features at a time. Writing airports in ident
+    order keeps the `airport` column sorted, so its row group statistics act as a
+    partitioning by ICAO code for filtered reads. Column types follow the fields of
+    the feature records. Files are opened with their first row group, so feature
+    classes without any feature get no file.
+
+    Args:
+        output_dir (str): Directory to write `<feature class>.parquet` to. Created if needed.
+        features (list[str]): Feature classes to export. Default all of `VALID_FEATURES`.
+        row_group_size (int): Features per row group. Default 65536.
+        compression (str): Parquet compression codec. Default "zstd".
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        features: Optional[Iterable[str]] = None,
+        row_group_size: int = _DEFAULT_ROW_GROUP_SIZE,
+        compression: str = "zstd",
+    ) -> None:
+        self.features = list(VALID_FEATURES if features is None else features)
+        for name in self.features:
+            if name not in VALID_FEATURES:
+                raise ValueError(f"Invalid feature {name}. Valid features: {', '.join(VALID_FEATURES)}.")
+
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self._writers = {
+            name: _ClassWriter(name, self.path(name), row_group_size, compression)
+            for name in self.features
+        }
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.output_dir, f"{name}.parquet")
+
+    @property
+    def n_features(self) -> int:
+        return sum(w.n_rows + len(w._rows) for w in self._writers.values())
+
+    def write(self, airport: ParsedAirport) -> None:
+        for name, writer in self._writers.items():
+            objects = getattr(airport, name)
+            if name == "boundary":
+                objects = [] if objects is None else [objects]
+
+            for feature in objects:
+                writer.append(airport.id, feature)
+
+    def close(self) -> None:
+        for writer in self._writers.values():
+            writer.close()
+
+    def __enter__(self) -> "GeoParquetWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def write_airport(airport: ParsedAirport, output_dir: str, features: Optional[Iterable[str]] = None) -> None:
+    """Write a single airport as one GeoParquet file per feature class into `output_dir`."""
+    with GeoParquetWriter(output_dir, features) as writer:
+        writer.write(airport)
+
+
+def export_file(
+    path: str,
+    output_dir: str,
+    features: Optional[Iterable[str]] = None,
+    bezier_resolution: int = _DEFAULT_BEZIER_RESOLUTION,
+    idents: Optional[list[str]] = None,
+    row_group_size: int = _DEFAULT_ROW_GROUP_SIZE,
+) -> GeoParquetWriter:
+    """Export the airports of an apt.dat file into one GeoParquet file per feature class.
+
+    Airports are parsed one at a time, in ident order, from a memory map of the file,
+    skipping the rows of the feature classes not exported.
+    Airports that fail to parse are logged and skipped.
+
+    Args:
+        path (str): Path to the apt.dat file.
+        output_dir (str): Directory to write the Parquet files to.
+        features (list[str]): Feature classes to export. Default all.
+        bezier_resolution (int): Number of points to use to plot Bezier curves.
+        idents (list[str]): Only export these airports. Default all.
+        row_group_size (int): Features per row group. Default 65536.
+
+    Returns:
+        GeoParquetWriter: The closed writer, with its `n_features` and the `path` of each file.
+    """
+    from tokenizer import MappedAptFile
+
+    t0 = time.perf_counter()
+    n_airports = 0
+
+    with MappedAptFile(path) as apt_file, \
+            GeoParquetWriter(output_dir, features, row_group_size) as writer:
+        for ident in sorted(apt_file.index if idents is None else idents):
+            try:
+                airport = apt_file.parse(ident, bezier_resolution=bezier_resolution, features=writer.features)
+            except Exception as e:
+                logger.error(f"Skipping {ident}, failed to parse: {e}")
+                continue
+
+            writer.write(airport)
+            n_airports += 1
+
+    nbytes = sum(os.path.getsize(writer.path(name)) for name in writer.features if os.path.exists(writer.path(name)))
+    logger.info(
+        f"Exported {writer.n_features} features of {n_airports} airports to GeoParquet, "
+        f"{nbytes / 1e6:.1f} MB in {time.perf_counter() - t0:.1f} s.")
+
+    return writer
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export the airports of an apt.dat file as GeoParquet.")
+    parser.add_argument("path", help="apt.dat file")
+    parser.add_argument("output_dir", help="directory to write one Parquet file per feature class to")
+    parser.add_argument("--feature", action="append", dest="features", choices=VALID_FEATURES,
+                        help="only export this feature class (repeatable)")
+    parser.add_argument("--bezier-resolution", type=int, default=_DEFAULT_BEZIER_RESOLUTION)
+    parser.add_argument("--ident", action="append", dest="idents", help="only export this airport (repeatable)")
+    parser.add_argument("--row-group-size", type=int, default=_DEFAULT_ROW_GROUP_SIZE)
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    export_file(
+        args.path,
+        args.output_dir,
+        features=args.features,
+        bezier_resolution=args.bezier_resolution,
+        idents=args.idents,
+        row_group_size=args.row_group_size,
+    )
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from typing import TYPE_CHECKING, Iterator, Optional, Sequence
+
+if TYPE_CHECKING:
+    from xplane_airports.AptDat import Airport
+
+    from base import ParsedAirport
+    from cache import AirportCache
+
+
+logger = logging.getLogger("xplane_apt_convert")
+
+# Looking airports up only needs the standard library. The parser, and with it NumPy,
+# is imported by the first `parse`.
+_DEFAULT_BEZIER_RESOLUTION = 16  # as in `base`
+
+_INDEX_VERSION = 1
+_INDEX_SUFFIX = ".idx"
+
+# row codes that open a new airport, seaport or heliport record block
+_HEADER_CODES = (b"1", b"16", b"17")
+_FILE_END_CODE = b"99"
+
+
+def xplane_airport_class() -> type:
+    """`xplane_airports.AptDat.Airport`, imported on first use."""
+    try:
+        from xplane_airports.AptDat import Airport
+    except ImportError as e:
+        raise ImportError(
+            "Could not import xplane_airports. Install https://github.com/X-Plane/xplane_airports.") from e
+    return Airport
+
+
+class AptIndex:
+    """Byte offset index of every airport in an apt.dat file.
+
+    The file is scanned once, streaming, and the offset and length of each
+    airport's record block is stored keyed by its ident. A single airport can
+    then be read by seeking to its slice, without loading the whole file.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        entries: dict[str, tuple[int, int]],
+        xplane_version: int = 1100,
+    ) -> None:
+        self.path = path
+        self.entries = entries
+        self.xplane_version = xplane_version
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, ident: str) -> bool:
+        return ident in self.entries
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.entries)
+
+    @staticmethod
+    def sidecar_path(path: str) -> str:
+        return path + _INDEX_SUFFIX
+
+    @classmethod
+    def build(cls, path: str) -> "AptIndex":
+        """Scan `path` once and record the byte range of every airport."""
+        logger.info(f"Indexing {path}.")
+
+        entries = {}
+        xplane_version = 1100
+        current = None  # (ident, start offset)
+        offset = 0
+
+        def _close(end):
+            ident, start = current
+            if ident in entries:
+                logger.warning(f"Duplicate airport {ident} in {path}, keeping the first one.")
+            else:
+                entries[ident] = (start, end - start)
+
+        with open(path, "rb") as f:
+            for line_number, line in enumerate(f):
+                line_offset = offset
+                offset += len(line)
+
+                if line_number == 1:
+                    # file header: "<version> Generated by ..." / "<version> Version - ..."
+                    tokens = line.split(None, 1)
+                    if tokens and tokens[0].isdigit() and len(tokens[0]) == 4:
+                        xplane_version = int(tokens[0])
+                        continue
+
+                if line[:1] not in (b"1", b"9"):
+                    continue
+
+                tokens = line.split(None, 5)
+                if not tokens:
+                    continue
+
+                code = tokens[0]
+                if code in _HEADER_CODES or code == _FILE_END_CODE:
+                    if current is not None:
+                        _close(line_offset)
+                        current = None
+
+                    if code != _FILE_END_CODE and len(tokens) > 4:
+                        current = (tokens[4].decode("utf-8"), line_offset)
+
+        if current is not None:
+            _close(offset)
+
+        return cls(path, entries, xplane_version)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["AptIndex"]:
+        """Load the sidecar index of `path`, or None if it is missing or stale."""
+        sidecar = cls.sidecar_path(path)
+
+        try:
+            with open(sidecar, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        stat = os.stat(path)
+        if (
+            data.get("version") != _INDEX_VERSION
+            or data.get("size") != stat.st_size
+            or data.get("mtime_ns") != stat.st_mtime_ns
+        ):
+            logger.info(f"Index {sidecar} is stale.")
+            return None
+
+        entries = {ident: tuple(entry) for ident, entry in data["entries"].items()}
+        return cls(path, entries, data["xplane_version"])
+
+    @classmethod
+    def open(cls, path: str) -> "AptIndex":
+        """Load the sidecar index of `path`, (re)building and saving it if needed."""
+        index = cls.load(path)
+
+        if index is None:
+            index = cls.build(path)
+            try:
+                index.save()
+            except OSError as e:
+                logger.warning(f"Could not write index for {path}: {e}")
+
+        return index
+
+    def save(self) -> None:
+        stat = os.stat(self.path)
+        data = {
+            "version": _INDEX_VERSION,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "xplane_version": self.xplane_version,
+            "entries": self.entries,
+        }
+
+        sidecar = self.sidecar_path(self.path)
+        tmp = sidecar + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, sidecar)
+
+    def read_bytes(self, ident: str) -> bytes:
+        """Raw apt.dat record block of a single airport."""
+        start, length = self.entries[ident]
+
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            return f.read(length)
+
+    def read_text(self, ident: str) -> str:
+        return self.read_bytes(ident).decode("utf-8")
+
+    def airport(self, ident: str) -> Airport:
+        """An `xplane_airports` airport object for `ident`, read from its slice only."""
+        return xplane_airport_class().from_str(self.read_text(ident), self.path, self.xplane_version)
+
+    def parse(
+        self,
+        ident: str,
+        bezier_resolution: int = _DEFAULT_BEZIER_RESOLUTION,
+        cache: Optional[AirportCache] = None,
+        columnar: bool = False,
+        bezier_tolerance: Optional[float] = None,
+        lod_tolerances: Sequence[float] = (),
+        features: Optional[Sequence[str]] = None,
+        triangulate: bool = False,
+    ) -> ParsedAirport:
+        """Parse a single airport, with the options of `ParsedAirport`.
+
+        With or without `cache`, the result is the same, in the same layout.
+        """
+        options = dict(
+            bezier_resolution=bezier_resolution,
+            columnar=columnar,
+            bezier_tolerance=bezier_tolerance,
+            lod_tolerances=lod_tolerances,
+            features=features,
+            triangulate=triangulate,
+        )
+        if cache is not None:
+            return cache.parse(self.read_bytes(ident), **options)
+
+        from base import ParsedAirport
+
+        return ParsedAirport(self.airport(ident), **options)
+
+
+def load_airport(
+    path: str,
+    ident: str,
+    bezier_resolution: int = _DEFAULT_BEZIER_RESOLUTION,
+    cache: Optional[AirportCache] = None,
+    columnar: bool = False,
+) -> ParsedAirport:
+    """Parse a single airport from an apt.dat file, using (and creating) its sidecar index.
+
+    Args:
+        path (str): Path to the apt.dat file.
+        ident (str): Airport ident, as found in its `1`/`16`/`17` header row.
+        bezier_resolution (int): Number of points to use to plot Bezier curves.
+        cache (AirportCache): Look the parsed airport up in, and store it to, this cache.
+        columnar (bool): Pack the coordinates, as in `ParsedAirport`. Default False.
+
+    Raises:
+        KeyError: If `ident` is not in the file.
+    """
+    return AptIndex.open(path).parse(ident, bezier_resolution=bezier_resolution, cache=cache, columnar=columnar)
@@ -1,7 +1,7 @@
 class BIterator:
-    def __init__(self, seq):
+    def __init__(self, seq, start=0):
         self._seq = seq
-        self._idx = -1
+        self._idx = start - 1
 
     def __iter__(self):
         return self
@@ -22,5 +22,18 @@ class BIterator:
             self._idx += 1
             raise IndexError("Can't go back any further.")
 
+    @property
+    def sequence(self):
+        return self._seq
+
+    @property
+    def position(self):
+        """Index of the row `next` returns."""
+        return self._idx + 1
+
+    def seek(self, position):
+        """Make `next` return row `position`."""
+        self._idx = position - 1
+
     def has_next(self):
         return self._idx < (len(self._seq) - 1)
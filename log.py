@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import logging
+
+
+logger = logging.getLogger("xplane_apt_convert")
+
+
+def configure_logging(level: int = logging.INFO) -> None:
+    """Print log records to the terminal, through rich when it is installed.
+
+    Importing the package installs no handler, so that applications keep control of
+    their logging setup and short-lived processes do not pay for importing rich.
+    The command line entry points call this first thing.
+
+    Args:
+        level (int): Level of the package's logger. Default INFO.
+    """
+    try:
+        from rich.logging import RichHandler
+    except ImportError:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-8s %(message)s", datefmt="[%X]"))
+    else:
+        handler = RichHandler(show_path=False, omit_repeated_times=False)
+
+    logging.basicConfig(level=level, format="%(message)s", datefmt="[%X]", handlers=[handler])
+    logger.setLevel(level)
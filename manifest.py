@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+from index import AptIndex
+from log import configure_logging
+
+
+logger = logging.getLogger("xplane_apt_convert")
+
+MANIFEST_VERSION = 1
+
+
+@dataclass
+class ManifestDiff:
+    added: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    changed: list[str] = field(default_factory=list)
+    unchanged: list[str] = field(default_factory=list)
+
+    @property
+    def to_process(self) -> list[str]:
+        """Airports that need to be parsed again: added and changed ones."""
+        return sorted(self.added + self.changed)
+
+    def __str__(self) -> str:
+        return (
+            f"{len(self.added)} added, {len(self.removed)} removed, "
+            f"{len(self.changed)} changed, {len(self.unchanged)} unchanged")
+
+
+class Manifest:
+    """SHA-256 of every airport's apt.dat record block, from one run of the pipeline.
+
+    A block is the slice of the file between consecutive `1`/`16`/`17` headers, as
+    recorded by `AptIndex`, so an airport's hash only changes when its own rows do.
+    `settings` holds whatever else affects the outputs (parser version, Bezier
+    resolution, output format...). When they differ between two manifests every
+    airport counts as changed. `outputs` maps each airport to the file written for it.
+    """
+
+    def __init__(
+        self,
+        hashes: dict[str, str],
+        settings: Optional[dict] = None,
+        outputs: Optional[dict[str, str]] = None,
+    ) -> None:
+        self.hashes = hashes
+        self.settings = settings or {}
+        self.outputs = outputs or {}
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    @staticmethod
+    def hash_airports(path: str, index: Optional[AptIndex] = None) -> dict[str, str]:
+        """SHA-256 hex digest of the record block of every airport in an apt.dat file."""
+        index = index if index is not None else AptIndex.open(path)
+
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            view = memoryview(m)
+            try:
+                return {
+                    ident: hashlib.sha256(view[start:start + length]).hexdigest()
+                    for ident, (start, length) in index.entries.items()
+                }
+            finally:
+                view.release()
+
+    @classmethod
+    def from_apt(cls, path: str, settings: Optional[dict] = None, index: Optional[AptIndex] = None) -> "Manifest":
+        return cls(cls.hash_airports(path, index), settings)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["Manifest"]:
+        """Read a manifest saved by `save`. Returns None if it is missing or unreadable."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable manifest {path}: {e}")
+            return None
+
+        if data.get("version") != MANIFEST_VERSION:
+            logger.warning(f"Ignoring manifest {path} of unsupported version {data.get('version')}.")
+            return None
+
+        return cls(data["hashes"], data.get("settings"), data.get("outputs"))
+
+    def save(self, path: str) -> None:
+        data = {
+            "version": MANIFEST_VERSION,
+            "settings": self.settings,
+            "hashes": self.hashes,
+            "outputs": self.outputs,
+        }
+
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"), sort_keys=True)
+        os.replace(tmp, path)
+
+    def diff(self, previous: Optional["Manifest"]) -> ManifestDiff:
+        """Airports added, removed and changed since `previous`. Everything is added if it is None."""
+        if previous is None:
+            return ManifestDiff(added=sorted(self.hashes))
+
+        old = previous.hashes
+        if previous.settings != self.settings:
+            logger.info("Settings changed since the previous manifest, every airport is reprocessed.")
+            old = {}
+
+        result = ManifestDiff(removed=sorted(set(previous.hashes) - set(self.hashes)))
+        for ident, digest in sorted(self.hashes.items()):
+            if ident not in old:
+                (result.changed if ident in previous.hashes else result.added).append(ident)
+            elif old[ident] != digest:
+                result.changed.append(ident)
+            else:
+                result.unchanged.append(ident)
+
+        return result
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Compare an apt.dat file against the manifest of a previous run.")
+    parser.add_argument("path", help="apt.dat file")
+    parser.add_argument("manifest", help="manifest of the previous run")
+    parser.add_argument("--list", action="store_true", help="print the added, removed and changed airports")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    previous = Manifest.load(args.manifest)
+    current = Manifest.from_apt(args.path, previous.settings if previous is not None else None)
+    diff = current.diff(previous)
+
+    print(diff)
+    if args.list:
+        for status in ("added", "removed", "changed"):
+            for ident in getattr(diff, status):
+                print(f"{status}\t{ident}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import TYPE_CHECKING, Iterable, Optional
+
+import numpy as np
+
+from base import ParsedAirport, VALID_FEATURES, _BASE_CRS
+from columnar import RaggedGeometry, airport_geometry
+
+if TYPE_CHECKING:
+    from pyproj import Transformer
+
+
+@lru_cache(maxsize=None)
+def get_transformer(src_crs: str, dst_crs: str) -> Transformer:
+    """Shared, always_xy `Transformer` for a CRS pair. Building one costs milliseconds."""
+    # pyproj takes longer to import than the rest of the package, so only when first needed
+    from pyproj import Transformer
+
+    return Transformer.from_crs(src_crs, dst_crs, always_xy=True)
+
+
+def transform_coords(coords: np.ndarray, dst_crs: str, src_crs: str = _BASE_CRS) -> np.ndarray:
+    """Reproject an (N, 2) array of (x, y) / (lon, lat) pairs in one call."""
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if src_crs == dst_crs or len(coords) == 0:
+        return coords.copy()
+
+    x, y = get_transformer(src_crs, dst_crs).transform(coords[:, 0], coords[:, 1])
+    return np.column_stack((x, y))
+
+
+def project_geometry(geometry: RaggedGeometry, dst_crs: str, src_crs: str = _BASE_CRS) -> RaggedGeometry:
+    return RaggedGeometry(
+        transform_coords(geometry.coords, dst_crs, src_crs),
+        geometry.part_offsets,
+        geometry.feature_offsets,
+    )
+
+
+def project_airport(
+    airport: ParsedAirport,
+    dst_crs: str,
+    features: Optional[Iterable[str]] = None,
+) -> dict[str, RaggedGeometry]:
+    """Reproject the coordinates of a whole airport with a single transform call.
+
+    The coordinates of all requested feature classes are concatenated into one
+    flat array, reprojected at once and split back into per-class
+    `RaggedGeometry` by offset.
+
+    Args:
+        airport (ParsedAirport): The airport to reproject.
+        dst_crs (str): Target CRS, e.g. "EPSG:3857".
+        features (list[str]): Feature classes to reproject, a subset of `VALID_FEATURES`.
+            Default all.
+
+    Returns:
+        dict[str, RaggedGeometry]: Reprojected geometry keyed by feature class.
+    """
+    features = VALID_FEATURES if features is None else list(features)
+    invalid = set(features) - set(VALID_FEATURES)
+    if invalid:
+        raise ValueError(f"Invalid features {sorted(invalid)}. Valid features: {', '.join(VALID_FEATURES)}.")
+
+    geometry = airport_geometry(airport)
+    geometry = {name: geometry[name] for name in features}
+
+    sizes = [len(g.coords) for g in geometry.values()]
+    projected = transform_coords(
+        np.concatenate([g.coords for g in geometry.values()]) if geometry else np.empty((0, 2)),
+        dst_crs,
+    )
+
+    split = np.split(projected, np.cumsum(sizes)[:-1])
+    return {
+        name: RaggedGeometry(coords, g.part_offsets, g.feature_offsets)
+        for (name, g), coords in zip(geometry.items(), split)
+    }
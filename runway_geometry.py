@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+from typing import Iterable, Sequence
+
+import numpy as np
+
+from classes import Runway, ShoulderSurfaceType
+from columnar import RaggedGeometry
+
+
+EARTH_RADIUS = 6371e3  # metres, as in `util.latlon_to_xy` and `Runway.calculate_vertex`
+
+# ICAO Annex 14 asks for runway and shoulders to span 60 m on code D / E runways, i.e. 7.5 m
+# a side on a 45 m runway. apt.dat does not record shoulder widths.
+_DEFAULT_SHOULDER_WIDTH = 7.5
+
+RUNWAY_SURFACES = ("runway", "shoulder", "displaced_threshold", "overrun")
+
+
+def _frames(lat_a, lon_a, lat_b, lon_b) -> tuple[tuple, tuple]:
+    """Each point A facing its point B, and B facing A.
+
+    A frame is (lat, lon, sin lat, cos lat, sin bearing, cos bearing), angles in
+    radians. Bearings are kept as their sine and cosine, so turning by 90 degrees
+    or reversing needs no trigonometry. Coincident points face north.
+    """
+    phi_a, phi_b = np.radians(lat_a), np.radians(lat_b)
+    lam_a, lam_b = np.radians(lon_a), np.radians(lon_b)
+    sin_a, cos_a, sin_b, cos_b = np.sin(phi_a), np.cos(phi_a), np.sin(phi_b), np.cos(phi_b)
+    sin_dlon, cos_dlon = np.sin(lam_b - lam_a), np.cos(lam_b - lam_a)
+
+    def heading(y, x):
+        norm = np.hypot(y, x)
+        same = norm == 0
+        norm = np.where(same, 1.0, norm)
+        return np.where(same, 0.0, y / norm), np.where(same, 1.0, x / norm)
+
+    sin_ab, cos_ab = heading(sin_dlon * cos_b, cos_a * sin_b - sin_a * cos_b * cos_dlon)
+    sin_ba, cos_ba = heading(-sin_dlon * cos_a, cos_b * sin_a - sin_b * cos_a * cos_dlon)
+
+    return (phi_a, lam_a, sin_a, cos_a, sin_ab, cos_ab), (phi_b, lam_b, sin_b, cos_b, sin_ba, cos_ba)
+
+
+def _angular(distance) -> tuple[np.ndarray, np.ndarray]:
+    """Sine and cosine of the angle a distance in metres spans at the centre of the Earth."""
+    delta = np.asarray(distance, dtype=np.float64) / EARTH_RADIUS
+    return np.sin(delta), np.cos(delta)
+
+
+def _move(frame: tuple, sin_t, cos_t, sin_d, cos_d) -> tuple[np.ndarray, np.ndarray]:
+    """(lat, lon) in radians from the frame's point along bearing t, by the angle d."""
+    _, lam, sin_phi, cos_phi, _, _ = frame
+    sin_phi2 = np.clip(sin_phi * cos_d + cos_phi * sin_d * cos_t, -1.0, 1.0)
+    lam2 = lam + np.arctan2(sin_t * sin_d * cos_phi, cos_d - sin_phi * sin_phi2)
+    return np.arcsin(sin_phi2), lam2
+
+
+def _side(frame: tuple, sin_d, cos_d) -> np.ndarray:
+    """(lon, lat) in degrees to the right of the frame's point by the angle d."""
+    _, _, _, _, sin_t, cos_t = frame
+    phi2, lam2 = _move(frame, cos_t, -sin_t, sin_d, cos_d)  # bearing + 90 degrees
+    return np.stack((np.degrees(lam2), np.degrees(phi2)), axis=-1)
+
+
+def _ring(corners: list[np.ndarray]) -> np.ndarray:
+    return np.stack(corners + corners[:1], axis=-2)
+
+
+def true_bearings(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Initial great-circle bearing in degrees [0, 360) from each point 1 to its point 2."""
+    (_, _, _, _, sin_t, cos_t), _ = _frames(lat1, lon1, lat2, lon2)
+    return np.degrees(np.arctan2(sin_t, cos_t)) % 360
+
+
+def destinations(lat, lon, bearing, distance) -> tuple[np.ndarray, np.ndarray]:
+    """(lat, lon) reached from each point after `distance` metres along `bearing` degrees.
+
+    The array form of `Runway.calculate_vertex`, on a sphere of `EARTH_RADIUS`.
+    """
+    phi, theta = np.radians(lat), np.radians(bearing)
+    frame = (phi, np.radians(lon), np.sin(phi), np.cos(phi), None, None)
+    phi2, lam2 = _move(frame, np.sin(theta), np.cos(theta), *_angular(distance))
+    return np.degrees(phi2), np.degrees(lam2)
+
+
+def strip_rings(lat_a, lon_a, lat_b, lon_b, left, right) -> np.ndarray:
+    """Closed rings of the strips running from each point A to its point B.
+
+    A strip spans the cross-track offsets `left` to `right` metres from the A-B line,
+    positive to the right when looking from A to B. Its corners are placed with the
+    true bearing at each end, so long strips follow the great circle. Rings are
+    counterclockwise in (lon, lat).
+
+    Returns:
+        np.ndarray: (N, 5, 2) (lon, lat) rings, the first corner repeated last.
+    """
+    frame_a, frame_b = _frames(lat_a, lon_a, lat_b, lon_b)
+    sin_l, cos_l = _angular(left)
+    sin_r, cos_r = _angular(right)
+    # right of A->B is left of B->A
+    return _ring([
+        _side(frame_a, sin_l, cos_l), _side(frame_a, sin_r, cos_r),
+        _side(frame_b, -sin_r, cos_r), _side(frame_b, -sin_l, cos_l),
+    ])
+
+
+def _ragged(rings: np.ndarray, counts: np.ndarray) -> RaggedGeometry:
+    # rings: (M, 5, 2) in runway order, counts: (N,) rings of each runway
+    return RaggedGeometry(
+        np.ascontiguousarray(rings.reshape(-1, 2)),
+        np.arange(len(rings) + 1, dtype=np.int64) * rings.shape[1],
+        np.concatenate(([0], np.cumsum(counts, dtype=np.int64))),
+    )
+
+
+class RunwayArrays:
+    """Columns of the numbers needed to outline many runways, of any number of airports.
+
+    `lat`, `lon`, `dthr_length` and `overrun_length` are (N, 2) arrays, one column per
+    runway end. `width` is (N,) and `has_shoulder` tells the runways whose shoulder
+    surface type is not `ShoulderSurfaceType.NONE`.
+    """
+
+    def __init__(self, lat, lon, width, dthr_length, overrun_length, has_shoulder) -> None:
+        self.lat = np.asarray(lat, dtype=np.float64).reshape(-1, 2)
+        self.lon = np.asarray(lon, dtype=np.float64).reshape(-1, 2)
+        self.width = np.asarray(width, dtype=np.float64).reshape(-1)
+        self.dthr_length = np.asarray(dthr_length, dtype=np.float64).reshape(-1, 2)
+        self.overrun_length = np.asarray(overrun_length, dtype=np.float64).reshape(-1, 2)
+        self.has_shoulder = np.asarray(has_shoulder, dtype=bool).reshape(-1)
+
+    def __len__(self) -> int:
+        return len(self.width)
+
+    @classmethod
+    def from_runways(cls, runways: Iterable[Runway]) -> "RunwayArrays":
+        rows = []
+        for runway in runways:
+            end1, end2 = runway.ends
+            rows.append((
+                end1.latitude, end2.latitude, end1.longitude, end2.longitude, runway.width,
+                end1.dthr_length, end2.dthr_length, end1.overrun_length, end2.overrun_length,
+                runway.shoulder_surface_type is not ShoulderSurfaceType.NONE,
+            ))
+
+        table = np.array(rows, dtype=np.float64).reshape(-1, 10)
+        return cls(table[:, 0:2], table[:, 2:4], table[:, 4], table[:, 5:7], table[:, 7:9], table[:, 9] != 0)
+
+
+def runway_polygons(
+    runways: RunwayArrays | Sequence[Runway],
+    shoulder_width: float = _DEFAULT_SHOULDER_WIDTH,
+) -> dict[str, RaggedGeometry]:
+    """Outlines of the runways, shoulders, displaced thresholds and overruns of many runways.
+
+    Every surface is computed for all runways at once with NumPy, from the true
+    great-circle bearing between the runway ends rather than the runway designator.
+
+    Args:
+        runways (RunwayArrays | list[Runway]): The runways, of one or many airports.
+        shoulder_width (float): Width of each shoulder, in metres. Default 7.5.
+
+    Returns:
+        dict[str, RaggedGeometry]: (lon, lat) polygons keyed by `RUNWAY_SURFACES`, with
+            one feature per runway in input order. "runway" features have one ring,
+            "shoulder" ones a left and a right ring, or none without shoulders.
+            "displaced_threshold" and "overrun" features have one ring per runway end
+            with a non-zero length, end 1 first.
+    """
+    if not isinstance(runways, RunwayArrays):
+        runways = RunwayArrays.from_runways(runways)
+
+    lat, lon = runways.lat, runways.lon
+    half_width = runways.width / 2
+    outer = half_width + shoulder_width
+
+    # corners at each end, at these offsets to the right of the end looking along the runway.
+    # The runway spans the middle two, the shoulders the outer pairs.
+    frame1, frame2 = _frames(lat[:, 0], lon[:, 0], lat[:, 1], lon[:, 1])
+    sin_h, cos_h = _angular(half_width)
+    sin_o, cos_o = _angular(outer)
+    sin_d = np.stack((-sin_o, -sin_h, sin_h, sin_o), axis=1)
+    cos_d = np.stack((cos_o, cos_h, cos_h, cos_o), axis=1)
+    c1 = _side(tuple(a[:, None] for a in frame1), sin_d, cos_d)
+    c2 = _side(tuple(a[:, None] for a in frame2), sin_d, cos_d)
+
+    has_shoulder = runways.has_shoulder
+    left = _ring([c1[has_shoulder, 0], c1[has_shoulder, 1], c2[has_shoulder, 2], c2[has_shoulder, 3]])
+    right = _ring([c1[has_shoulder, 2], c1[has_shoulder, 3], c2[has_shoulder, 0], c2[has_shoulder, 1]])
+
+    geometry = {
+        "runway": _ragged(_ring([c1[:, 1], c1[:, 2], c2[:, 1], c2[:, 2]]), np.ones(len(runways), dtype=np.int64)),
+        "shoulder": _ragged(np.stack((left, right), axis=1).reshape(-1, 5, 2), 2 * has_shoulder),
+    }
+
+    # both ends as (N, 2) frames, each looking towards the other end
+    ends = tuple(np.stack(pair, axis=1) for pair in zip(frame1, frame2))
+    width = np.repeat(half_width[:, None], 2, axis=1)
+
+    for name, lengths, direction in (
+        ("displaced_threshold", runways.dthr_length, 1.0),
+        ("overrun", runways.overrun_length, -1.0),
+    ):
+        # only the ends that have one, in runway order, end 1 first
+        present = lengths > 0
+        frame = tuple(a[present] for a in ends)
+        _, _, _, _, sin_t, cos_t = frame
+        far_lat, far_lon = _move(frame, direction * sin_t, direction * cos_t, *_angular(lengths[present]))
+        rings = strip_rings(
+            lat[present], lon[present], np.degrees(far_lat), np.degrees(far_lon),
+            -width[present], width[present])
+        geometry[name] = _ragged(rings, present.sum(axis=1))
+
+    return geometry
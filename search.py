@@ -0,0 +1,464 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import math
+import mmap
+import os
+import sqlite3
+from dataclasses import asdict, dataclass, field
+from typing import Iterable, Optional
+
+from index import AptIndex
+from log import configure_logging
+from manifest import Manifest, ManifestDiff
+
+
+logger = logging.getLogger("xplane_apt_convert")
+
+# Bump whenever the schema or what is extracted changes, so existing databases are rebuilt.
+_SEARCH_VERSION = 2
+_SEARCH_SUFFIX = ".search.sqlite"
+
+EARTH_RADIUS = 6371e3  # metres, as in `runway_geometry`
+
+_HEADER_CODES = (b"1", b"16", b"17")
+_METADATA_CODE = b"1302"
+# rows whose coordinates stand in for a missing datum: runway, water runway, helipad
+_POSITION_CODES = (b"100", b"101", b"102")
+
+_COLUMNS = (
+    "ident", "kind", "name", "name_key", "elevation", "latitude", "longitude", "iata_code",
+    "icao_code", "faa_code", "country", "country_key", "country_code", "region_code", "city",
+    "state", "metadata", "digest",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS airports (
+    ident TEXT PRIMARY KEY,
+    kind INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    elevation REAL,
+    latitude REAL,
+    longitude REAL,
+    iata_code TEXT,
+    icao_code TEXT,
+    faa_code TEXT,
+    country TEXT,
+    country_key TEXT,
+    country_code TEXT,
+    region_code TEXT,
+    city TEXT,
+    state TEXT,
+    metadata TEXT NOT NULL,
+    digest TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS airports_iata ON airports (iata_code);
+CREATE INDEX IF NOT EXISTS airports_icao ON airports (icao_code);
+CREATE INDEX IF NOT EXISTS airports_country_key ON airports (country_key);
+CREATE INDEX IF NOT EXISTS airports_country_code ON airports (country_code);
+CREATE INDEX IF NOT EXISTS airports_region ON airports (region_code);
+CREATE INDEX IF NOT EXISTS airports_name ON airports (name_key);
+CREATE INDEX IF NOT EXISTS airports_position ON airports (latitude, longitude);
+"""
+
+
+@dataclass(slots=True, frozen=True)
+class AirportRecord:
+    """Header and `1302` metadata fields of one airport, as stored in the search index.
+
+    `kind` is the header row code: 1 airport, 16 seaport, 17 heliport. `latitude` and
+    `longitude` are the datum of the metadata, or the first runway, water runway or
+    helipad when the airport has none. Codes are upper case. `metadata` holds every
+    `1302` row as written.
+    """
+
+    ident: str
+    kind: int
+    name: str
+    elevation: Optional[float]
+    latitude: Optional[float]
+    longitude: Optional[float]
+    iata_code: Optional[str] = None
+    icao_code: Optional[str] = None
+    faa_code: Optional[str] = None
+    country: Optional[str] = None
+    region_code: Optional[str] = None
+    city: Optional[str] = None
+    state: Optional[str] = None
+    metadata: dict[str, Optional[str]] = field(default_factory=dict, compare=False)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _float(value) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _code(value: Optional[str]) -> Optional[str]:
+    """An airport or region code as stored and looked up: stripped and upper case."""
+    value = value.strip().upper() if value else None
+    return value or None
+
+
+def _country_keys(country: Optional[str]) -> tuple[Optional[str], Optional[str]]:
+    """Case-folded name and alpha-3 code of a country value.
+
+    Values are either a name, or an ISO 3166 alpha-3 code followed by the name, as in
+    "DZA Algeria". A lone three letter value is taken as a code, in any case, but a
+    leading one only in upper case, so "New Zealand" stays a name.
+    """
+    if not country or not country.strip():
+        return None, None
+    tokens = country.split(None, 1)
+    if len(tokens[0]) == 3 and tokens[0].isalpha() and (len(tokens) == 1 or tokens[0].isupper()):
+        return (tokens[1].casefold() if len(tokens) > 1 else None), tokens[0].upper()
+    return country.casefold(), None
+
+
+def _position(tokens: list[bytes]) -> Optional[tuple[float, float]]:
+    """Middle of a runway or water runway, or the helipad, of a position row."""
+    code = tokens[0]
+    if code == b"100" and len(tokens) > 19:
+        ends = ((tokens[9], tokens[10]), (tokens[18], tokens[19]))
+    elif code == b"101" and len(tokens) > 8:
+        ends = ((tokens[4], tokens[5]), (tokens[7], tokens[8]))
+    elif code == b"102" and len(tokens) > 3:
+        ends = ((tokens[2], tokens[3]),)
+    else:
+        return None
+
+    points = [(_float(lat), _float(lon)) for lat, lon in ends]
+    if any(lat is None or lon is None for lat, lon in points):
+        return None
+    return sum(lat for lat, _ in points) / len(points), sum(lon for _, lon in points) / len(points)
+
+
+def extract_record(block: bytes) -> Optional[AirportRecord]:
+    """The `AirportRecord` of one airport's apt.dat record block, as sliced by `AptIndex`.
+
+    Only the header, the `1302` rows and the first position row are tokenized.
+
+    Returns:
+        AirportRecord: The record, or None if the block does not start with a header.
+    """
+    header = None
+    metadata = {}
+    fallback = None
+
+    for line in block.splitlines():
+        code = line[:5].split(None, 1)
+        if not code:
+            continue
+        code = code[0]
+
+        if code in _HEADER_CODES and header is None:
+            header = line.split(None, 5)
+        elif code == _METADATA_CODE:
+            tokens = line.decode("utf-8", "replace").split(None, 2)
+            if len(tokens) > 1:
+                metadata[tokens[1]] = tokens[2].strip() if len(tokens) > 2 else None
+        elif code in _POSITION_CODES and fallback is None:
+            fallback = _position(line.split())
+
+    if header is None or len(header) < 5:
+        return None
+
+    latitude, longitude = _float(metadata.get("datum_lat")), _float(metadata.get("datum_lon"))
+    if (latitude is None or longitude is None) and fallback is not None:
+        latitude, longitude = fallback
+
+    return AirportRecord(
+        ident=header[4].decode("utf-8", "replace"),
+        kind=int(header[0]),
+        name=header[5].decode("utf-8", "replace").strip() if len(header) > 5 else "",
+        elevation=_float(header[1]),
+        latitude=latitude,
+        longitude=longitude,
+        iata_code=_code(metadata.get("iata_code")),
+        icao_code=_code(metadata.get("icao_code")),
+        faa_code=_code(metadata.get("faa_code")),
+        country=metadata.get("country") or None,
+        region_code=_code(metadata.get("region_code")),
+        city=metadata.get("city") or None,
+        state=metadata.get("state") or None,
+        metadata=metadata,
+    )
+
+
+def _row(record: AirportRecord, digest: str) -> tuple:
+    return (
+        record.ident, record.kind, record.name, record.name.casefold(), record.elevation,
+        record.latitude, record.longitude, record.iata_code, record.icao_code, record.faa_code,
+        record.country, *_country_keys(record.country), record.region_code, record.city, record.state,
+        json.dumps(record.metadata, separators=(",", ":")), digest,
+    )
+
+
+def _record(row: sqlite3.Row) -> AirportRecord:
+    return AirportRecord(
+        ident=row["ident"], kind=row["kind"], name=row["name"], elevation=row["elevation"],
+        latitude=row["latitude"], longitude=row["longitude"], iata_code=row["iata_code"],
+        icao_code=row["icao_code"], faa_code=row["faa_code"], country=row["country"],
+        region_code=row["region_code"], city=row["city"], state=row["state"],
+        metadata=json.loads(row["metadata"]),
+    )
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in metres between two points, on a sphere of `EARTH_RADIUS`."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+class AirportSearch:
+    """SQLite index of the header and `1302` metadata of every airport in an apt.dat file.
+
+    The database is a sidecar of the apt.dat file, next to the `AptIndex` one, and
+    holds one row per airport with indexed IATA and ICAO codes, country, region,
+    name and datum. Lookups need no parse and only the standard library.
+
+    `refresh` brings the database up to date with the file. Airports are compared by
+    the SHA-256 of their record block, as in `manifest.Manifest`, so only added and
+    changed airports are read again.
+
+    Args:
+        path (str): Path to the apt.dat file.
+        database (str): Path to the SQLite database. Default `path` + ".search.sqlite".
+    """
+
+    def __init__(self, path: str, database: Optional[str] = None) -> None:
+        self.path = path
+        self.database = database if database is not None else self.sidecar_path(path)
+        self._connection = sqlite3.connect(self.database)
+        self._connection.row_factory = sqlite3.Row
+
+        with self._connection:
+            if self._info("version") != str(_SEARCH_VERSION):
+                self._connection.executescript(
+                    "DROP TABLE IF EXISTS airports; DROP TABLE IF EXISTS info;")
+            self._connection.executescript(_SCHEMA)
+            self._set_info("version", _SEARCH_VERSION)
+
+    @staticmethod
+    def sidecar_path(path: str) -> str:
+        return path + _SEARCH_SUFFIX
+
+    @classmethod
+    def open(cls, path: str, database: Optional[str] = None) -> "AirportSearch":
+        """Open the search index of `path`, refreshing it first if the file changed."""
+        search = cls(path, database)
+        if search.is_stale():
+            search.refresh()
+        return search
+
+    def _info(self, key: str) -> Optional[str]:
+        try:
+            row = self._connection.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        except sqlite3.OperationalError:  # a new database
+            return None
+        return row[0] if row is not None else None
+
+    def _set_info(self, key: str, value) -> None:
+        self._connection.execute("INSERT OR REPLACE INTO info VALUES (?, ?)", (key, str(value)))
+
+    def is_stale(self) -> bool:
+        """Whether the apt.dat file changed size or modification time since the last refresh."""
+        stat = os.stat(self.path)
+        return (
+            self._info("size") != str(stat.st_size)
+            or self._info("mtime_ns") != str(stat.st_mtime_ns)
+        )
+
+    def refresh(self) -> ManifestDiff:
+        """Bring the database up to date with the apt.dat file.
+
+        Returns:
+            ManifestDiff: The airports added, removed, changed and left unchanged.
+        """
+        logger.info(f"Refreshing the search index of {self.path}.")
+        stat = os.stat(self.path)
+        index = AptIndex.open(self.path)
+        current = Manifest(Manifest.hash_airports(self.path, index))
+        previous = Manifest({
+            ident: digest for ident, digest in self._connection.execute("SELECT ident, digest FROM airports")})
+        diff = current.diff(previous)
+
+        rows = []
+        if diff.to_process:
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                for ident in diff.to_process:
+                    start, length = index.entries[ident]
+                    record = extract_record(m[start:start + length])
+                    if record is None:
+                        logger.warning(f"Skipping {ident}, its record block has no header.")
+                        continue
+                    rows.append(_row(record, current.hashes[ident]))
+
+        with self._connection:
+            self._connection.executemany(
+                "DELETE FROM airports WHERE ident = ?", [(ident,) for ident in diff.removed])
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO airports ({', '.join(_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(_COLUMNS))})",
+                rows,
+            )
+            self._set_info("size", stat.st_size)
+            self._set_info("mtime_ns", stat.st_mtime_ns)
+
+        logger.info(f"Search index of {self.path}: {diff}.")
+        return diff
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "AirportSearch":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM airports").fetchone()[0]
+
+    def _query(self, where: str, parameters: Iterable = (), limit: Optional[int] = None) -> list[AirportRecord]:
+        sql = f"SELECT * FROM airports WHERE {where} ORDER BY ident"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return [_record(row) for row in self._connection.execute(sql, tuple(parameters))]
+
+    def get(self, ident: str) -> Optional[AirportRecord]:
+        """The airport of header ident `ident`, if any."""
+        found = self._query("ident = ?", (ident,))
+        return found[0] if found else None
+
+    def by_iata(self, code: str) -> list[AirportRecord]:
+        return self._query("iata_code = ?", (_code(code),))
+
+    def by_icao(self, code: str) -> list[AirportRecord]:
+        """Airports whose `icao_code` metadata is `code`. See `get` for header idents."""
+        return self._query("icao_code = ?", (_code(code),))
+
+    def by_country(self, country: str, limit: Optional[int] = None) -> list[AirportRecord]:
+        """Airports of a country, by name, ISO 3166 alpha-3 code or both, ignoring case.
+
+        "Algeria", "DZA" and "DZA Algeria" all find the airports of country "DZA Algeria".
+        """
+        name, code = _country_keys(country)
+        if code is None:
+            return self._query("country_key = ?", (name,), limit)
+        if name is None:
+            return self._query("country_code = ?", (code,), limit)
+        return self._query("country_code = ? AND country_key = ?", (code, name), limit)
+
+    def by_region(self, region_code: str, limit: Optional[int] = None) -> list[AirportRecord]:
+        return self._query("region_code = ?", (_code(region_code),), limit)
+
+    def by_name_prefix(self, prefix: str, limit: Optional[int] = 50) -> list[AirportRecord]:
+        """Airports whose name starts with `prefix`, ignoring case."""
+        key = prefix.casefold()
+        # a range on the indexed column, as LIKE would not use the index
+        return self._query("name_key >= ? AND name_key < ?", (key, key + "\U0010ffff"), limit)
+
+    def within(
+        self,
+        latitude: float,
+        longitude: float,
+        radius: float,
+        limit: Optional[int] = None,
+    ) -> list[tuple[AirportRecord, float]]:
+        """Airports within `radius` metres of a point, nearest first.
+
+        Candidates are read from the latitude and longitude box around the circle,
+        then filtered by great-circle distance.
+
+        Returns:
+            list[tuple[AirportRecord, float]]: Each airport and its distance in metres.
+        """
+        dlat = math.degrees(radius / EARTH_RADIUS)
+        lat_min, lat_max = latitude - dlat, latitude + dlat
+
+        # the circle is widest in longitude on the side of the box nearest a pole
+        cos_lat = max(math.cos(math.radians(max(abs(lat_min), abs(lat_max)))), 0.0)
+        if lat_min <= -90 or lat_max >= 90 or cos_lat == 0 or dlat / cos_lat >= 180:
+            where, parameters = "latitude BETWEEN ? AND ?", [lat_min, lat_max]
+        else:
+            dlon = dlat / cos_lat
+            lon_min, lon_max = longitude - dlon, longitude + dlon
+            where = "latitude BETWEEN ? AND ? AND "
+            if lon_min < -180 or lon_max > 180:
+                # the box crosses the antimeridian
+                where += "(longitude >= ? OR longitude <= ?)"
+                parameters = [lat_min, lat_max, (lon_min + 540) % 360 - 180, (lon_max + 540) % 360 - 180]
+            else:
+                where += "longitude BETWEEN ? AND ?"
+                parameters = [lat_min, lat_max, lon_min, lon_max]
+
+        found = []
+        for record in self._query(where, parameters):
+            distance = haversine(latitude, longitude, record.latitude, record.longitude)
+            if distance <= radius:
+                found.append((record, distance))
+
+        found.sort(key=lambda item: (item[1], item[0].ident))
+        return found if limit is None else found[:limit]
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Look airports of an apt.dat file up by code, country, region, name or position.")
+    parser.add_argument("path", help="apt.dat file")
+    parser.add_argument("--database", default=None, help="search index to use. Default next to the file")
+    query = parser.add_mutually_exclusive_group()
+    query.add_argument("--ident", default=None, help="header ident")
+    query.add_argument("--iata", default=None, help="IATA code")
+    query.add_argument("--icao", default=None, help="ICAO code")
+    query.add_argument("--country", default=None, help="country name or ISO 3166 alpha-3 code")
+    query.add_argument("--region", default=None, help="region code")
+    query.add_argument("--name", default=None, help="name prefix")
+    query.add_argument("--near", nargs=3, type=float, default=None, metavar=("LAT", "LON", "RADIUS_KM"),
+                       help="airports within RADIUS_KM of a point")
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    with AirportSearch.open(args.path, args.database) as search:
+        if args.ident is not None:
+            found = [record for record in [search.get(args.ident)] if record is not None]
+        elif args.iata is not None:
+            found = search.by_iata(args.iata)
+        elif args.icao is not None:
+            found = search.by_icao(args.icao)
+        elif args.country is not None:
+            found = search.by_country(args.country, args.limit)
+        elif args.region is not None:
+            found = search.by_region(args.region, args.limit)
+        elif args.name is not None:
+            found = search.by_name_prefix(args.name, args.limit or 50)
+        elif args.near is not None:
+            lat, lon, radius_km = args.near
+            found = [
+                {**record.to_dict(), "distance": distance}
+                for record, distance in search.within(lat, lon, radius_km * 1e3, args.limit)
+            ]
+        else:
+            print(f"{len(search)} airports indexed.")
+            return 0
+
+    for record in found:
+        print(json.dumps(record if isinstance(record, dict) else record.to_dict()))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,310 @@
+from __future__ import annotations
+
+import heapq
+import math
+from typing import Iterable, Optional
+
+import numpy as np
+
+from columnar import RaggedGeometry, airport_geometry
+from runway_geometry import runway_polygons
+from util import latlon_to_xy
+
+
+_DEFAULT_NODE_CAPACITY = 16
+
+# feature classes covered by the index and how their geometry is interpreted
+INDEXED_FEATURES = {
+    "pavements": "polygon",
+    "runways": "polygon",
+    "linear_features": "line",
+    "signs": "point",
+    "windsocks": "point",
+    "startup_locations": "point",
+}
+
+
+class STRTree:
+    """Static, packed Sort-Tile-Recursive R-tree over axis-aligned bounding boxes.
+
+    Every level is stored as a flat (M, 4) array of (minx, miny, maxx, maxy).
+    The children of node `i` are nodes `i * capacity:(i + 1) * capacity` of the
+    level below, so queries walk the tree one level at a time with array operations.
+    """
+
+    def __init__(self, bounds: np.ndarray, capacity: int = _DEFAULT_NODE_CAPACITY) -> None:
+        bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+        self.capacity = capacity
+        self.order = self._sort(bounds)
+
+        level = bounds[self.order]
+        self.levels = [level]
+        while len(level) > 1:
+            level = self._parents(level)
+            self.levels.append(level)
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def _sort(self, bounds: np.ndarray) -> np.ndarray:
+        n = len(bounds)
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        cx = (bounds[:, 0] + bounds[:, 2]) / 2
+        cy = (bounds[:, 1] + bounds[:, 3]) / 2
+
+        n_leaves = math.ceil(n / self.capacity)
+        n_slices = math.ceil(math.sqrt(n_leaves))
+        slice_size = n_slices * self.capacity
+
+        by_x = np.argsort(cx, kind="stable")
+        order = [
+            s[np.argsort(cy[s], kind="stable")]
+            for s in (by_x[i:i + slice_size] for i in range(0, n, slice_size))
+        ]
+        return np.concatenate(order)
+
+    def _parents(self, level: np.ndarray) -> np.ndarray:
+        starts = np.arange(0, len(level), self.capacity)
+        return np.column_stack((
+            np.minimum.reduceat(level[:, 0], starts),
+            np.minimum.reduceat(level[:, 1], starts),
+            np.maximum.reduceat(level[:, 2], starts),
+            np.maximum.reduceat(level[:, 3], starts),
+        ))
+
+    def _children(self, nodes: np.ndarray, level: int) -> np.ndarray:
+        children = (nodes[:, None] * self.capacity + np.arange(self.capacity)).ravel()
+        return children[children < len(self.levels[level - 1])]
+
+    def query(self, bbox: tuple[float, float, float, float]) -> np.ndarray:
+        """Indices of the boxes intersecting `bbox` = (minx, miny, maxx, maxy)."""
+        if len(self) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        minx, miny, maxx, maxy = bbox
+        nodes = np.arange(len(self.levels[-1]))
+
+        for level in range(len(self.levels) - 1, -1, -1):
+            b = self.levels[level][nodes]
+            nodes = nodes[(b[:, 0] <= maxx) & (b[:, 2] >= minx) & (b[:, 1] <= maxy) & (b[:, 3] >= miny)]
+
+            if level > 0:
+                nodes = self._children(nodes, level)
+
+        return self.order[nodes]
+
+    @staticmethod
+    def _box_distance(b: np.ndarray, x: float, y: float) -> np.ndarray:
+        dx = np.maximum(np.maximum(b[:, 0] - x, x - b[:, 2]), 0.0)
+        dy = np.maximum(np.maximum(b[:, 1] - y, y - b[:, 3]), 0.0)
+        return np.hypot(dx, dy)
+
+    def nearest(self, x: float, y: float, distance=None) -> Iterable[tuple[float, int]]:
+        """Yield `(distance, index)` in increasing distance from (x, y).
+
+        Args:
+            distance (callable): Exact distance from (x, y) to box `index`. It must
+                never be smaller than the distance to the box itself. Defaults to
+                the box distance.
+        """
+        if len(self) == 0:
+            return
+
+        top = len(self.levels) - 1
+        heap = [(d, top, i) for i, d in enumerate(self._box_distance(self.levels[top], x, y).tolist())]
+        heapq.heapify(heap)
+
+        while heap:
+            d, level, i = heapq.heappop(heap)
+
+            if level < 0:
+                yield d, i
+            elif level == 0:
+                item = int(self.order[i])
+                exact = d if distance is None else distance(item)
+                heapq.heappush(heap, (exact, -1, item))
+            else:
+                children = self._children(np.array([i]), level)
+                dists = self._box_distance(self.levels[level - 1][children], x, y)
+                for c, cd in zip(children.tolist(), dists.tolist()):
+                    heapq.heappush(heap, (cd, level - 1, c))
+
+
+def _points_in_rings(x: float, y: float, rings: list[np.ndarray]) -> bool:
+    """Even-odd point in polygon test over all rings, so holes are respected."""
+    inside = False
+    for ring in rings:
+        xi, yi = ring[:, 0], ring[:, 1]
+        xj, yj = np.roll(xi, 1), np.roll(yi, 1)
+        crosses = ((yi > y) != (yj > y)) & (x < (xj - xi) * (y - yi) / np.where(yj == yi, 1.0, yj - yi) + xi)
+        inside ^= bool(np.count_nonzero(crosses) % 2)
+
+    return inside
+
+
+def _distance_to_parts(x: float, y: float, parts: list[np.ndarray], closed: bool) -> float:
+    best = math.inf
+    for part in parts:
+        if closed and len(part) > 2:
+            part = np.vstack((part, part[:1]))
+
+        if len(part) == 1:
+            best = min(best, math.hypot(part[0, 0] - x, part[0, 1] - y))
+            continue
+
+        a, b = part[:-1], part[1:]
+        ab = b - a
+        length2 = (ab * ab).sum(axis=1)
+        t = np.clip(((x - a[:, 0]) * ab[:, 0] + (y - a[:, 1]) * ab[:, 1]) / np.where(length2 == 0, 1.0, length2), 0, 1)
+        best = min(best, float(np.hypot(a[:, 0] + t * ab[:, 0] - x, a[:, 1] + t * ab[:, 1] - y).min()))
+
+    return best
+
+
+class SpatialIndex:
+    """Spatial index over the features of a `ParsedAirport`.
+
+    Features are indexed by bounding box in local metres around the airport, in one
+    `STRTree` per feature class. Trees are built on the first query that needs them.
+    Queries take and distances are returned in (lon, lat) and metres.
+    """
+
+    def __init__(self, airport) -> None:
+        self._airport = airport
+        self._geometry = None
+        self._trees = {}
+
+        datum_lat, datum_lon = airport.metadata.get("datum_lat"), airport.metadata.get("datum_lon")
+        if datum_lat and datum_lon:
+            self.ref_lat, self.ref_lon = float(datum_lat), float(datum_lon)
+        elif airport.runways:
+            self.ref_lat, self.ref_lon = airport.runways[0].ends[0].latitude, airport.runways[0].ends[0].longitude
+        else:
+            self.ref_lat, self.ref_lon = 0.0, 0.0
+
+    def _to_xy(self, lon, lat):
+        return latlon_to_xy(lat, lon, self.ref_lat, self.ref_lon)
+
+    def _features(self, name: str) -> list:
+        return getattr(self._airport, name)
+
+    def _tree(self, name: str) -> tuple[STRTree, RaggedGeometry]:
+        if name not in INDEXED_FEATURES:
+            raise ValueError(f"Invalid feature {name}. Valid features: {', '.join(INDEXED_FEATURES)}.")
+
+        if name not in self._trees:
+            if name == "runways":
+                # runways are indexed by their surface, not their centerline
+                lonlat = runway_polygons(self._airport.runways)["runway"]
+            else:
+                if self._geometry is None:
+                    self._geometry = airport_geometry(self._airport)
+                lonlat = self._geometry[name]
+            x, y = self._to_xy(lonlat.coords[:, 0], lonlat.coords[:, 1])
+            geometry = RaggedGeometry(np.column_stack((x, y)), lonlat.part_offsets, lonlat.feature_offsets)
+
+            # features without coordinates get an empty (inverted) box that never matches.
+            # coordinates are contiguous, so reducing from each non-empty start to the
+            # next one covers exactly one feature
+            starts = geometry.part_offsets[geometry.feature_offsets[:-1]]
+            ends = geometry.part_offsets[geometry.feature_offsets[1:]]
+            bounds = np.tile([np.inf, np.inf, -np.inf, -np.inf], (len(geometry), 1))
+            non_empty = ends > starts
+            if non_empty.any():
+                c = geometry.coords
+                s = starts[non_empty]
+                bounds[non_empty] = np.column_stack((
+                    np.minimum.reduceat(c[:, 0], s), np.minimum.reduceat(c[:, 1], s),
+                    np.maximum.reduceat(c[:, 0], s), np.maximum.reduceat(c[:, 1], s),
+                ))
+
+            self._trees[name] = (STRTree(bounds), geometry)
+
+        return self._trees[name]
+
+    def _names(self, features: Optional[Iterable[str]]) -> list[str]:
+        return list(INDEXED_FEATURES) if features is None else list(features)
+
+    def query_indices(
+        self,
+        bbox: tuple[float, float, float, float],
+        features: Optional[Iterable[str]] = None,
+    ) -> dict[str, np.ndarray]:
+        """Sorted indices, per feature class, of the features whose bounding box intersects `bbox`."""
+        minx, miny = self._to_xy(bbox[0], bbox[1])
+        maxx, maxy = self._to_xy(bbox[2], bbox[3])
+
+        return {
+            name: np.sort(self._tree(name)[0].query((minx, miny, maxx, maxy)))
+            for name in self._names(features)
+        }
+
+    def query(
+        self,
+        bbox: tuple[float, float, float, float],
+        features: Optional[Iterable[str]] = None,
+    ) -> list[tuple[str, object]]:
+        """Features whose bounding box intersects `bbox` = (min_lon, min_lat, max_lon, max_lat).
+
+        Returns:
+            list[tuple[str, object]]: (feature class, feature) pairs.
+        """
+        results = []
+        for name, indices in self.query_indices(bbox, features).items():
+            objects = self._features(name)
+            results.extend((name, objects[i]) for i in indices.tolist())
+
+        return results
+
+    def _distance(self, name: str, geometry: RaggedGeometry, j: int, x: float, y: float) -> float:
+        parts = geometry.feature(j)
+        kind = INDEXED_FEATURES[name]
+
+        if kind == "polygon" and _points_in_rings(x, y, parts):
+            return 0.0
+
+        return _distance_to_parts(x, y, parts, closed=kind == "polygon")
+
+    def nearest(
+        self,
+        lon: float,
+        lat: float,
+        k: int = 1,
+        features: Optional[Iterable[str]] = None,
+    ) -> list[tuple[float, str, object]]:
+        """The `k` features nearest to a point, by exact distance to their geometry.
+
+        Returns:
+            list[tuple[float, str, object]]: (distance in metres, feature class, feature),
+                nearest first.
+        """
+        x, y = self._to_xy(lon, lat)
+
+        def _stream(name):
+            tree, geometry = self._tree(name)
+            objects = self._features(name)
+            for d, i in tree.nearest(x, y, lambda j: self._distance(name, geometry, j, x, y)):
+                yield d, name, objects[i]
+
+        streams = [_stream(name) for name in self._names(features)]
+
+        results = []
+        for item in heapq.merge(*streams, key=lambda item: item[0]):
+            results.append(item)
+            if len(results) >= k:
+                break
+
+        return results
+
+    def pavements_at(self, lon: float, lat: float) -> list:
+        """Pavements containing the point, holes excluded."""
+        x, y = self._to_xy(lon, lat)
+        tree, geometry = self._tree("pavements")
+
+        return [
+            self._airport.pavements[j]
+            for j in np.sort(tree.query((x, y, x, y))).tolist()
+            if _points_in_rings(x, y, geometry.feature(j))
+        ]
@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import heapq
+import json
+import logging
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+import numpy as np
+
+from log import configure_logging
+
+
+logger = logging.getLogger("xplane_apt_convert")
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+# stats of the airport being parsed, read by the node chain walk in `geometry`
+_current: Optional["ParseStats"] = None
+
+
+def current_stats() -> Optional["ParseStats"]:
+    """The `ParseStats` collecting for the parse in progress, if any."""
+    return _current
+
+
+@contextlib.contextmanager
+def collecting(stats: "ParseStats") -> Iterator["ParseStats"]:
+    """Make `stats` the target of `current_stats()` for the duration of the block."""
+    global _current
+    previous, _current = _current, stats
+    try:
+        yield stats
+    finally:
+        _current = previous
+
+
+@dataclass
+class ParseStats:
+    """What parsing one airport cost.
+
+    `timings` holds wall seconds per stage: "tokenize", "scan", "chain_walk",
+    "tessellation", "feature_build", "triangulation", "columnar" and "export". A stage's time
+    excludes the stages nested in it, so the stages add up to the whole parse.
+    `feature_seconds` is the total time spent materializing each feature class.
+    `peak_memory` is the tracemalloc high-water mark reached while parsing, in bytes
+    above what was allocated when the parse started. It is only recorded when
+    tracemalloc is tracing, since tracing slows parsing down several times.
+    """
+
+    ident: Optional[str] = None
+    row_counts: dict[int, int] = field(default_factory=dict)
+    timings: dict[str, float] = field(default_factory=dict)
+    feature_seconds: dict[str, float] = field(default_factory=dict)
+    vertices: dict[str, int] = field(default_factory=dict)
+    peak_memory: Optional[int] = None
+    _stack: list = field(default_factory=list, repr=False, compare=False)
+    _memory_base: Optional[int] = field(default=None, repr=False, compare=False)
+
+    @property
+    def seconds(self) -> float:
+        return sum(self.timings.values())
+
+    @property
+    def n_rows(self) -> int:
+        return sum(self.row_counts.values())
+
+    @property
+    def n_vertices(self) -> int:
+        return sum(self.vertices.values())
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+        if self._stack:
+            self._stack[-1][1] += seconds
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the block as stage `name`, less the stages recorded inside it."""
+        frame = [time.perf_counter(), 0.0]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - frame[0]
+            self.add_time(name, elapsed - frame[1])
+            if self._stack:
+                # the nested time was already credited to the parent through add_time
+                self._stack[-1][1] += frame[1]
+
+    @contextlib.contextmanager
+    def memory(self) -> Iterator[None]:
+        """Record the tracemalloc peak of the block into `peak_memory`, if tracing."""
+        if not tracemalloc.is_tracing():
+            yield
+            return
+
+        current, _ = tracemalloc.get_traced_memory()
+        if self._memory_base is None:
+            self._memory_base = current
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            self.peak_memory = max(self.peak_memory or 0, peak - self._memory_base)
+
+    def count_rows(self, row_codes) -> None:
+        codes, counts = np.unique(np.asarray(row_codes, dtype=np.int64), return_counts=True)
+        _add_into(self.row_counts, dict(zip(codes.tolist(), counts.tolist())))
+
+    def to_dict(self) -> dict:
+        """JSON-ready copy. Row codes become string keys."""
+        return {
+            "ident": self.ident,
+            "seconds": self.seconds,
+            "timings": dict(self.timings),
+            "feature_seconds": dict(self.feature_seconds),
+            "row_counts": {str(int(k)): v for k, v in sorted(self.row_counts.items())},
+            "vertices": dict(self.vertices),
+            "peak_memory": self.peak_memory,
+        }
+
+
+def _add_into(totals: dict, values: dict) -> None:
+    for key, value in values.items():
+        totals[key] = totals.get(key, 0) + value
+
+
+class StatsAggregate:
+    """Sums of the `ParseStats` of many airports, plus the slowest and largest of them.
+
+    Args:
+        top (int): Number of airports kept in each of the slowest, most vertices and
+            largest memory peak lists. Default 20.
+    """
+
+    def __init__(self, top: int = 20) -> None:
+        self.top = top
+        self.n_airports = 0
+        self.row_counts: dict[int, int] = {}
+        self.timings: dict[str, float] = {}
+        self.feature_seconds: dict[str, float] = {}
+        self.vertices: dict[str, int] = {}
+        self.peak_memory: Optional[int] = None
+        self._slowest = []
+        self._most_vertices = []
+        self._largest_peak = []
+
+    def _keep(self, heap: list, key: float, stats: ParseStats) -> None:
+        # min-heap of the `top` largest keys. The counter breaks ties without comparing dicts.
+        item = (key, self.n_airports, stats.to_dict())
+        if len(heap) < self.top:
+            heapq.heappush(heap, item)
+        elif key > heap[0][0]:
+            heapq.heapreplace(heap, item)
+
+    def add(self, stats: ParseStats) -> None:
+        self.n_airports += 1
+        _add_into(self.row_counts, stats.row_counts)
+        _add_into(self.timings, stats.timings)
+        _add_into(self.feature_seconds, stats.feature_seconds)
+        _add_into(self.vertices, stats.vertices)
+
+        self._keep(self._slowest, stats.seconds, stats)
+        self._keep(self._most_vertices, stats.n_vertices, stats)
+        if stats.peak_memory is not None:
+            self.peak_memory = max(self.peak_memory or 0, stats.peak_memory)
+            self._keep(self._largest_peak, stats.peak_memory, stats)
+
+    def to_dict(self) -> dict:
+        def ranked(heap):
+            return [item[2] for item in sorted(heap, key=lambda item: (-item[0], item[1]))]
+
+        return {
+            "n_airports": self.n_airports,
+            "seconds": sum(self.timings.values()),
+            "timings": self.timings,
+            "feature_seconds": self.feature_seconds,
+            "row_counts": {str(int(k)): v for k, v in sorted(self.row_counts.items())},
+            "vertices": self.vertices,
+            "peak_memory": self.peak_memory,
+            "slowest": ranked(self._slowest),
+            "most_vertices": ranked(self._most_vertices),
+            "largest_peak_memory": ranked(self._largest_peak),
+        }
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+
+@contextlib.contextmanager
+def profile(output: Optional[str] = None, profiler: str = "cprofile") -> Iterator[None]:
+    """Profile the block with cProfile or pyinstrument.
+
+    Args:
+        output (str): File to save the profile to, a `pstats` dump for cProfile or an
+            HTML report for pyinstrument. Default None, print a summary instead.
+        profiler (str): One of `PROFILERS`. Default "cprofile".
+    """
+    if profiler not in PROFILERS:
+        raise ValueError(f"Unknown profiler {profiler}. Valid profilers: {', '.join(PROFILERS)}.")
+
+    if profiler == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError as e:
+            raise ImportError("Could not import pyinstrument. Install it to use it: pip install pyinstrument.") from e
+
+        p = Profiler()
+        p.start()
+        try:
+            yield
+        finally:
+            p.stop()
+            if output is None:
+                print(p.output_text())
+            else:
+                with open(output, "w", encoding="utf-8") as f:
+                    f.write(p.output_html())
+        return
+
+    import cProfile
+    import pstats
+
+    p = cProfile.Profile()
+    p.enable()
+    try:
+        yield
+    finally:
+        p.disable()
+        if output is None:
+            pstats.Stats(p).sort_stats("cumulative").print_stats(25)
+        else:
+            p.dump_stats(output)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    from tokenizer import MappedAptFile
+
+    parser = argparse.ArgumentParser(description="Parse airports of an apt.dat file and print their parse stats.")
+    parser.add_argument("path", help="apt.dat file")
+    parser.add_argument("idents", nargs="*", help="airports to parse. Default all")
+    parser.add_argument("--profile", choices=PROFILERS, default=None, help="profile the parses")
+    parser.add_argument("--profile-output", default=None, help="file to save the profile to")
+    parser.add_argument("--memory", action="store_true", help="trace memory to record peaks (slow)")
+    parser.add_argument("--json", default=None, dest="json_path", help="write the aggregate stats to this file")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    aggregate = StatsAggregate()
+    if args.memory:
+        tracemalloc.start()
+
+    with MappedAptFile(args.path) as apt_file, \
+            (profile(args.profile_output, args.profile) if args.profile else contextlib.nullcontext()):
+        for ident in args.idents or list(apt_file.index):
+            try:
+                stats = apt_file.parse(ident).stats
+            except Exception as e:
+                logger.error(f"Skipping {ident}, failed to parse: {e}")
+                continue
+
+            aggregate.add(stats)
+            if args.idents:
+                print(json.dumps(stats.to_dict(), indent=1))
+
+    if args.json_path is not None:
+        aggregate.write_json(args.json_path)
+    elif not args.idents:
+        print(json.dumps({k: v for k, v in aggregate.to_dict().items() if k != "row_counts"}, indent=1))
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,431 @@
+from __future__ import annotations
+
+import heapq
+import logging
+import math
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+import numpy as np
+
+from geometry import RowCode
+from util import latlon_to_xy
+
+
+logger = logging.getLogger("xplane_apt_convert")
+
+# ICAO aircraft size classes, smallest first. Edges typed plain "taxiway" or
+# "runway" accept every size.
+SIZE_CLASSES = "ABCDEF"
+_N_LANDMARKS = 8
+
+TAXI_ROUTE_ROWS = (
+    RowCode.TAXI_ROUTE_NODE,
+    RowCode.TAXI_ROUTE_EDGE,
+    RowCode.TAXI_ROUTE_HOLD,
+    RowCode.TAXI_ROUTE_ROAD,
+)
+
+
+@dataclass
+class TaxiRoute:
+    nodes: list[int]  # node ids, as in the apt.dat file
+    edges: list[int]  # edge indices into the network's edge arrays
+    distance: float  # in metres
+    hold_shorts: list[tuple[int, tuple[str, ...]]] = field(default_factory=list)  # (node id, active zones) to hold at
+
+
+class RouteTree:
+    """Shortest paths from every node to one target, for O(path length) route lookups.
+
+    Built by `TaxiNetwork.routes_to` with a single reverse Dijkstra. `distance[i]` is
+    the distance from node `i` to the target and `next_arc[i]` the arc to take from
+    it, -1 at the target and at nodes that cannot reach it.
+    """
+
+    def __init__(self, network: "TaxiNetwork", target: int, distance: np.ndarray, next_arc: np.ndarray) -> None:
+        self.network = network
+        self.target = target
+        self.distance = distance
+        self.next_arc = next_arc
+        self._next_arc = next_arc.tolist()
+
+    def route(self, source: int) -> Optional[TaxiRoute]:
+        """Route from node id `source` to the target, or None if the target cannot be reached."""
+        network = self.network
+        i = network.index(source)
+        if not math.isfinite(self.distance[i]):
+            return None
+
+        nodes, arcs = [i], []
+        while i != self.target:
+            arc = self._next_arc[i]
+            arcs.append(arc)
+            i = network._arc_target[arc]
+            nodes.append(i)
+
+        return network._make_route(nodes, arcs)
+
+
+class TaxiNetwork:
+    """Taxi route network (rows 1200-1206) of an airport as a compact directed graph.
+
+    Nodes are indexed 0..N-1 in file order, with their apt.dat ids in `node_ids`
+    and (lon, lat) in `coords`. Every 1202/1206 edge is stored once in the `edge_*`
+    arrays. Two-way edges contribute two arcs to the CSR adjacency: the arcs leaving
+    node `i` are `indptr[i]:indptr[i + 1]`, pointing to `arc_target` along `arc_edge`.
+
+    Routes are found with A*, guided by straight-line distance and by landmark (ALT)
+    lower bounds precomputed on the whole graph. Those bounds stay admissible under any
+    edge restriction, since restrictions only remove edges. For many routes to the
+    same destination, `routes_to` builds a reusable shortest path tree instead.
+    """
+
+    def __init__(
+        self,
+        node_ids: np.ndarray,
+        coords: np.ndarray,
+        node_usage: list[str],
+        node_names: list[str],
+        edge_nodes: np.ndarray,
+        edge_oneway: np.ndarray,
+        edge_runway: np.ndarray,
+        edge_road: np.ndarray,
+        edge_size: np.ndarray,
+        edge_names: list[str],
+        edge_zones: list[tuple[str, ...]],
+    ) -> None:
+        self.node_ids = node_ids
+        self.coords = coords
+        self.node_usage = node_usage
+        self.node_names = node_names
+        self.edge_nodes = edge_nodes
+        self.edge_oneway = edge_oneway
+        self.edge_runway = edge_runway
+        self.edge_road = edge_road
+        self.edge_size = edge_size
+        self.edge_names = edge_names
+        self.edge_zones = edge_zones
+
+        self._index = {node_id: i for i, node_id in enumerate(node_ids.tolist())}
+
+        self._ref_lat, self._ref_lon = (float(coords[0, 1]), float(coords[0, 0])) if len(coords) else (0.0, 0.0)
+        x, y = latlon_to_xy(coords[:, 1], coords[:, 0], self._ref_lat, self._ref_lon)
+        self.xy = np.column_stack((x, y))
+
+        a, b = edge_nodes[:, 0], edge_nodes[:, 1]
+        self.edge_length = np.hypot(*(self.xy[b] - self.xy[a]).T)
+
+        # arcs: every edge forwards, two-way edges backwards too
+        back = np.flatnonzero(~edge_oneway)
+        arc_source = np.concatenate((a, b[back]))
+        arc_target = np.concatenate((b, a[back]))
+        arc_edge = np.concatenate((np.arange(len(edge_nodes)), back))
+
+        order = np.argsort(arc_source, kind="stable")
+        self.arc_target = arc_target[order]
+        self.arc_edge = arc_edge[order]
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(arc_source, minlength=len(node_ids)))))
+
+        # plain lists for the search loops, which index them one element at a time
+        self._indptr = self.indptr.tolist()
+        self._arc_source = arc_source[order].tolist()
+        self._arc_target = self.arc_target.tolist()
+        self._arc_edge = self.arc_edge.tolist()
+        self._arc_length = self.edge_length[self.arc_edge].tolist()
+        self._x, self._y = self.xy[:, 0].tolist(), self.xy[:, 1].tolist()
+
+        self._masks = {}
+        self._trees = {}
+        self._landmarks = None
+        self._reverse_csr = None
+
+    @classmethod
+    def from_rows(cls, rows: Iterable) -> "TaxiNetwork":
+        """Build the network from its 1201 node, 1202 edge, 1204 active zone and 1206 road rows."""
+        node_ids, coords, usage, names = [], [], [], []
+        edges, oneway, runway, road, size, edge_names, zones = [], [], [], [], [], [], []
+
+        for row in rows:
+            row_code = row.row_code
+            tokens = row.tokens
+
+            if row_code == RowCode.TAXI_ROUTE_NODE:
+                coords.append((float(tokens[2]), float(tokens[1])))
+                usage.append(tokens[3])
+                node_ids.append(int(tokens[4]))
+                names.append(" ".join(tokens[5:]))
+
+            elif row_code in (RowCode.TAXI_ROUTE_EDGE, RowCode.TAXI_ROUTE_ROAD):
+                edges.append((int(tokens[1]), int(tokens[2])))
+                oneway.append(tokens[3] == "oneway")
+                zones.append(())
+
+                if row_code == RowCode.TAXI_ROUTE_EDGE:
+                    kind = tokens[4] if len(tokens) > 4 else "taxiway"
+                    runway.append(kind == "runway")
+                    road.append(False)
+                    suffix = kind[len("taxiway_"):] if kind.startswith("taxiway_") else ""
+                    size.append(SIZE_CLASSES.index(suffix) if suffix and suffix in SIZE_CLASSES else len(SIZE_CLASSES) - 1)
+                    edge_names.append(" ".join(tokens[5:]))
+                else:
+                    runway.append(False)
+                    road.append(True)
+                    size.append(len(SIZE_CLASSES) - 1)
+                    edge_names.append(" ".join(tokens[4:]))
+
+            elif row_code == RowCode.TAXI_ROUTE_HOLD:
+                # active zone of the preceding edge, e.g. "1204 departure 09L,27R"
+                if edges:
+                    zones[-1] = zones[-1] + (f"{tokens[1]} {tokens[2] if len(tokens) > 2 else ''}".strip(),)
+
+        index = {node_id: i for i, node_id in enumerate(node_ids)}
+        keep = [a in index and b in index for a, b in edges]
+        if not all(keep):
+            logger.warning(f"Ignoring {keep.count(False)} taxi route edges with unknown nodes.")
+
+        def _kept(values):
+            return [v for v, k in zip(values, keep) if k]
+
+        return cls(
+            node_ids=np.array(node_ids, dtype=np.int64),
+            coords=np.array(coords, dtype=np.float64).reshape(-1, 2),
+            node_usage=usage,
+            node_names=names,
+            edge_nodes=np.array([(index[a], index[b]) for a, b in _kept(edges)], dtype=np.int64).reshape(-1, 2),
+            edge_oneway=np.array(_kept(oneway), dtype=bool),
+            edge_runway=np.array(_kept(runway), dtype=bool),
+            edge_road=np.array(_kept(road), dtype=bool),
+            edge_size=np.array(_kept(size), dtype=np.int8),
+            edge_names=_kept(edge_names),
+            edge_zones=_kept(zones),
+        )
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.edge_nodes)
+
+    def index(self, node_id: int) -> int:
+        """Position of apt.dat node id `node_id` in the node arrays."""
+        try:
+            return self._index[node_id]
+        except KeyError:
+            raise KeyError(f"Unknown taxi route node {node_id}.") from None
+
+    def nearest_node(self, lon: float, lat: float) -> int:
+        """Id of the node closest to a point."""
+        x, y = latlon_to_xy(lat, lon, self._ref_lat, self._ref_lon)
+        return int(self.node_ids[np.argmin(np.hypot(self.xy[:, 0] - x, self.xy[:, 1] - y))])
+
+    def _arc_mask(self, size: Optional[str], allow_runways: bool, allow_roads: bool) -> Optional[list[bool]]:
+        key = (size, allow_runways, allow_roads)
+        if key not in self._masks:
+            allowed = np.ones(self.n_edges, dtype=bool)
+            if size is not None:
+                if size not in SIZE_CLASSES:
+                    raise ValueError(f"Invalid aircraft size {size}. Valid sizes: {', '.join(SIZE_CLASSES)}.")
+                allowed &= self.edge_size >= SIZE_CLASSES.index(size)
+            if not allow_runways:
+                allowed &= ~self.edge_runway
+            if not allow_roads:
+                allowed &= ~self.edge_road
+
+            self._masks[key] = None if allowed.all() else allowed[self.arc_edge].tolist()
+
+        return self._masks[key]
+
+    def _dijkstra(self, source: int, reverse: bool = False, mask: Optional[list[bool]] = None):
+        """Distances from (or, with `reverse`, to) `source`, and the arc reaching each node."""
+        n = len(self)
+        if reverse:
+            indptr, arc_target, arc_length, arc_ids = self._reverse()
+        else:
+            indptr, arc_target, arc_length = self._indptr, self._arc_target, self._arc_length
+            arc_ids = None
+
+        dist = [math.inf] * n
+        via = [-1] * n
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+
+            for k in range(indptr[u], indptr[u + 1]):
+                arc = k if arc_ids is None else arc_ids[k]
+                if mask is not None and not mask[arc]:
+                    continue
+
+                v = arc_target[k]
+                nd = d + arc_length[k]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    via[v] = arc
+                    heapq.heappush(heap, (nd, v))
+
+        return dist, via
+
+    def _reverse(self):
+        """CSR of the reversed arcs, as lists: (indptr, source node, length, forward arc id)."""
+        if self._reverse_csr is None:
+            order = np.argsort(self.arc_target, kind="stable")
+            indptr = np.concatenate(([0], np.cumsum(np.bincount(self.arc_target, minlength=len(self)))))
+            self._reverse_csr = (
+                indptr.tolist(),
+                np.array(self._arc_source, dtype=np.int64)[order].tolist(),
+                self.edge_length[self.arc_edge[order]].tolist(),
+                order.tolist(),
+            )
+        return self._reverse_csr
+
+    def _landmark_bounds(self):
+        """Distances from and to a few far apart landmarks, for ALT lower bounds."""
+        if self._landmarks is None:
+            landmarks = []
+            # farthest point selection, starting from the node farthest from node 0
+            closest = np.hypot(self.xy[:, 0] - self.xy[0, 0], self.xy[:, 1] - self.xy[0, 1])
+            for _ in range(min(_N_LANDMARKS, len(self))):
+                landmark = int(np.argmax(closest))
+                landmarks.append(landmark)
+                closest = np.minimum(closest, np.hypot(*(self.xy - self.xy[landmark]).T))
+
+            self._landmarks = [
+                (self._dijkstra(landmark)[0], self._dijkstra(landmark, reverse=True)[0])
+                for landmark in landmarks
+            ]
+
+        return self._landmarks
+
+    def _heuristic(self, target: int):
+        tx, ty = self._x[target], self._y[target]
+        x, y = self._x, self._y
+        bounds = [
+            (from_l, to_l, from_l[target], to_l[target])
+            for from_l, to_l in self._landmark_bounds()
+            if math.isfinite(from_l[target]) or math.isfinite(to_l[target])
+        ]
+
+        def h(v: int) -> float:
+            best = math.hypot(x[v] - tx, y[v] - ty)
+            for from_l, to_l, from_l_t, to_l_t in bounds:
+                # d(v, t) >= d(L, t) - d(L, v) and d(v, t) >= d(v, L) - d(t, L)
+                lower = from_l_t - from_l[v]
+                if lower > best and lower != math.inf:
+                    best = lower
+                lower = to_l[v] - to_l_t
+                if lower > best and lower != math.inf:
+                    best = lower
+            return best
+
+        return h
+
+    def route(
+        self,
+        source: int,
+        target: int,
+        size: Optional[str] = None,
+        allow_runways: bool = True,
+        allow_roads: bool = False,
+    ) -> Optional[TaxiRoute]:
+        """Shortest route between two node ids.
+
+        Args:
+            source (int): Node id to start from.
+            target (int): Node id to reach.
+            size (str): Aircraft size class "A" to "F". Edges restricted to smaller
+                aircraft are avoided. Default no restriction.
+            allow_runways (bool): Allow taxiing along runway edges. Default True.
+            allow_roads (bool): Allow ground truck roads (1206). Default False.
+
+        Returns:
+            TaxiRoute: The route, or None if `target` cannot be reached.
+        """
+        key = (self.index(target), size, allow_runways, allow_roads)
+        if key in self._trees:
+            return self._trees[key].route(source)
+
+        s, t = self.index(source), self.index(target)
+        mask = self._arc_mask(size, allow_runways, allow_roads)
+        h = self._heuristic(t)
+        indptr, arc_target, arc_length = self._indptr, self._arc_target, self._arc_length
+
+        dist = {s: 0.0}
+        via = {}
+        heap = [(h(s), s)]
+        closed = set()
+
+        while heap:
+            _, u = heapq.heappop(heap)
+            if u == t:
+                break
+            if u in closed:
+                continue
+            closed.add(u)
+
+            d = dist[u]
+            for arc in range(indptr[u], indptr[u + 1]):
+                if mask is not None and not mask[arc]:
+                    continue
+
+                v = arc_target[arc]
+                nd = d + arc_length[arc]
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    via[v] = arc
+                    heapq.heappush(heap, (nd + h(v), v))
+        else:
+            return None
+
+        nodes, arcs = [t], []
+        while nodes[-1] != s:
+            arc = via[nodes[-1]]
+            arcs.append(arc)
+            nodes.append(self._arc_source[arc])
+
+        return self._make_route(nodes[::-1], arcs[::-1])
+
+    def routes_to(
+        self,
+        target: int,
+        size: Optional[str] = None,
+        allow_runways: bool = True,
+        allow_roads: bool = False,
+    ) -> RouteTree:
+        """Shortest path tree towards node id `target`, cached per target and restrictions.
+
+        After this, `route` calls to the same target with the same restrictions are
+        answered from the tree by walking the path, without searching.
+        """
+        t = self.index(target)
+        key = (t, size, allow_runways, allow_roads)
+
+        if key not in self._trees:
+            dist, via = self._dijkstra(t, reverse=True, mask=self._arc_mask(size, allow_runways, allow_roads))
+            self._trees[key] = RouteTree(self, t, np.array(dist), np.array(via, dtype=np.int64))
+
+        return self._trees[key]
+
+    def _make_route(self, nodes: list[int], arcs: list[int]) -> TaxiRoute:
+        edges = [self._arc_edge[arc] for arc in arcs]
+        hold_shorts = []
+        previous = ()
+
+        for i, edge in zip(nodes, edges):
+            zones = self.edge_zones[edge]
+            if self.edge_runway[edge] and not zones:
+                zones = ("runway",)
+            if zones and zones != previous:
+                hold_shorts.append((int(self.node_ids[i]), zones))
+            previous = zones
+
+        return TaxiRoute(
+            nodes=self.node_ids[nodes].tolist(),
+            edges=edges,
+            distance=float(sum(self._arc_length[arc] for arc in arcs)),
+            hold_shorts=hold_shorts,
+        )
@@ -0,0 +1,385 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterable, Optional, Union
+
+import numpy as np
+
+from base import ParsedAirport
+from columnar import RaggedGeometry
+from log import configure_logging
+from projection import project_airport, project_geometry
+from runway_geometry import runway_polygons
+from spatial import STRTree
+
+
+logger = logging.getLogger("xplane_apt_convert")
+
+TILE_SIZE = 256
+_WEB_MERCATOR_CRS = "EPSG:3857"
+_WEB_MERCATOR_HALF_SIZE = 20037508.342789244
+_DEFAULT_CHUNK_SIZE = 64
+_LINE_SAMPLES_PER_PIXEL = 2
+_POINT_RADIUS = 1  # in pixels
+
+# feature class: (RGBA colour, how to draw it), in drawing order
+TILE_STYLES = {
+    "boundary": ((128, 128, 128, 255), "line"),
+    "pavements": ((160, 160, 160, 255), "polygon"),
+    "runways": ((60, 60, 60, 255), "polygon"),
+    "linear_features": ((230, 190, 0, 255), "line"),
+    "startup_locations": ((0, 160, 0, 255), "point"),
+    "windsocks": ((220, 0, 0, 255), "point"),
+    "signs": ((200, 0, 200, 255), "point"),
+}
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """(minx, miny, maxx, maxy) of a slippy-map tile in EPSG:3857."""
+    size = 2 * _WEB_MERCATOR_HALF_SIZE / (1 << z)
+    minx = -_WEB_MERCATOR_HALF_SIZE + x * size
+    maxy = _WEB_MERCATOR_HALF_SIZE - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def tiles_for_bounds(bounds: tuple[float, float, float, float], z: int) -> list[tuple[int, int, int]]:
+    """Tiles at zoom `z` covering EPSG:3857 `bounds`."""
+    n = 1 << z
+    size = 2 * _WEB_MERCATOR_HALF_SIZE / n
+    minx, miny, maxx, maxy = bounds
+
+    x0 = min(max(int((minx + _WEB_MERCATOR_HALF_SIZE) // size), 0), n - 1)
+    x1 = min(max(int((maxx + _WEB_MERCATOR_HALF_SIZE) // size), 0), n - 1)
+    y0 = min(max(int((_WEB_MERCATOR_HALF_SIZE - maxy) // size), 0), n - 1)
+    y1 = min(max(int((_WEB_MERCATOR_HALF_SIZE - miny) // size), 0), n - 1)
+
+    return [(z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def write_png(path: str, rgba: np.ndarray) -> None:
+    """Write an (H, W, 4) uint8 array as an RGBA PNG, using only zlib."""
+    height, width, _ = rgba.shape
+    raw = np.zeros((height, 1 + width * 4), dtype=np.uint8)  # filter byte 0 on every row
+    raw[:, 1:] = rgba.reshape(height, -1)
+
+    def _chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)))
+        f.write(_chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)))
+        f.write(_chunk(b"IEND", b""))
+
+
+def fill_polygons(rings: list[np.ndarray], groups: list[int], size: int = TILE_SIZE) -> np.ndarray:
+    """Scanline-fill polygons given as pixel-space rings, with the even-odd rule.
+
+    Rings sharing a group id belong to the same polygon, so inner rings cut holes
+    into it. Different groups are filled independently and OR'ed together.
+
+    Returns:
+        np.ndarray: (size, size) boolean coverage mask, sampled at pixel centres.
+    """
+    a = np.concatenate(rings)
+    b = np.concatenate([np.roll(ring, -1, axis=0) for ring in rings])
+    group = np.repeat(groups, [len(ring) for ring in rings])
+
+    (x0, y0), (x1, y1) = a.T, b.T
+    sloped = y0 != y1
+    x0, y0, x1, y1, group = x0[sloped], y0[sloped], x1[sloped], y1[sloped], group[sloped]
+
+    # rows whose centre lies in [ymin, ymax) of each edge
+    first_row = np.clip(np.ceil(np.minimum(y0, y1) - 0.5), 0, size).astype(np.int64)
+    last_row = np.clip(np.ceil(np.maximum(y0, y1) - 0.5), 0, size).astype(np.int64)
+    counts = last_row - first_row
+
+    edge = np.repeat(np.arange(len(counts)), counts)
+    row = first_row[edge] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    x = x0[edge] + (row + 0.5 - y0[edge]) * (x1[edge] - x0[edge]) / (y1[edge] - y0[edge])
+
+    # every (group, row) has an even number of crossings; pair them up in x order
+    order = np.lexsort((x, row, group[edge]))
+    row, x = row[order], x[order]
+    start = np.clip(np.ceil(x[0::2] - 0.5), 0, size).astype(np.int64)
+    end = np.clip(np.ceil(x[1::2] - 0.5), 0, size).astype(np.int64)
+    row = row[0::2]
+
+    coverage = np.zeros((size, size + 1), dtype=np.int32)
+    np.add.at(coverage, (row, start), 1)
+    np.add.at(coverage, (row, end), -1)
+    return np.cumsum(coverage[:, :size], axis=1) > 0
+
+
+def _clip_segments(a: np.ndarray, b: np.ndarray, lo: float, hi: float) -> tuple[np.ndarray, np.ndarray]:
+    """Liang-Barsky clip of segments a -> b to the square [lo, hi]^2, dropping those outside."""
+    d = b - a
+    t0, t1 = np.zeros(len(a)), np.ones(len(a))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for axis in (0, 1):
+            for p, q in ((-d[:, axis], a[:, axis] - lo), (d[:, axis], hi - a[:, axis])):
+                r = q / p
+                t0 = np.where(p < 0, np.maximum(t0, r), t0)
+                t1 = np.where(p > 0, np.minimum(t1, r), t1)
+                t0 = np.where((p == 0) & (q < 0), 1.0, t0)  # parallel and outside
+                t1 = np.where((p == 0) & (q < 0), 0.0, t1)
+
+    keep = t0 <= t1
+    a, d, t0, t1 = a[keep], d[keep], t0[keep], t1[keep]
+    return a + t0[:, None] * d, a + t1[:, None] * d
+
+
+def stroke_lines(lines: list[np.ndarray], size: int = TILE_SIZE) -> np.ndarray:
+    """One pixel wide strokes along pixel-space polylines."""
+    mask = np.zeros((size, size), dtype=bool)
+
+    segments = [np.stack((line[:-1], line[1:]), axis=1) for line in lines if len(line) > 1]
+    if not segments:
+        return mask
+
+    segments = np.concatenate(segments)
+    a, b = _clip_segments(segments[:, 0], segments[:, 1], -1.0, size + 1.0)
+    n = np.ceil(np.hypot(*(b - a).T) * _LINE_SAMPLES_PER_PIXEL).astype(np.int64) + 1
+
+    segment = np.repeat(np.arange(len(n)), n)
+    t = (np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)) / np.maximum(n[segment] - 1, 1)
+    points = a[segment] + t[:, None] * (b[segment] - a[segment])
+
+    px = np.floor(points).astype(np.int64)
+    inside = (px[:, 0] >= 0) & (px[:, 0] < size) & (px[:, 1] >= 0) & (px[:, 1] < size)
+    mask[px[inside, 1], px[inside, 0]] = True
+    return mask
+
+
+def draw_points(points: np.ndarray, size: int = TILE_SIZE, radius: int = _POINT_RADIUS) -> np.ndarray:
+    mask = np.zeros((size, size), dtype=bool)
+    px = np.floor(points).astype(np.int64)
+
+    for dx in range(-radius, radius + 1):
+        for dy in range(-radius, radius + 1):
+            x, y = px[:, 0] + dx, px[:, 1] + dy
+            inside = (x >= 0) & (x < size) & (y >= 0) & (y < size)
+            mask[y[inside], x[inside]] = True
+
+    return mask
+
+
+def _geometry_bounds(geometry: dict[str, RaggedGeometry]) -> Optional[tuple[float, float, float, float]]:
+    coords = [g.coords for g in geometry.values() if len(g.coords)]
+    if not coords:
+        return None
+    coords = np.concatenate(coords)
+    return (*coords.min(axis=0), *coords.max(axis=0))
+
+
+class TileRenderer:
+    """Rasterizes the EPSG:3857 geometry of one or more airports into XYZ tiles.
+
+    Parts are indexed by bounding box per feature class, so each tile only
+    touches the parts that can reach it.
+    """
+
+    def __init__(self, geometry: dict[str, RaggedGeometry]) -> None:
+        self.geometry = geometry
+        bounds = _geometry_bounds(geometry)
+        self.extents = [] if bounds is None else [bounds]  # of each airport with `from_airports`
+        self._trees = {}
+
+        for name, g in geometry.items():
+            bounds = np.array(
+                [(*p.min(axis=0), *p.max(axis=0)) if len(p) else (np.inf, np.inf, -np.inf, -np.inf)
+                 for p in (g.part(i) for i in range(g.n_parts))]
+            ).reshape(-1, 4)
+            self._trees[name] = STRTree(bounds)
+
+    @classmethod
+    def from_airport(cls, airport: ParsedAirport) -> "TileRenderer":
+        return cls.from_airports([airport])
+
+    @classmethod
+    def from_airports(cls, airports: Iterable[ParsedAirport]) -> "TileRenderer":
+        """Renderer of several airports at once, so that the tiles they share show all of them."""
+        geometries = []
+        for airport in airports:
+            geometry = project_airport(airport, _WEB_MERCATOR_CRS)
+            geometry["runways"] = project_geometry(runway_polygons(airport.runways)["runway"], _WEB_MERCATOR_CRS)
+            geometries.append(geometry)
+
+        names = [name for name in TILE_STYLES if any(name in g for g in geometries)]
+        renderer = cls({name: RaggedGeometry.concatenate([g[name] for g in geometries if name in g]) for name in names})
+        # tiles are enumerated per airport: the bounds of far apart airports together span too many
+        renderer.extents = [b for b in map(_geometry_bounds, geometries) if b is not None]
+        return renderer
+
+    def bounds(self) -> Optional[tuple[float, float, float, float]]:
+        return _geometry_bounds(self.geometry)
+
+    def _parts_in(self, name: str, bbox) -> np.ndarray:
+        return np.sort(self._trees[name].query(bbox))
+
+    def has_features(self, z: int, x: int, y: int) -> bool:
+        bbox = self._padded_bounds(z, x, y)
+        return any(len(self._parts_in(name, bbox)) for name in self.geometry)
+
+    def _padded_bounds(self, z: int, x: int, y: int):
+        minx, miny, maxx, maxy = tile_bounds(z, x, y)
+        pad = (maxx - minx) / TILE_SIZE * (_POINT_RADIUS + 1)
+        return minx - pad, miny - pad, maxx + pad, maxy + pad
+
+    def render(self, z: int, x: int, y: int) -> Optional[np.ndarray]:
+        """(TILE_SIZE, TILE_SIZE, 4) uint8 RGBA tile, or None if nothing is drawn on it."""
+        minx, miny, maxx, maxy = tile_bounds(z, x, y)
+        resolution = (maxx - minx) / TILE_SIZE
+        bbox = self._padded_bounds(z, x, y)
+
+        def _to_pixels(coords):
+            return np.column_stack(((coords[:, 0] - minx) / resolution, (maxy - coords[:, 1]) / resolution))
+
+        image = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+        empty = True
+
+        for name, (color, kind) in TILE_STYLES.items():
+            g = self.geometry.get(name)
+            if g is None:
+                continue
+
+            parts = self._parts_in(name, bbox).tolist()
+            if not parts:
+                continue
+
+            if kind == "polygon":
+                part_feature = np.searchsorted(g.feature_offsets, parts, side="right") - 1
+                rings = [(_to_pixels(g.part(i)), f) for i, f in zip(parts, part_feature.tolist()) if len(g.part(i)) > 2]
+                if not rings:
+                    continue
+                mask = fill_polygons([r for r, _ in rings], [f for _, f in rings])
+            elif kind == "line":
+                mask = stroke_lines([_to_pixels(g.part(i)) for i in parts])
+            else:
+                mask = draw_points(_to_pixels(np.concatenate([g.part(i)[:1] for i in parts])))
+
+            if mask.any():
+                image[mask] = color
+                empty = False
+
+        return None if empty else image
+
+
+_worker_renderer: Optional[TileRenderer] = None
+
+
+def _init_worker(geometry: dict[str, RaggedGeometry], log_level: int) -> None:
+    global _worker_renderer
+    logger.setLevel(log_level)
+    _worker_renderer = TileRenderer(geometry)
+
+
+def _render_chunk(tiles: list[tuple[int, int, int]], output_dir: str) -> list[str]:
+    written = []
+    for z, x, y in tiles:
+        image = _worker_renderer.render(z, x, y)
+        if image is None:
+            continue
+
+        directory = os.path.join(output_dir, str(z), str(x))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{y}.png")
+        write_png(path, image)
+        written.append(path)
+
+    return written
+
+
+def render_tiles(
+    airport: Union[ParsedAirport, Iterable[ParsedAirport]],
+    output_dir: str,
+    zooms: Iterable[int],
+    workers: Optional[int] = None,
+    chunk_size: int = _DEFAULT_CHUNK_SIZE,
+    worker_log_level: int = logging.WARNING,
+) -> list[str]:
+    """Render an airport into `output_dir/{z}/{x}/{y}.png` XYZ tiles.
+
+    The airport is reprojected to EPSG:3857 once. Tiles with no feature in reach are
+    skipped before rendering, and tiles that render empty are not written. The
+    remaining tiles are rendered in chunks of `chunk_size` by a process pool.
+    Tiles are overwritten, so airports that share tiles must be rendered together.
+
+    Args:
+        airport (ParsedAirport): The airport to render, or a list of airports to
+            render into the same tiles.
+        output_dir (str): Root directory of the tile pyramid.
+        zooms (list[int]): Zoom levels to render.
+        workers (int): Number of worker processes. Default `os.cpu_count()`.
+        chunk_size (int): Number of tiles per task sent to a worker. Default 64.
+        worker_log_level (int): Log level inside workers. Default WARNING.
+
+    Returns:
+        list[str]: Paths of the tiles written.
+    """
+    airports = [airport] if isinstance(airport, ParsedAirport) else list(airport)
+    renderer = TileRenderer.from_airports(airports)
+    if not renderer.extents:
+        return []
+
+    tiles = [
+        tile
+        for tile in dict.fromkeys(
+            tile for z in zooms for bounds in renderer.extents for tile in tiles_for_bounds(bounds, z))
+        if renderer.has_features(*tile)
+    ]
+    logger.info(f"Rendering up to {len(tiles)} tiles for {', '.join(a.id for a in airports)}.")
+
+    t0 = time.perf_counter()
+    written = []
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(renderer.geometry, worker_log_level)
+    ) as executor:
+        futures = [
+            executor.submit(_render_chunk, tiles[i:i + chunk_size], output_dir)
+            for i in range(0, len(tiles), chunk_size)
+        ]
+        for future in as_completed(futures):
+            written.extend(future.result())
+
+    elapsed = time.perf_counter() - t0
+    logger.info(f"Wrote {len(written)} tiles in {elapsed:.1f} s ({len(written) / max(elapsed, 1e-9) * 60:.0f} tiles/min).")
+
+    return written
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    from index import AptIndex
+
+    parser = argparse.ArgumentParser(description="Render airports of an apt.dat file into XYZ PNG tiles.")
+    parser.add_argument("path", help="apt.dat file")
+    parser.add_argument("output_dir", help="root directory of the tile pyramid")
+    parser.add_argument("idents", nargs="+", help="airports to render")
+    parser.add_argument("--zoom", type=int, action="append", dest="zooms", help="zoom level (repeatable)")
+    parser.add_argument("--workers", type=int, default=None, help="default: number of CPUs")
+    parser.add_argument("--chunk-size", type=int, default=_DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    index = AptIndex.open(args.path)
+    # in one pass, so that tiles shared by several airports show all of them
+    render_tiles(
+        [index.parse(ident) for ident in args.idents],
+        args.output_dir,
+        args.zooms or [14, 15, 16, 17],
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+    )
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,366 @@
+from __future__ import annotations
+
+import bisect
+import mmap
+import time
+import warnings
+from typing import Optional
+
+import numpy as np
+
+from base import ParsedAirport, _DEFAULT_BEZIER_RESOLUTION
+from geometry import RowCode, _node_tuples
+from index import AptIndex
+
+
+# Node rows (111-116) as a typed table. Curve-less rows have NaN Bezier columns and
+# missing line types are -1.
+NODE_DTYPE = np.dtype(
+    [
+        ("row", np.int64),  # position of the node row in its RowTable
+        ("row_code", np.int16),
+        ("lat", np.float64),
+        ("lon", np.float64),
+        ("bezier_lat", np.float64),
+        ("bezier_lon", np.float64),
+        ("painted_line_type", np.int16),
+        ("lighting_line_type", np.int16),
+    ]
+)
+
+_NODE_CODES = (
+    RowCode.LINE_SEGMENT,
+    RowCode.LINE_CURVE,
+    RowCode.RING_SEGMENT,
+    RowCode.RING_CURVE,
+    RowCode.END_SEGMENT,
+    RowCode.END_CURVE,
+)
+_CURVE_CODES = (RowCode.LINE_CURVE, RowCode.RING_CURVE, RowCode.END_CURVE)
+
+_MAX_CODE_DIGITS = 5
+_MAX_ROW_CODE = np.iinfo(np.int32).max
+_CHUNK_BYTES = 1 << 22
+_CHUNK_ROWS = 1 << 16
+_NEWLINE = ord("\n")
+_CARRIAGE_RETURN = ord("\r")
+_ZERO = ord("0")
+
+
+class Row:
+    """A single apt.dat row backed by a byte range of a buffer.
+
+    Only the row code is decoded up front. `tokens` is split on demand and has the
+    same layout as `xplane_airports`' `AptDatLine.tokens`, so a `Row` can be used
+    anywhere an `AptDatLine` is.
+    """
+
+    __slots__ = ("row_code", "_buf", "_start", "_end")
+
+    def __init__(self, row_code: int, buf, start: int, end: int) -> None:
+        self.row_code = row_code
+        self._buf = buf
+        self._start = start
+        self._end = end
+
+    @property
+    def raw(self) -> str:
+        return self._buf[self._start:self._end].decode("utf-8").strip()
+
+    @property
+    def tokens(self) -> list:
+        tokens = self._buf[self._start:self._end].split()
+        return [self.row_code] + [t.decode("utf-8") for t in tokens[1:]]
+
+    def __repr__(self) -> str:
+        return self.raw
+
+
+class RowTable:
+    """Rows of an apt.dat byte range, stored as flat arrays of codes and offsets.
+
+    Row objects are only created when indexed, so the table costs a few bytes
+    per row regardless of row length. It supports `len()` and indexing and so can
+    be walked with a `BIterator`.
+    """
+
+    def __init__(self, buf, row_codes: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> None:
+        self._buf = buf
+        self.row_codes = row_codes
+        self.starts = starts
+        self.ends = ends
+        self._node_rows = None
+        self._node_row_numbers = None
+        self._node_run_ends = None
+        self._bad_nodes = None
+
+    @classmethod
+    def from_buffer(cls, buf, start: int = 0, end: Optional[int] = None) -> "RowTable":
+        """Split `buf[start:end]` into rows, skipping blank rows and the `99` file end.
+
+        The buffer is scanned `_CHUNK_BYTES` and decoded `_CHUNK_ROWS` at a time, so that
+        besides the table itself, about 20 bytes per row, only one chunk's scratch arrays
+        are alive at once.
+        """
+        if end is None:
+            end = len(buf)
+
+        empty = np.zeros(0, dtype=np.int64)
+        if end <= start:
+            return cls(buf, empty.astype(np.int32), empty, empty)
+
+        data = np.frombuffer(buf, dtype=np.uint8, count=end - start, offset=start)
+        n = len(data)
+
+        # first count the rows to allocate the table once, then fill it
+        chunks = range(0, n, _CHUNK_BYTES)
+        counts = [int(np.count_nonzero(data[i:i + _CHUNK_BYTES] == _NEWLINE)) for i in chunks]
+        n_rows = sum(counts) + 1
+
+        starts = np.empty(n_rows, dtype=np.int64)
+        ends = np.empty(n_rows, dtype=np.int64)
+        starts[0], ends[-1] = 0, n
+        row = 0
+        for i, count in zip(chunks, counts):
+            newlines = np.flatnonzero(data[i:i + _CHUNK_BYTES] == _NEWLINE) + i
+            ends[row:row + count] = newlines
+            newlines += 1
+            starts[row + 1:row + 1 + count] = newlines
+            row += count
+
+        row_codes = np.zeros(n_rows, dtype=np.int32)
+        kept = 0
+        columns = np.arange(_MAX_CODE_DIGITS + 1)
+        for r in range(0, n_rows, _CHUNK_ROWS):
+            chunk_starts = starts[r:r + _CHUNK_ROWS]
+            chunk_ends = ends[r:r + _CHUNK_ROWS]
+
+            # strip trailing carriage returns
+            has_cr = chunk_ends > chunk_starts
+            has_cr[has_cr] = data[chunk_ends[has_cr] - 1] == _CARRIAGE_RETURN
+            chunk_ends -= has_cr
+
+            # decode the leading row code of every row of the chunk at once
+            window = data[np.minimum(chunk_starts[:, None] + columns, n - 1)]
+            window[columns >= (chunk_ends - chunk_starts)[:, None]] = 0
+            digits = window - np.uint8(_ZERO)  # non-digits wrap around to values > 9
+            n_digits = np.argmax(digits > 9, axis=1)  # position of the first non-digit
+
+            codes = np.zeros(len(chunk_starts), dtype=np.int32)
+            for i in range(_MAX_CODE_DIGITS):
+                take = n_digits > i
+                codes[take] = codes[take] * 10 + digits[take, i]
+
+            keep = (n_digits > 0) & (codes != RowCode.FILE_END)
+
+            # rows that do not start with a digit: leading whitespace or garbage
+            for i in np.flatnonzero(n_digits == 0):
+                tokens = bytes(data[chunk_starts[i]:chunk_ends[i]]).split(None, 1)
+                if tokens and tokens[0].isdigit() and RowCode.FILE_END != int(tokens[0]) <= _MAX_ROW_CODE:
+                    codes[i] = int(tokens[0])
+                    keep[i] = True
+
+            # compact the kept rows in place: they never move past the chunk being read
+            n_kept = int(np.count_nonzero(keep))
+            row_codes[kept:kept + n_kept] = codes[keep]
+            starts[kept:kept + n_kept] = chunk_starts[keep]
+            ends[kept:kept + n_kept] = chunk_ends[keep]
+            kept += n_kept
+
+        starts += start
+        ends += start
+        return cls(buf, row_codes[:kept], starts[:kept], ends[:kept])
+
+    def __len__(self) -> int:
+        return len(self.row_codes)
+
+    def __getitem__(self, idx: int) -> Row:
+        return Row(int(self.row_codes[idx]), self._buf, int(self.starts[idx]), int(self.ends[idx]))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def nbytes(self) -> int:
+        return self.row_codes.nbytes + self.starts.nbytes + self.ends.nbytes
+
+    def nodes(self) -> np.ndarray:
+        """All node rows (111-116) as a `NODE_DTYPE` structured array.
+
+        The node rows are gathered `_CHUNK_ROWS` at a time into one whitespace separated
+        buffer whose numbers are all parsed by a single `np.fromstring` call. A chunk with
+        tokens that do not parse as numbers falls back to parsing its rows one by one, and
+        rows that still do not parse get NaN coordinates.
+        """
+        rows = np.flatnonzero(np.isin(self.row_codes, _NODE_CODES))
+        table = np.empty(len(rows), dtype=NODE_DTYPE)
+        table["row"] = rows
+        table["row_code"] = self.row_codes[rows]
+
+        data = np.frombuffer(self._buf, dtype=np.uint8)
+        for r in range(0, len(rows), _CHUNK_ROWS):
+            chunk = table[r:r + _CHUNK_ROWS]
+            starts = self.starts[chunk["row"]]
+            ends = self.ends[chunk["row"]]
+            is_curve = np.isin(chunk["row_code"], _CURVE_CODES)
+
+            values = _parse_node_numbers(data, starts, ends, is_curve)
+            if values is None:
+                values = _parse_node_numbers_slowly(self._buf, starts, ends, is_curve)
+
+            for name, column in zip(NODE_DTYPE.names[2:], values):
+                chunk[name] = column
+
+        return table
+
+    def node_run(self, row: int) -> Optional[list]:
+        """(row code, node) pairs of the consecutive node rows starting at `row`.
+
+        Nodes are the `_parse_node` tuples of `get_paths_lods`, built from the columns of
+        `nodes()` on the first call and kept, so that walking all the node chains of the
+        table parses every node row once.
+
+        Returns:
+            Optional[list]: The pairs, or None if one of the rows could not be parsed.
+        """
+        if self._node_rows is None:
+            table = self.nodes()
+            self._node_rows = _node_tuples(table)
+            self._node_row_numbers = table["row"].tolist()
+            breaks = np.flatnonzero(np.diff(table["row"]) != 1) + 1
+            run_ends = np.append(breaks, len(table))
+            self._node_run_ends = np.repeat(run_ends, np.diff(np.append(0, run_ends))).tolist()
+            self._bad_nodes = np.flatnonzero(np.isnan(table["lat"]) | np.isnan(table["lon"])).tolist()
+
+        k = bisect.bisect_left(self._node_row_numbers, row)
+        if k == len(self._node_row_numbers) or self._node_row_numbers[k] != row:
+            return []
+
+        end = self._node_run_ends[k]
+        bad = bisect.bisect_left(self._bad_nodes, k)
+        if bad < len(self._bad_nodes) and self._bad_nodes[bad] < end:
+            return None
+        return self._node_rows[k:end]
+
+
+def _parse_node_numbers(data: np.ndarray, starts: np.ndarray, ends: np.ndarray, is_curve: np.ndarray):
+    """lat, lon, bezier_lat, bezier_lon, painted and lighting line type columns of node rows.
+
+    Returns:
+        Optional[tuple]: The six columns, or None if a row has a token that is not a
+            number or is missing a coordinate.
+    """
+    # copy the rows one after the other, each followed by a space
+    lengths = ends - starts + 1
+    offsets = np.cumsum(lengths) - lengths
+    positions = np.arange(int(lengths.sum())) + np.repeat(starts - offsets, lengths)
+    text = data[np.minimum(positions, len(data) - 1)]
+    text[offsets + lengths - 1] = ord(" ")
+
+    # tokens per row, counting the row code
+    is_space = text <= ord(" ")
+    token_starts = np.flatnonzero(~is_space & np.insert(is_space[:-1], 0, True))
+    counts = np.bincount(np.searchsorted(offsets, token_starts, side="right") - 1, minlength=len(starts))
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            numbers = np.fromstring(text.tobytes(), sep=" ")
+        except (ValueError, DeprecationWarning):
+            return None
+
+    n_coordinates = np.where(is_curve, 4, 2)
+    if len(numbers) != len(token_starts) or np.any(counts < 1 + n_coordinates):
+        return None
+
+    # row code, lat, lon, [bezier_lat, bezier_lon], [painted, [lighting]]
+    first = np.cumsum(counts) - counts
+    last = len(numbers) - 1
+    lat = numbers[first + 1]
+    lon = numbers[first + 2]
+    bezier_lat = np.where(is_curve, numbers[np.minimum(first + 3, last)], np.nan)
+    bezier_lon = np.where(is_curve, numbers[np.minimum(first + 4, last)], np.nan)
+    painted = np.where(counts > 1 + n_coordinates, numbers[np.minimum(first + 1 + n_coordinates, last)], -1)
+    lighting = np.where(counts > 2 + n_coordinates, numbers[np.minimum(first + 2 + n_coordinates, last)], -1)
+    return lat, lon, bezier_lat, bezier_lon, painted, lighting
+
+
+def _parse_node_numbers_slowly(buf, starts: np.ndarray, ends: np.ndarray, is_curve: np.ndarray) -> tuple:
+    """`_parse_node_numbers` one row at a time. Rows that do not parse keep NaN coordinates."""
+    columns = np.full((6, len(starts)), np.nan)
+    columns[4:] = -1
+    for i, (start, end, curve) in enumerate(zip(starts.tolist(), ends.tolist(), is_curve.tolist())):
+        tokens = buf[start:end].split()[1:]
+        n_coordinates = 4 if curve else 2
+        try:
+            coordinates = [float(t) for t in tokens[:n_coordinates]]
+            line_types = [int(t) for t in tokens[n_coordinates:n_coordinates + 2]]
+        except ValueError:
+            continue
+
+        if len(coordinates) == n_coordinates:
+            columns[:n_coordinates, i] = coordinates
+            columns[4:4 + len(line_types), i] = line_types
+
+    return tuple(columns)
+
+
+class MappedAirport:
+    """A single airport backed by a memory-mapped apt.dat slice.
+
+    Exposes the same `text` attribute that `ParsedAirport` reads from an
+    `xplane_airports` airport.
+    """
+
+    def __init__(self, text: RowTable) -> None:
+        self.text = text
+
+    @property
+    def id(self) -> str:
+        return self.text[0].tokens[4]
+
+
+class MappedAptFile:
+    """Read-only memory map of an apt.dat file with per-airport access through `AptIndex`."""
+
+    def __init__(self, path: str, index: Optional[AptIndex] = None) -> None:
+        self.path = path
+        self.index = index if index is not None else AptIndex.open(path)
+
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self) -> None:
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> "MappedAptFile":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def rows(self, start: int = 0, end: Optional[int] = None) -> RowTable:
+        return RowTable.from_buffer(self._mmap, start, end)
+
+    def airport(self, ident: str) -> MappedAirport:
+        start, length = self.index.entries[ident]
+        return MappedAirport(self.rows(start, start + length))
+
+    def parse(
+        self,
+        ident: str,
+        bezier_resolution: int = _DEFAULT_BEZIER_RESOLUTION,
+        lazy: bool = False,
+        features: Optional[list[str]] = None,
+        triangulate: bool = False,
+    ) -> ParsedAirport:
+        t0 = time.perf_counter()
+        airport = self.airport(ident)
+        tokenize_seconds = time.perf_counter() - t0
+
+        parsed = ParsedAirport(
+            airport, bezier_resolution=bezier_resolution, lazy=lazy, features=features, triangulate=triangulate)
+        parsed.stats.add_time("tokenize", tokenize_seconds)
+        return parsed
@@ -0,0 +1,730 @@
+from __future__ import annotations
+
+import math
+from typing import Optional, Sequence
+
+import numpy as np
+
+from columnar import RaggedGeometry
+
+
+# Ear clipping of polygons with holes, after the earcut algorithm of Mapbox
+# (https://github.com/mapbox/earcut, ISC license). Polygons are kept as circular
+# doubly linked lists of vertices. Holes are first bridged into the outer ring, then
+# ears are cut one by one. Above `_HASH_THRESHOLD` vertices the candidates of an ear
+# are looked up along a z-order curve instead of walking the whole ring. Rings that
+# self-intersect are still triangulated, with a best effort on their tangled parts.
+#
+# This runs in plain Python, at some 20k vertices/s, which would dominate a run over
+# the global apt.dat. Triangulation is therefore never part of bulk conversion or export:
+# polygons are triangulated on demand by `Pavement.triangulate`, or at parse time only
+# when `ParsedAirport(triangulate=True)` asks for it.
+
+_HASH_THRESHOLD = 80
+
+# Rings tessellated from Bezier curves often cross or touch themselves in small loops
+# where curves meet. Ear clipping copes with those only by slow splitting, so loops spanning
+# at most `_KNOT_WINDOW` segments are split off first. Touching loops are triangulated on
+# their own, crossed ones are dropped over up to `_KNOT_PASSES` passes.
+_KNOT_WINDOW = 64
+_KNOT_PASSES = 3
+
+# A loop is taken to have no area below this fraction of the square of its extent: the
+# curls of back-and-forth Bezier tessellation come out around 1e-10 from rounding alone.
+_SLIVER_RATIO = 1e-6
+
+
+class _Node:
+    __slots__ = ("i", "x", "y", "prev", "next", "z", "prev_z", "next_z", "steiner")
+
+    def __init__(self, i: int, x: float, y: float) -> None:
+        self.i = i  # vertex index in the input
+        self.x = x
+        self.y = y
+        self.prev = None
+        self.next = None
+        self.z = 0  # z-order curve value
+        self.prev_z = None
+        self.next_z = None
+        self.steiner = False  # a hole of a single point
+
+
+def _insert_node(i: int, x: float, y: float, last: Optional[_Node]) -> _Node:
+    p = _Node(i, x, y)
+    if last is None:
+        p.prev = p
+        p.next = p
+    else:
+        p.next = last.next
+        p.prev = last
+        last.next.prev = p
+        last.next = p
+    return p
+
+
+def _remove_node(p: _Node) -> None:
+    p.next.prev = p.prev
+    p.prev.next = p.next
+    if p.prev_z is not None:
+        p.prev_z.next_z = p.next_z
+    if p.next_z is not None:
+        p.next_z.prev_z = p.prev_z
+
+
+def _area(p: _Node, q: _Node, r: _Node) -> float:
+    """Twice the signed area of the triangle pqr, negative when counterclockwise."""
+    return (q.y - p.y) * (r.x - q.x) - (q.x - p.x) * (r.y - q.y)
+
+
+def _equals(p: _Node, q: _Node) -> bool:
+    return p.x == q.x and p.y == q.y
+
+
+def _point_in_triangle(ax, ay, bx, by, cx, cy, px, py) -> bool:
+    return ((cx - px) * (ay - py) >= (ax - px) * (cy - py)
+            and (ax - px) * (by - py) >= (bx - px) * (ay - py)
+            and (bx - px) * (cy - py) >= (cx - px) * (by - py))
+
+
+def _sign(value: float) -> int:
+    return (value > 0) - (value < 0)
+
+
+def _on_segment(p: _Node, q: _Node, r: _Node) -> bool:
+    return min(p.x, r.x) <= q.x <= max(p.x, r.x) and min(p.y, r.y) <= q.y <= max(p.y, r.y)
+
+
+def _intersects(p1: _Node, q1: _Node, p2: _Node, q2: _Node) -> bool:
+    o1 = _sign(_area(p1, q1, p2))
+    o2 = _sign(_area(p1, q1, q2))
+    o3 = _sign(_area(p2, q2, p1))
+    o4 = _sign(_area(p2, q2, q1))
+
+    if o1 != o2 and o3 != o4:
+        return True
+    return ((o1 == 0 and _on_segment(p1, p2, q1))
+            or (o2 == 0 and _on_segment(p1, q2, q1))
+            or (o3 == 0 and _on_segment(p2, p1, q2))
+            or (o4 == 0 and _on_segment(p2, q1, q2)))
+
+
+def _intersects_polygon(a: _Node, b: _Node) -> bool:
+    p = a
+    while True:
+        if (p.i != a.i and p.next.i != a.i and p.i != b.i and p.next.i != b.i
+                and _intersects(p, p.next, a, b)):
+            return True
+        p = p.next
+        if p is a:
+            return False
+
+
+def _locally_inside(a: _Node, b: _Node) -> bool:
+    if _area(a.prev, a, a.next) < 0:
+        return _area(a, b, a.next) >= 0 and _area(a, a.prev, b) >= 0
+    return _area(a, b, a.prev) < 0 or _area(a, a.next, b) < 0
+
+
+def _middle_inside(a: _Node, b: _Node) -> bool:
+    p = a
+    inside = False
+    px, py = (a.x + b.x) / 2, (a.y + b.y) / 2
+    while True:
+        n = p.next
+        if (p.y > py) != (n.y > py) and n.y != p.y and px < (n.x - p.x) * (py - p.y) / (n.y - p.y) + p.x:
+            inside = not inside
+        p = n
+        if p is a:
+            return inside
+
+
+def _is_valid_diagonal(a: _Node, b: _Node) -> bool:
+    if a.next.i == b.i or a.prev.i == b.i:
+        return False
+    # the constant time tests first, the two walks around the ring last
+    if _locally_inside(a, b) and _locally_inside(b, a):
+        # does not create opposite-facing sectors
+        valid = bool(_area(a.prev, a, b.prev) or _area(a, b.prev, b)) and _middle_inside(a, b)
+    else:
+        valid = False
+    # special zero-length case
+    valid = valid or (_equals(a, b) and _area(a.prev, a, a.next) > 0 and _area(b.prev, b, b.next) > 0)
+    return valid and not _intersects_polygon(a, b)
+
+
+def _split_polygon(a: _Node, b: _Node) -> _Node:
+    """Link a and b with a bridge. Returns the copy of b on the other side of it."""
+    a2 = _Node(a.i, a.x, a.y)
+    b2 = _Node(b.i, b.x, b.y)
+    an = a.next
+    bp = b.prev
+
+    a.next = b
+    b.prev = a
+    a2.next = an
+    an.prev = a2
+    b2.next = a2
+    a2.prev = b2
+    bp.next = b2
+    b2.prev = bp
+    return b2
+
+
+def _filter_points(start: Optional[_Node], end: Optional[_Node] = None) -> Optional[_Node]:
+    """Remove repeated and collinear vertices."""
+    if start is None:
+        return start
+    if end is None:
+        end = start
+
+    p = start
+    while True:
+        again = False
+        if not p.steiner and (_equals(p, p.next) or _area(p.prev, p, p.next) == 0):
+            _remove_node(p)
+            p = end = p.prev
+            if p is p.next:
+                break
+            again = True
+        else:
+            p = p.next
+
+        if not again and p is end:
+            break
+
+    return end
+
+
+def _linked_list(coords: list, start: int, end: int, clockwise: bool) -> Optional[_Node]:
+    """Ring of vertices `start:end` of `coords`, turned to the requested orientation."""
+    area = 0.0
+    j = end - 1
+    for i in range(start, end):
+        area += (coords[j][0] - coords[i][0]) * (coords[i][1] + coords[j][1])
+        j = i
+
+    last = None
+    order = range(start, end) if clockwise == (area > 0) else range(end - 1, start - 1, -1)
+    for i in order:
+        last = _insert_node(i, coords[i][0], coords[i][1], last)
+
+    if last is not None and _equals(last, last.next):
+        _remove_node(last)
+        last = last.next
+    return last
+
+
+def _z_order(x: float, y: float, min_x: float, min_y: float, inv_size: float) -> int:
+    # interleave the bits of 15 bit cell coordinates
+    x = int((x - min_x) * inv_size)
+    y = int((y - min_y) * inv_size)
+
+    x = (x | (x << 8)) & 0x00FF00FF
+    x = (x | (x << 4)) & 0x0F0F0F0F
+    x = (x | (x << 2)) & 0x33333333
+    x = (x | (x << 1)) & 0x55555555
+
+    y = (y | (y << 8)) & 0x00FF00FF
+    y = (y | (y << 4)) & 0x0F0F0F0F
+    y = (y | (y << 2)) & 0x33333333
+    y = (y | (y << 1)) & 0x55555555
+
+    return x | (y << 1)
+
+
+def _sort_linked(head: _Node) -> _Node:
+    """Merge sort of the `next_z` list by z value."""
+    in_size = 1
+    while True:
+        p = head
+        head = None
+        tail = None
+        n_merges = 0
+
+        while p is not None:
+            n_merges += 1
+            q = p
+            p_size = 0
+            for _ in range(in_size):
+                p_size += 1
+                q = q.next_z
+                if q is None:
+                    break
+            q_size = in_size
+
+            while p_size > 0 or (q_size > 0 and q is not None):
+                if p_size != 0 and (q_size == 0 or q is None or p.z <= q.z):
+                    e = p
+                    p = p.next_z
+                    p_size -= 1
+                else:
+                    e = q
+                    q = q.next_z
+                    q_size -= 1
+
+                if tail is not None:
+                    tail.next_z = e
+                else:
+                    head = e
+                e.prev_z = tail
+                tail = e
+
+            p = q
+
+        tail.next_z = None
+        if n_merges <= 1:
+            return head
+        in_size *= 2
+
+
+def _index_curve(start: _Node, min_x: float, min_y: float, inv_size: float) -> None:
+    p = start
+    while True:
+        if p.z == 0:
+            p.z = _z_order(p.x, p.y, min_x, min_y, inv_size)
+        p.prev_z = p.prev
+        p.next_z = p.next
+        p = p.next
+        if p is start:
+            break
+
+    p.prev_z.next_z = None
+    p.prev_z = None
+    _sort_linked(p)
+
+
+def _is_ear(ear: _Node) -> bool:
+    a, b, c = ear.prev, ear, ear.next
+    if _area(a, b, c) >= 0:
+        return False  # reflex
+
+    ax, ay, bx, by, cx, cy = a.x, a.y, b.x, b.y, c.x, c.y
+    x0, y0, x1, y1 = min(ax, bx, cx), min(ay, by, cy), max(ax, bx, cx), max(ay, by, cy)
+
+    # no other vertex may lie inside the ear
+    p = c.next
+    while p is not a:
+        if (x0 <= p.x <= x1 and y0 <= p.y <= y1
+                and _point_in_triangle(ax, ay, bx, by, cx, cy, p.x, p.y)
+                and _area(p.prev, p, p.next) >= 0):
+            return False
+        p = p.next
+    return True
+
+
+def _is_ear_hashed(ear: _Node, min_x: float, min_y: float, inv_size: float) -> bool:
+    a, b, c = ear.prev, ear, ear.next
+    if _area(a, b, c) >= 0:
+        return False
+
+    ax, ay, bx, by, cx, cy = a.x, a.y, b.x, b.y, c.x, c.y
+    x0, y0, x1, y1 = min(ax, bx, cx), min(ay, by, cy), max(ax, bx, cx), max(ay, by, cy)
+    min_z = _z_order(x0, y0, min_x, min_y, inv_size)
+    max_z = _z_order(x1, y1, min_x, min_y, inv_size)
+
+    def inside(p):
+        return (p is not a and p is not c and x0 <= p.x <= x1 and y0 <= p.y <= y1
+                and _point_in_triangle(ax, ay, bx, by, cx, cy, p.x, p.y)
+                and _area(p.prev, p, p.next) >= 0)
+
+    # look for points inside the triangle in both directions of the z-order curve
+    p = ear.prev_z
+    n = ear.next_z
+    while p is not None and p.z >= min_z and n is not None and n.z <= max_z:
+        if inside(p):
+            return False
+        p = p.prev_z
+        if inside(n):
+            return False
+        n = n.next_z
+
+    while p is not None and p.z >= min_z:
+        if inside(p):
+            return False
+        p = p.prev_z
+
+    while n is not None and n.z <= max_z:
+        if inside(n):
+            return False
+        n = n.next_z
+
+    return True
+
+
+def _cure_local_intersections(start: _Node, triangles: list) -> Optional[_Node]:
+    p = start
+    while True:
+        a = p.prev
+        b = p.next.next
+        if (not _equals(a, b) and _intersects(a, p, p.next, b)
+                and _locally_inside(a, b) and _locally_inside(b, a)):
+            triangles.append((a.i, p.i, b.i))
+            _remove_node(p)
+            _remove_node(p.next)
+            p = start = b
+
+        p = p.next
+        if p is start:
+            break
+
+    return _filter_points(p)
+
+
+def _split_earcut(start: _Node, triangles: list, min_x: float, min_y: float, inv_size: float) -> None:
+    # split the polygon in two along a valid diagonal and triangulate both halves
+    a = start
+    while True:
+        b = a.next.next
+        while b is not a.prev:
+            if a.i != b.i and _is_valid_diagonal(a, b):
+                c = _split_polygon(a, b)
+                a = _filter_points(a, a.next)
+                c = _filter_points(c, c.next)
+                _earcut_linked(a, triangles, min_x, min_y, inv_size, 0)
+                _earcut_linked(c, triangles, min_x, min_y, inv_size, 0)
+                return
+            b = b.next
+
+        a = a.next
+        if a is start:
+            return
+
+
+def _earcut_linked(ear: Optional[_Node], triangles: list, min_x: float, min_y: float, inv_size: float,
+                   pass_: int) -> None:
+    if ear is None:
+        return
+
+    if pass_ == 0 and inv_size:
+        _index_curve(ear, min_x, min_y, inv_size)
+
+    stop = ear
+    while ear.prev is not ear.next:
+        prev = ear.prev
+        next_ = ear.next
+
+        if _is_ear_hashed(ear, min_x, min_y, inv_size) if inv_size else _is_ear(ear):
+            triangles.append((prev.i, ear.i, next_.i))
+            _remove_node(ear)
+            # skipping the next vertex leads to less sliver triangles
+            ear = next_.next
+            stop = next_.next
+            continue
+
+        ear = next_
+        if ear is stop:
+            # no ear left: remove degenerate vertices and retry, then untangle
+            # local self-intersections, then split the polygon in two
+            if pass_ == 0:
+                _earcut_linked(_filter_points(ear), triangles, min_x, min_y, inv_size, 1)
+            elif pass_ == 1:
+                ear = _cure_local_intersections(_filter_points(ear), triangles)
+                _earcut_linked(ear, triangles, min_x, min_y, inv_size, 2)
+            else:
+                _split_earcut(ear, triangles, min_x, min_y, inv_size)
+            break
+
+
+def _leftmost(start: _Node) -> _Node:
+    p = leftmost = start
+    while True:
+        if p.x < leftmost.x or (p.x == leftmost.x and p.y < leftmost.y):
+            leftmost = p
+        p = p.next
+        if p is start:
+            return leftmost
+
+
+def _sector_contains_sector(m: _Node, p: _Node) -> bool:
+    return _area(m.prev, m, p.prev) < 0 and _area(p.next, m, m.next) < 0
+
+
+def _find_hole_bridge(hole: _Node, outer: _Node) -> Optional[_Node]:
+    """Vertex of the outer ring that the leftmost vertex of `hole` can be linked to."""
+    p = outer
+    hx, hy = hole.x, hole.y
+    qx = -math.inf
+    m = None
+
+    # the segment left of the hole vertex closest to it, on a ray to the left
+    while True:
+        n = p.next
+        if n.y <= hy <= p.y and n.y != p.y:
+            x = p.x + (hy - p.y) * (n.x - p.x) / (n.y - p.y)
+            if hx >= x > qx:
+                qx = x
+                m = p if p.x < n.x else n
+                if x == hx:
+                    return m  # the hole touches the outer segment
+        p = n
+        if p is outer:
+            break
+
+    if m is None:
+        return None
+
+    # the ray hits the segment at a vertex visible from the hole, unless a reflex
+    # vertex lies in the triangle between the hole, the hit and m: take the one of
+    # smallest angle to the ray then
+    stop = m
+    mx, my = m.x, m.y
+    tan_min = math.inf
+
+    p = m
+    while True:
+        if (mx <= p.x <= hx and hx != p.x
+                and _point_in_triangle(hx if hy < my else qx, hy, mx, my, qx if hy < my else hx, hy, p.x, p.y)):
+            tan = abs(hy - p.y) / (hx - p.x)
+            if _locally_inside(p, hole) and (
+                    tan < tan_min
+                    or (tan == tan_min and (p.x > m.x or (p.x == m.x and _sector_contains_sector(m, p))))):
+                m = p
+                tan_min = tan
+        p = p.next
+        if p is stop:
+            return m
+
+
+def _eliminate_holes(coords: list, hole_starts: Sequence[int], outer: _Node) -> _Node:
+    holes = []
+    ends = list(hole_starts[1:]) + [len(coords)]
+    for start, end in zip(hole_starts, ends):
+        ring = _linked_list(coords, start, end, False)
+        if ring is None:
+            continue
+        if ring is ring.next:
+            ring.steiner = True
+        holes.append(_leftmost(ring))
+
+    # bridge the holes from left to right
+    holes.sort(key=lambda node: node.x)
+    for hole in holes:
+        bridge = _find_hole_bridge(hole, outer)
+        if bridge is None:
+            continue
+        bridge_reverse = _split_polygon(bridge, hole)
+        _filter_points(bridge_reverse, bridge_reverse.next)
+        outer = _filter_points(bridge, bridge.next)
+
+    return outer
+
+
+def earcut(coords, hole_starts: Sequence[int] = ()) -> np.ndarray:
+    """Triangulate a polygon with holes by ear clipping.
+
+    Args:
+        coords (np.ndarray): (N, 2) vertices of the outer ring followed by those of
+            every hole, without repeating the first vertex of a ring at its end.
+        hole_starts (list[int]): Index in `coords` of the first vertex of each hole.
+
+    Returns:
+        np.ndarray: (T, 3) int32 indices into `coords` of the vertices of each triangle.
+            Repeated and collinear vertices are not used.
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if len(coords) < 3:
+        return np.empty((0, 3), dtype=np.int32)
+
+    points = coords.tolist()
+    outer_end = hole_starts[0] if len(hole_starts) else len(points)
+    outer = _linked_list(points, 0, outer_end, True)
+    triangles = []
+    if outer is None or outer.next is outer.prev:
+        return np.empty((0, 3), dtype=np.int32)
+
+    if len(hole_starts):
+        outer = _eliminate_holes(points, hole_starts, outer)
+
+    min_x = min_y = inv_size = 0.0
+    if len(points) > _HASH_THRESHOLD:
+        # z-order of the vertices, over the bounding box of the outer ring
+        min_x, min_y = coords[:outer_end].min(axis=0).tolist()
+        max_x, max_y = coords[:outer_end].max(axis=0).tolist()
+        size = max(max_x - min_x, max_y - min_y)
+        inv_size = 32767 / size if size != 0 else 0.0
+
+    _earcut_linked(outer, triangles, min_x, min_y, inv_size, 0)
+    return np.array(triangles, dtype=np.int32).reshape(-1, 3)
+
+
+def _orientation(p: np.ndarray, q: np.ndarray, r: np.ndarray) -> np.ndarray:
+    return np.sign((q[:, 0] - p[:, 0]) * (r[:, 1] - p[:, 1]) - (q[:, 1] - p[:, 1]) * (r[:, 0] - p[:, 0]))
+
+
+def _loop_area(points: np.ndarray) -> float:
+    """Shoelace area of an open loop of points, positive when counterclockwise."""
+    x, y = (points - points[0]).T
+    return float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)) / 2
+
+
+def _is_sliver(points: np.ndarray, area: float) -> bool:
+    """Whether a loop has no area to speak of, next to its extent."""
+    extent = float((points.max(axis=0) - points.min(axis=0)).max()) if len(points) else 0.0
+    return abs(area) <= _SLIVER_RATIO * extent * extent
+
+
+def _split_pinches(ring: np.ndarray) -> tuple[np.ndarray, list]:
+    """Cut the loops between two visits of the same point out of an open ring.
+
+    Only loops of at most `_KNOT_WINDOW` segments are cut, innermost first.
+
+    Returns:
+        tuple: the indices of the vertices left in the ring, and the indices of the
+            vertices of each loop cut out, as open rings of their own.
+    """
+    points = list(map(tuple, ring.tolist()))
+    stack: list = []
+    position: dict = {}
+    loops = []
+    for i, point in enumerate(points):
+        p = position.get(point)
+        if p is not None and len(stack) - p <= _KNOT_WINDOW:
+            # back at stack[p]: that visit stays in the ring, the rest becomes a loop
+            loops.append(np.array(stack[p:], dtype=np.int64))
+            for k in range(p + 1, len(stack)):
+                if position.get(points[stack[k]]) == k:
+                    del position[points[stack[k]]]
+            del stack[p + 1:]
+            continue
+        position[point] = len(stack)
+        stack.append(i)
+
+    return np.array(stack, dtype=np.int64), loops
+
+
+def _untangle(ring: np.ndarray) -> np.ndarray:
+    """Indices of the vertices of an open ring left once its small crossed loops are cut out.
+
+    A crossed loop is the run of vertices between two segments that properly cross, at
+    most `_KNOT_WINDOW` segments apart. Bezier curves with crossed control points draw
+    such curls. Their vertices are dropped so that the ring goes straight past the knot.
+    """
+    keep = np.arange(len(ring))
+    for _ in range(_KNOT_PASSES):
+        n = len(keep)
+        if n < 5:
+            break
+
+        a = ring[keep]
+        b = np.roll(a, -1, axis=0)  # segment k runs from a[k] to b[k]
+        k = np.arange(n)
+        drop = np.zeros(n, dtype=bool)
+
+        for d in range(2, min(_KNOT_WINDOW, (n - 1) // 2) + 1):
+            m = (k + d) % n
+            crossing = (
+                (_orientation(a, b, a[m]) * _orientation(a, b, b[m]) < 0)
+                & (_orientation(a[m], b[m], a) * _orientation(a[m], b[m], b) < 0)
+            )
+            drop[(np.flatnonzero(crossing)[:, None] + np.arange(1, d + 1)) % n] = True
+
+        if not drop.any():
+            break
+        keep = keep[~drop]
+
+    return keep
+
+
+def _earcut_rings(points: np.ndarray, rings: list) -> np.ndarray:
+    """Ear clipping of a polygon given as index arrays into `points`, the outer ring first."""
+    indices = np.concatenate(rings)
+    # relative to the first point, as ear tests subtract nearby coordinates
+    coords = points[indices] - points[indices[0]]
+    return indices[earcut(coords, np.cumsum([len(ring) for ring in rings])[:-1].tolist())]
+
+
+def triangulate_rings(rings: Sequence) -> np.ndarray:
+    """Triangulate a polygon given as closed rings, the outer one first.
+
+    A ring that comes back to one of its points within a few segments is split there.
+    The loop cut out is triangulated as a polygon of its own when it winds like the
+    ring, as a hole when it winds the other way, and dropped when it is a sliver with
+    no area to speak of, so that the triangles cover the shoelace area of the rings.
+    Small loops between crossing segments are dropped.
+
+    Args:
+        rings (list): (lon, lat) rings as stored in `Pavement.coordinates` and
+            `Boundary.coordinates`, each ending on its first point.
+
+    Returns:
+        np.ndarray: (T, 3) int32 indices of the vertices of each triangle, counting
+            the points of all rings one after the other, closing points included. They
+            index the polygon's coordinates in a `RaggedGeometry` directly.
+    """
+    rings = [np.asarray(ring, dtype=np.float64).reshape(-1, 2) for ring in rings]
+    open_rings = [ring[:-1] if len(ring) > 1 and (ring[0] == ring[-1]).all() else ring for ring in rings]
+    open_lengths = np.array([len(ring) for ring in open_rings], dtype=np.int64)
+    lengths = np.array([len(ring) for ring in rings], dtype=np.int64)
+    if len(open_rings) == 0 or open_lengths[0] < 3:
+        return np.empty((0, 3), dtype=np.int32)
+
+    points = np.concatenate(open_rings)
+    open_starts = np.concatenate(([0], np.cumsum(open_lengths)[:-1]))
+    outer = None
+    holes = []
+    lobes = []  # outer rings of further polygons, split off pinched rings
+    for number, (ring, start) in enumerate(zip(open_rings, open_starts.tolist())):
+        if len(ring) < 3:
+            continue
+
+        kept, loops = _split_pinches(ring)
+        pieces = [kept[_untangle(ring[kept])]] + loops
+        areas = [_loop_area(ring[piece]) if len(piece) >= 3 else 0.0 for piece in pieces]
+        winding = np.sign(sum(areas))
+        for piece, area in zip(pieces, areas):
+            if piece is not pieces[0] and _is_sliver(ring[piece], area):
+                continue
+            # a piece winding like the whole ring adds area to an outer ring,
+            # or removes it from a hole
+            if (np.sign(area) == winding) != (number == 0):
+                holes.append(start + piece)
+            elif number == 0 and (outer is None or abs(area) > outer[1]):
+                if outer is not None:
+                    lobes.append(outer[0])
+                outer = (start + piece, abs(area))
+            else:
+                lobes.append(start + piece)
+
+        if outer is None:
+            return np.empty((0, 3), dtype=np.int32)
+
+    parts = [_earcut_rings(points, [outer[0]] + holes)]
+    parts += [_earcut_rings(points, [lobe]) for lobe in lobes]
+    triangles = np.concatenate(parts)
+
+    # back to indices counting the closing points: shift by the ring number
+    ring_of = np.searchsorted(open_starts, triangles, side="right") - 1
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    return (triangles - open_starts[ring_of] + starts[ring_of]).astype(np.int32)
+
+
+def triangulate_geometry(geometry: RaggedGeometry, triangles: Optional[Sequence] = None
+                         ) -> tuple[np.ndarray, np.ndarray]:
+    """Triangles of every polygon of a feature class, as one index buffer.
+
+    Args:
+        geometry (RaggedGeometry): Polygons, one feature per polygon, its outer ring first.
+        triangles (list[np.ndarray]): Triangles already computed for each feature by
+            `triangulate_rings`, such as those cached by `Pavement.triangulate`. Default
+            None, triangulate every feature.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (T, 3) indices into `geometry.coords`, and
+            (F + 1,) offsets: feature `j` owns triangles `offsets[j]:offsets[j + 1]`.
+    """
+    parts = []
+    counts = np.zeros(len(geometry), dtype=np.int64)
+    for j in range(len(geometry)):
+        local = triangles[j] if triangles is not None else triangulate_rings(geometry.feature(j))
+        first = geometry.part_offsets[geometry.feature_offsets[j]]
+        parts.append(local.astype(np.int64) + first)
+        counts[j] = len(local)
+
+    indices = np.concatenate(parts) if parts else np.empty((0, 3), dtype=np.int64)
+    return indices.reshape(-1, 3), np.concatenate(([0], np.cumsum(counts)))
+
+
+def triangle_areas(coords: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+    """Unsigned area of each triangle, in the squared units of `coords`."""
+    a, b, c = coords[triangles[:, 0]], coords[triangles[:, 1]], coords[triangles[:, 2]]
+    return np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1])) / 2
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import logging
+import math
+import time
+from typing import Iterable, Optional
+
+import numpy as np
+
+from base import ParsedAirport, VALID_FEATURES, _BASE_CRS
+from columnar import RaggedGeometry
+from projection import get_transformer, project_airport, project_geometry
+
+
+logger = logging.getLogger("xplane_apt_convert")
+
+_VIEW_CRS = "EPSG:3857"
+_REDRAW_DELAY_MS = 30
+_LOD_PIXEL_TOLERANCE = 0.5  # maximum on-screen deviation of a tessellation, in pixels
+_ZOOM_STEP = 1.2
+_POINT_RADIUS = 2
+
+FEATURE_STYLES = {
+    # feature class: (color, how to draw it), in drawing order
+    "boundary": ("grey", "polygon"),
+    "pavements": ("blue", "polygon"),
+    "runways": ("black", "runway"),
+    "linear_features": ("orange", "line"),
+    "startup_locations": ("green", "point"),
+    "windsocks": ("red", "point"),
+    "signs": ("purple", "point"),
+}
+
+
+class AirportVisualizer:
+    def __init__(self, canvas_width=1024, canvas_height=768):
+        """Interactive Tk viewer of a `ParsedAirport`.
+
+        Only the features inside the viewport are drawn, looked up through the
+        airport's spatial index. When the airport was parsed with `lod_tolerances`,
+        the coarsest level of detail that stays within half a pixel is used. Zooming
+        and panning re-render the view, debounced, instead of transforming every
+        canvas item.
+        """
+        import tkinter as tk
+
+        self.root = tk.Tk()
+        self.root.title("Airport Visualization")
+
+        self.canvas = tk.Canvas(
+            self.root, width=canvas_width, height=canvas_height)
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+
+        self.airport = None
+        self.features = list(FEATURE_STYLES)
+        self.geometry = {}
+        self.lods = {}
+
+        self.center = (0.0, 0.0)  # view centre in EPSG:3857
+        self.scale = 1.0  # pixels per EPSG:3857 unit
+        self._mercator_factor = 1.0  # EPSG:3857 units per ground metre
+        self._redraw_job = None
+        self._drag_from = None
+
+        self.canvas.bind("<MouseWheel>", lambda e: self._zoom(e.x, e.y, _ZOOM_STEP ** (e.delta / 120)))
+        self.canvas.bind("<Button-4>", lambda e: self._zoom(e.x, e.y, _ZOOM_STEP))
+        self.canvas.bind("<Button-5>", lambda e: self._zoom(e.x, e.y, 1 / _ZOOM_STEP))
+        self.canvas.bind("<ButtonPress-1>", self._start_drag)
+        self.canvas.bind("<B1-Motion>", self._drag)
+        self.canvas.bind("<Configure>", lambda e: self.schedule_render())
+
+    def _size(self):
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        if width <= 1 or height <= 1:  # not mapped yet
+            width, height = int(self.canvas["width"]), int(self.canvas["height"])
+        return width, height
+
+    def draw_taxiways(self, airport):
+        self.draw_airport(airport, features=["pavements"])
+
+    def draw_airport(self, airport: ParsedAirport, features: Optional[Iterable[str]] = None):
+        self.airport = airport
+        self.features = [name for name in FEATURE_STYLES if features is None or name in features]
+
+        self.geometry = project_airport(airport, _VIEW_CRS, features=VALID_FEATURES)
+        self.lods = {
+            tolerance: {
+                name: project_geometry(geometry, _VIEW_CRS)
+                for name, geometry in airport.lod_geometry(tolerance).items()
+            }
+            for tolerance in airport.lod_tolerances
+        }
+
+        coords = np.concatenate([g.coords for g in self.geometry.values()])
+        if len(coords) == 0:
+            return
+
+        (minx, miny), (maxx, maxy) = coords.min(axis=0), coords.max(axis=0)
+        width, height = self._size()
+        self.center = ((minx + maxx) / 2, (miny + maxy) / 2)
+        self.scale = 0.95 * min(width / max(maxx - minx, 1.0), height / max(maxy - miny, 1.0))
+
+        lat = get_transformer(_VIEW_CRS, _BASE_CRS).transform(*self.center)[1]
+        self._mercator_factor = 1 / math.cos(math.radians(lat))
+
+        self.render()
+
+    def _viewport(self):
+        width, height = self._size()
+        cx, cy = self.center
+        half_w, half_h = width / 2 / self.scale, height / 2 / self.scale
+        return cx - half_w, cy - half_h, cx + half_w, cy + half_h
+
+    def _to_screen(self, coords: np.ndarray) -> list[float]:
+        width, height = self._size()
+        screen = np.empty_like(coords)
+        screen[:, 0] = (coords[:, 0] - self.center[0]) * self.scale + width / 2
+        screen[:, 1] = (self.center[1] - coords[:, 1]) * self.scale + height / 2
+        return screen.ravel().tolist()
+
+    def _pick_lod(self):
+        # allowed deviation in ground metres for the current zoom
+        allowed = _LOD_PIXEL_TOLERANCE / (self.scale * self._mercator_factor)
+        usable = [tolerance for tolerance in self.lods if tolerance <= allowed]
+        if not usable:
+            return None, {}
+        tolerance = max(usable)
+        return tolerance, self.lods[tolerance]
+
+    def render(self):
+        self._redraw_job = None
+        if self.airport is None:
+            return
+
+        t0 = time.perf_counter()
+        self.canvas.delete("all")
+
+        minx, miny, maxx, maxy = self._viewport()
+        min_lon, min_lat = get_transformer(_VIEW_CRS, _BASE_CRS).transform(minx, miny)
+        max_lon, max_lat = get_transformer(_VIEW_CRS, _BASE_CRS).transform(maxx, maxy)
+        visible = self.airport.spatial_index.query_indices(
+            (min_lon, min_lat, max_lon, max_lat),
+            [name for name in self.features if name != "boundary"],
+        )
+
+        tolerance, lod = self._pick_lod()
+        n_items = 0
+
+        for name in self.features:
+            color, kind = FEATURE_STYLES[name]
+            geometry = lod.get(name, self.geometry[name])
+            indices = range(len(geometry)) if name == "boundary" else visible[name].tolist()
+            objects = getattr(self.airport, name) if kind == "runway" else None
+
+            for j in indices:
+                for i in geometry.feature_parts(j):
+                    n_items += self._draw_part(geometry, i, kind, color, objects[j] if objects else None)
+
+        logger.info(
+            f"Rendered {n_items} items in {(time.perf_counter() - t0) * 1e3:.1f} ms "
+            f"(LOD {'full' if tolerance is None else f'{tolerance} m'}).")
+
+    def _draw_part(self, geometry: RaggedGeometry, i: int, kind: str, color: str, feature) -> int:
+        path = geometry.part(i)
+
+        if kind == "polygon" and len(path) > 2:
+            self.canvas.create_polygon(self._to_screen(path), fill="", outline=color)
+        elif kind == "line" and len(path) > 1:
+            self.canvas.create_line(self._to_screen(path), fill=color)
+        elif kind == "runway" and len(path) > 1:
+            width = max(feature.width * self._mercator_factor * self.scale, 1)
+            self.canvas.create_line(self._to_screen(path), fill=color, width=width)
+        elif kind == "point" and len(path) > 0:
+            x, y = self._to_screen(path[:1])
+            r = _POINT_RADIUS
+            self.canvas.create_oval(x - r, y - r, x + r, y + r, outline=color)
+        else:
+            return 0
+
+        return 1
+
+    def schedule_render(self):
+        if self._redraw_job is not None:
+            self.root.after_cancel(self._redraw_job)
+        self._redraw_job = self.root.after(_REDRAW_DELAY_MS, self.render)
+
+    def _zoom(self, x, y, factor):
+        width, height = self._size()
+        # keep the point under the cursor fixed
+        wx = self.center[0] + (x - width / 2) / self.scale
+        wy = self.center[1] - (y - height / 2) / self.scale
+        self.scale *= factor
+        self.center = (wx - (x - width / 2) / self.scale, wy + (y - height / 2) / self.scale)
+        self.schedule_render()
+
+    def _start_drag(self, event):
+        self._drag_from = (event.x, event.y)
+
+    def _drag(self, event):
+        dx, dy = event.x - self._drag_from[0], event.y - self._drag_from[1]
+        self._drag_from = (event.x, event.y)
+
+        # only the culled items are on the canvas, so moving them is cheap feedback
+        self.canvas.move("all", dx, dy)
+        self.center = (self.center[0] - dx / self.scale, self.center[1] + dy / self.scale)
+        self.schedule_render()
+
+    def show(self):
+        self.root.mainloop()